@@ -0,0 +1,25 @@
+"""Element node geohash index
+
+Revision ID: 5c2e9b7a1d43
+Revises: 7346197d7b38
+Create Date: 2024-10-21 10:15:03.418562+00:00
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e9b7a1d43'
+down_revision: str | None = '7346197d7b38'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_index('element_node_geohash_idx', 'element', [sa.text('ST_GeoHash(point, 12)'), 'id'], unique=False, postgresql_where=sa.text("type = 'node' AND visible = true AND next_sequence_id IS NULL"))
+
+
+def downgrade() -> None:
+    op.drop_index('element_node_geohash_idx', table_name='element', postgresql_where=sa.text("type = 'node' AND visible = true AND next_sequence_id IS NULL"))
@@ -0,0 +1,27 @@
+"""Trace pending
+
+Revision ID: 8d1f4c2a6b37
+Revises: 5c2e9b7a1d43
+Create Date: 2024-10-28 09:30:12.734215+00:00
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '8d1f4c2a6b37'
+down_revision: str | None = '5c2e9b7a1d43'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column('trace', sa.Column('pending', sa.Boolean(), server_default='false', nullable=False))
+    op.create_index('trace_pending_idx', 'trace', ['id'], unique=False, postgresql_where=sa.text('pending = true'))
+
+
+def downgrade() -> None:
+    op.drop_index('trace_pending_idx', table_name='trace', postgresql_where=sa.text('pending = true'))
+    op.drop_column('trace', 'pending')
@@ -0,0 +1,38 @@
+"""Trace preview
+
+Revision ID: b3e7a9c1f205
+Revises: 8d1f4c2a6b37
+Create Date: 2024-10-30 11:20:41.183502+00:00
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+import app.models.geometry
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e7a9c1f205'
+down_revision: str | None = '8d1f4c2a6b37'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column('trace', sa.Column('preview', sa.LargeBinary(), nullable=True))
+    op.add_column('trace', sa.Column('start_point', app.models.geometry.PointType(), nullable=True))
+    # previews are backfilled by scripts/trace_preview_backfill.py
+    op.execute(
+        'UPDATE trace SET start_point = ('
+        'SELECT ST_GeometryN(points, 1) FROM trace_segment '
+        'WHERE trace_id = trace.id '
+        'ORDER BY track_num, segment_num '
+        'LIMIT 1'
+        ')'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('trace', 'start_point')
+    op.drop_column('trace', 'preview')
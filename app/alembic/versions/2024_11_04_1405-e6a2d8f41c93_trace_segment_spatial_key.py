@@ -0,0 +1,28 @@
+"""Trace segment spatial key
+
+Revision ID: e6a2d8f41c93
+Revises: b3e7a9c1f205
+Create Date: 2024-11-04 14:05:27.601938+00:00
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a2d8f41c93'
+down_revision: str | None = 'b3e7a9c1f205'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # existing rows are keyed and clustered by scripts/trace_segment_cluster.py
+    op.add_column('trace_segment', sa.Column('spatial_key', sa.BigInteger(), nullable=True))
+    op.create_index('trace_segment_spatial_key_idx', 'trace_segment', ['spatial_key'], unique=False, postgresql_using='brin')
+
+
+def downgrade() -> None:
+    op.drop_index('trace_segment_spatial_key_idx', table_name='trace_segment', postgresql_using='brin')
+    op.drop_column('trace_segment', 'spatial_key')
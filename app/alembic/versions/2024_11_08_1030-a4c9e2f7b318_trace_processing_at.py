@@ -0,0 +1,26 @@
+"""Trace processing_at
+
+Revision ID: a4c9e2f7b318
+Revises: e6a2d8f41c93
+Create Date: 2024-11-08 10:30:44.193027+00:00
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e2f7b318'
+down_revision: str | None = 'e6a2d8f41c93'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column('trace', sa.Column('processing_at', postgresql.TIMESTAMP(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('trace', 'processing_at')
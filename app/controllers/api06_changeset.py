@@ -20,10 +20,10 @@ from app.models.db.user import User
 from app.models.scope import Scope
 from app.queries.changeset_comment_query import ChangesetCommentQuery
 from app.queries.changeset_query import ChangesetQuery
-from app.queries.element_query import ElementQuery
 from app.queries.user_query import UserQuery
 from app.responses.osm_response import DiffResultResponse, OSMChangeResponse
 from app.services.changeset_service import ChangesetService
+from app.services.changeset_summary_service import ChangesetSummaryService
 from app.services.optimistic_diff import OptimisticDiff
 
 router = APIRouter(prefix='/api/0.6')
@@ -77,9 +77,7 @@ async def download_changeset(
     if changeset is None:
         raise_for().changeset_not_found(changeset_id)
 
-    elements = await ElementQuery.get_by_changeset(changeset_id, sort_by='sequence_id')
-    await UserQuery.resolve_elements_users(elements, display_name=True)
-    return Format06.encode_osmchange(elements)
+    return await ChangesetSummaryService.get_osmchange(changeset)
 
 
 @router.put('/changeset/{changeset_id:int}')
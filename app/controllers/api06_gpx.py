@@ -1,27 +1,39 @@
+import time
 from asyncio import TaskGroup
 from collections.abc import Sequence
 from itertools import chain
 from typing import Annotated
 
+import cython
 from fastapi import APIRouter, File, Form, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
 from pydantic import NonNegativeInt, PositiveInt
+from shapely import MultiPolygon, Polygon
 from sqlalchemy.orm import joinedload
 
+from app.db import valkey
 from app.format import Format06
 from app.format.gpx import FormatGPX
 from app.lib.auth_context import api_user
+from app.lib.cursor_utils import CursorUtils
 from app.lib.exceptions_context import raise_for
 from app.lib.geo_utils import parse_bbox
 from app.lib.options_context import options_context
 from app.lib.xml_body import xml_body
-from app.limits import TRACE_POINT_QUERY_AREA_MAX_SIZE, TRACE_POINT_QUERY_DEFAULT_LIMIT
+from app.limits import (
+    TRACE_POINT_QUERY_AREA_MAX_SIZE,
+    TRACE_POINT_QUERY_CURSOR_EXPIRE,
+    TRACE_POINT_QUERY_DEFAULT_LIMIT,
+    TRACE_POINT_QUERY_LEGACY_MAX_SKIP,
+)
 from app.models.db.trace_ import Trace, TraceVisibility
 from app.models.db.trace_segment import TraceSegment
 from app.models.db.user import User
+from app.models.messages_pb2 import Cursor
 from app.models.scope import Scope
 from app.models.types import Str255
 from app.queries.trace_query import TraceQuery
-from app.queries.trace_segment_query import TraceSegmentQuery
+from app.queries.trace_segment_query import TraceSegmentKey, TraceSegmentQuery
 from app.responses.osm_response import GPXResponse
 from app.services.trace_service import TraceService
 
@@ -55,7 +67,6 @@ async def get_trace(
 ):
     with options_context(joinedload(Trace.user).load_only(User.display_name)):
         trace = await TraceQuery.get_one_by_id(trace_id)
-    await TraceSegmentQuery.resolve_coords((trace,), limit_per_trace=1, resolution=None)
     return Format06.encode_gpx_file(trace)
 
 
@@ -66,7 +77,6 @@ async def get_current_user_traces(
 ):
     with options_context(joinedload(Trace.user).load_only(User.display_name)):
         traces = await TraceQuery.find_many_by_user_id(user.id, limit=None)
-    await TraceSegmentQuery.resolve_coords(traces, limit_per_trace=1, resolution=None)
     return Format06.encode_gpx_files(traces)
 
 
@@ -92,8 +102,8 @@ async def get_trace_gpx(
 async def download_trace(
     trace_id: PositiveInt,
 ):
-    content = await TraceQuery.get_one_data_by_id(trace_id)
-    return Response(
+    content = await TraceQuery.get_one_data_stream_by_id(trace_id)
+    return StreamingResponse(
         content=content,
         # intentionally not using trace.name here, it's unsafe and difficult to make right, removing in API 0.7
         headers={'Content-Disposition': f'attachment; filename="{trace_id}"'},
@@ -135,32 +145,94 @@ async def delete_trace(
 async def trackpoints(
     bbox: Annotated[str, Query()],
     page_number: Annotated[NonNegativeInt, Query(alias='pageNumber')] = 0,
+    cursor: Annotated[str | None, Query()] = None,
 ):
     geometry = parse_bbox(bbox)
     if geometry.area > TRACE_POINT_QUERY_AREA_MAX_SIZE:
         raise_for().trace_points_query_area_too_big()
 
+    # legacy page numbers resume from the cursor cached by the previous page
+    if cursor is None and page_number:
+        cursor = await _get_cached_cursor(geometry, page_number)
+
+    legacy_offset: int | None
+    public_after: TraceSegmentKey | None
+    private_after: TraceSegmentKey | None
+    if cursor is not None:
+        page_cursor = CursorUtils.from_str(cursor, expire=TRACE_POINT_QUERY_CURSOR_EXPIRE)
+        keyset = page_cursor.keyset
+        if len(keyset) != 6:
+            raise_for().bad_cursor()
+        page_number = page_cursor.id
+        legacy_offset = None
+        public_after = (keyset[0], keyset[1], keyset[2])
+        private_after = (keyset[3], keyset[4], keyset[5])
+    else:
+        legacy_offset = page_number * TRACE_POINT_QUERY_DEFAULT_LIMIT
+        if legacy_offset > TRACE_POINT_QUERY_LEGACY_MAX_SKIP:
+            raise_for().trace_points_query_page_too_deep()
+        public_after = None
+        private_after = None
+
     async def public_task():
+        # exhausted by the previous pages
+        if public_after is not None and not public_after[0]:
+            return (), None
         with options_context(joinedload(TraceSegment.trace).load_only(Trace.name, Trace.description, Trace.visibility)):
             return await TraceSegmentQuery.find_many_by_geometry(
                 geometry,
                 identifiable_trackable=True,
                 limit=TRACE_POINT_QUERY_DEFAULT_LIMIT,
-                legacy_offset=page_number * TRACE_POINT_QUERY_DEFAULT_LIMIT,
+                legacy_offset=legacy_offset,
+                after=public_after,
             )
 
     async def private_task():
+        if private_after is not None and not private_after[0]:
+            return (), None
         return await TraceSegmentQuery.find_many_by_geometry(
             geometry,
             identifiable_trackable=False,
             limit=TRACE_POINT_QUERY_DEFAULT_LIMIT,
-            legacy_offset=page_number * TRACE_POINT_QUERY_DEFAULT_LIMIT,
+            legacy_offset=legacy_offset,
+            after=private_after,
         )
 
     async with TaskGroup() as tg:
         public_t = tg.create_task(public_task())
         private_t = tg.create_task(private_task())
 
-    public_segments = public_t.result()
-    private_segments = private_t.result()
-    return FormatGPX.encode_track(chain(public_segments, private_segments))
+    public_segments, public_next = public_t.result()
+    private_segments, private_next = private_t.result()
+    response = GPXResponse.serialize(FormatGPX.encode_track(chain(public_segments, private_segments)))
+
+    if public_next is not None or private_next is not None:
+        next_page_number = page_number + 1
+        next_cursor = CursorUtils.to_str(
+            Cursor(
+                id=next_page_number,
+                timestamp=int(time.time()),
+                keyset=(*(public_next or (0, 0, 0)), *(private_next or (0, 0, 0))),
+            )
+        )
+        await _set_cached_cursor(geometry, next_page_number, next_cursor)
+        response.headers['X-Cursor'] = next_cursor
+
+    return response
+
+
+@cython.cfunc
+def _get_cursor_cache_key(geometry: Polygon | MultiPolygon, page_number: int) -> str:
+    bounds = ','.join(map(str, geometry.bounds))
+    return f'TracePointsCursor:{bounds}:{page_number}'
+
+
+async def _get_cached_cursor(geometry: Polygon | MultiPolygon, page_number: int) -> str | None:
+    async with valkey() as conn:
+        value: bytes | None = await conn.get(_get_cursor_cache_key(geometry, page_number))
+    return value.decode() if (value is not None) else None
+
+
+async def _set_cached_cursor(geometry: Polygon | MultiPolygon, page_number: int, cursor: str) -> None:
+    async with valkey() as conn:
+        await conn.set(_get_cursor_cache_key(geometry, page_number), cursor, ex=TRACE_POINT_QUERY_CURSOR_EXPIRE)
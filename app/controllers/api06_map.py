@@ -1,4 +1,4 @@
-from asyncio import TaskGroup
+from collections.abc import AsyncIterator, Sequence
 from typing import Annotated
 
 from fastapi import APIRouter, Query
@@ -8,9 +8,10 @@ from app.lib.exceptions_context import raise_for
 from app.lib.geo_utils import parse_bbox
 from app.lib.xmltodict import get_xattr
 from app.limits import MAP_QUERY_AREA_MAX_SIZE, MAP_QUERY_LEGACY_NODES_LIMIT
-from app.queries.element_member_query import ElementMemberQuery
+from app.models.db.element import Element
 from app.queries.element_query import ElementQuery
 from app.queries.user_query import UserQuery
+from app.responses.osm_response import OSMResponse
 
 router = APIRouter(prefix='/api/0.6')
 
@@ -23,24 +24,39 @@ async def get_map(bbox: Annotated[str, Query()]):
     if geometry.area > MAP_QUERY_AREA_MAX_SIZE:
         raise_for().map_query_area_too_big()
 
-    elements = await ElementQuery.find_many_by_geom(
+    elements_iter = ElementQuery.stream_many_by_geom(
         geometry,
         nodes_limit=MAP_QUERY_LEGACY_NODES_LIMIT,
         legacy_nodes_limit=True,
     )
 
-    async with TaskGroup() as tg:
-        tg.create_task(UserQuery.resolve_elements_users(elements, display_name=True))
-        tg.create_task(ElementMemberQuery.resolve_members(elements))
+    # fetch the first batch before streaming, to be able to respond with an error
+    first_elements: Sequence[Element] | None = await anext(elements_iter, None)
+
+    async def elements_stream() -> AsyncIterator[Sequence]:
+        # release the session and cursor promptly, also on client disconnect
+        try:
+            if first_elements is None:
+                return
+            await UserQuery.resolve_elements_users(first_elements, display_name=True)
+            yield Format06.encode_elements_flat(first_elements)
+            async for elements in elements_iter:
+                await UserQuery.resolve_elements_users(elements, display_name=True)
+                yield Format06.encode_elements_flat(elements)
+        finally:
+            await elements_iter.aclose()
 
     xattr = get_xattr()
     minx, miny, maxx, maxy = geometry.bounds
-    return {
-        'bounds': {
-            xattr('minlon'): minx,
-            xattr('minlat'): miny,
-            xattr('maxlon'): maxx,
-            xattr('maxlat'): maxy,
+    return OSMResponse.serialize_stream(
+        {
+            'bounds': {
+                xattr('minlon'): minx,
+                xattr('minlat'): miny,
+                xattr('maxlon'): maxx,
+                xattr('maxlat'): maxy,
+            },
         },
-        **Format06.encode_elements(elements),
-    }
+        elements_stream(),
+        stream_key='elements',
+    )
@@ -1,12 +1,19 @@
+import time
 from asyncio import TaskGroup
+from functools import lru_cache
 from typing import Annotated
 
-from fastapi import APIRouter, Query
+import cython
+from fastapi import APIRouter, Query, Response
 
 from app.format import Format07
+from app.format.api07_element import COLUMNAR_MEDIA_TYPE
+from app.lib.cursor_utils import CursorUtils
 from app.lib.exceptions_context import raise_for
 from app.lib.geo_utils import parse_bbox
-from app.limits import MAP_QUERY_AREA_MAX_SIZE, MAP_QUERY_LEGACY_NODES_LIMIT
+from app.limits import MAP_QUERY_AREA_MAX_SIZE, MAP_QUERY_CURSOR_EXPIRE, MAP_QUERY_PAGE_NODES_LIMIT
+from app.middlewares.request_context_middleware import get_request
+from app.models.messages_pb2 import Cursor
 from app.queries.element_member_query import ElementMemberQuery
 from app.queries.element_query import ElementQuery
 from app.queries.user_query import UserQuery
@@ -14,21 +21,106 @@ from app.queries.user_query import UserQuery
 router = APIRouter(prefix='/api/0.7')
 
 
-# TODO: limits + cursor (1min expiration?)
 @router.get('/map')
-async def get_map(bbox: Annotated[str, Query()]):
+async def get_map(
+    response: Response,
+    bbox: Annotated[str, Query()],
+    cursor: Annotated[str | None, Query()] = None,
+):
     geometry = parse_bbox(bbox)
     if geometry.area > MAP_QUERY_AREA_MAX_SIZE:
         raise_for().map_query_area_too_big()
 
-    elements = await ElementQuery.find_many_by_geom(
+    # all pages are read at the same sequence_id, for a consistent snapshot
+    if cursor is not None:
+        page_cursor = CursorUtils.from_str(cursor, expire=MAP_QUERY_CURSOR_EXPIRE)
+        if not page_cursor.HasField('sequence_id') or not page_cursor.HasField('key'):
+            raise_for().bad_cursor()
+        at_sequence_id = page_cursor.sequence_id
+        after = (page_cursor.key, page_cursor.id)
+        timestamp = page_cursor.timestamp
+    else:
+        at_sequence_id = None
+        after = None
+        timestamp = int(time.time())
+
+    elements, at_sequence_id, next_after = await ElementQuery.find_many_by_geom_page(
         geometry,
-        nodes_limit=MAP_QUERY_LEGACY_NODES_LIMIT,
-        legacy_nodes_limit=True,
+        at_sequence_id=at_sequence_id,
+        after=after,
+        nodes_limit=MAP_QUERY_PAGE_NODES_LIMIT,
     )
 
     async with TaskGroup() as tg:
         tg.create_task(UserQuery.resolve_elements_users(elements, display_name=False))
         tg.create_task(ElementMemberQuery.resolve_members(elements))
 
-    return Format07.encode_elements(elements)
+    next_cursor = (
+        CursorUtils.to_str(Cursor(id=next_after[1], timestamp=timestamp, sequence_id=at_sequence_id, key=next_after[0]))
+        if (next_after is not None)
+        else None
+    )
+
+    # opt-in compact binary format
+    accept = get_request().headers.get('Accept')
+    if accept and _accepts_columnar(accept):
+        return Response(
+            Format07.encode_elements_columnar(elements),
+            media_type=COLUMNAR_MEDIA_TYPE,
+            headers={'Vary': 'Accept', **({'X-Cursor': next_cursor} if (next_cursor is not None) else {})},
+        )
+
+    # both formats are served from the same URL
+    response.headers['Vary'] = 'Accept'
+    return {
+        'elements': Format07.encode_elements(elements),
+        'cursor': next_cursor,
+    }
+
+
+@lru_cache(maxsize=128)
+def _accepts_columnar(accept: str) -> bool:
+    """
+    Check if the accept header prefers the columnar format over JSON.
+
+    >>> _accepts_columnar('application/vnd.openstreetmap.columnar')
+    True
+    >>> _accepts_columnar('application/vnd.openstreetmap.columnar;q=0, */*')
+    False
+    >>> _accepts_columnar('application/json, application/vnd.openstreetmap.columnar;q=0.5')
+    False
+    """
+    columnar_q: cython.double = 0
+    json_q: cython.double = 0
+    json_specificity: cython.int = -1
+
+    for media_range in accept.split(','):
+        media_type, *params = media_range.split(';')
+        media_type = media_type.strip().lower()
+        q: cython.double = 1
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0
+
+        if media_type == COLUMNAR_MEDIA_TYPE:
+            columnar_q = q
+            continue
+
+        # the most specific range matching JSON determines its quality
+        specificity: cython.int = _json_ranges.get(media_type, -1)
+        if specificity > json_specificity:
+            json_specificity = specificity
+            json_q = q
+
+    return columnar_q > 0 and columnar_q >= json_q
+
+
+_json_ranges: dict[str, int] = {
+    '*/*': 0,
+    'application/*': 1,
+    'application/json': 2,
+}
@@ -4,7 +4,6 @@ from fastapi import APIRouter
 from pydantic import PositiveInt
 from sqlalchemy.orm import joinedload
 
-from app.format.element_list import FormatElementList
 from app.lib.auth_context import auth_user
 from app.lib.options_context import options_context
 from app.lib.render_response import render_response
@@ -17,7 +16,7 @@ from app.models.db.user import User
 from app.models.tags_format import TagFormat
 from app.queries.changeset_comment_query import ChangesetCommentQuery
 from app.queries.changeset_query import ChangesetQuery
-from app.queries.element_query import ElementQuery
+from app.services.changeset_summary_service import ChangesetSummaryService
 from app.utils import json_encodes
 
 router = APIRouter(prefix='/api/partial/changeset')
@@ -44,10 +43,6 @@ async def get_changeset(id: PositiveInt):
     prev_changeset_id: int | None = None
     next_changeset_id: int | None = None
 
-    async def elements_task():
-        elements_ = await ElementQuery.get_by_changeset(id, sort_by='id')
-        return await FormatElementList.changeset_elements(elements_)
-
     async def comments_task():
         with options_context(joinedload(ChangesetComment.user)):
             await ChangesetCommentQuery.resolve_comments((changeset,), limit_per_changeset=None, resolve_rich_text=True)
@@ -61,7 +56,7 @@ async def get_changeset(id: PositiveInt):
         prev_changeset_id, next_changeset_id = t
 
     async with TaskGroup() as tg:
-        elements_t = tg.create_task(elements_task())
+        elements_t = tg.create_task(ChangesetSummaryService.get_elements(changeset))
         tg.create_task(comments_task())
         tg.create_task(adjacent_ids_task())
         is_subscribed_task = (
@@ -10,11 +10,11 @@ from starlette.responses import RedirectResponse
 from app.lib.auth_context import auth_user, web_user
 from app.lib.options_context import options_context
 from app.lib.render_response import render_response
+from app.lib.trace_preview import TracePreview
 from app.limits import DISPLAY_NAME_MAX_LENGTH, TRACE_TAG_MAX_LENGTH, TRACES_LIST_PAGE_SIZE
 from app.models.db.trace_ import Trace
 from app.models.db.user import User
 from app.queries.trace_query import TraceQuery
-from app.queries.trace_segment_query import TraceSegmentQuery
 from app.queries.user_query import UserQuery
 from app.utils import json_encodes
 
@@ -61,7 +61,6 @@ async def _get_traces_data(
 
     if traces:
         async with TaskGroup() as tg:
-            tg.create_task(TraceSegmentQuery.resolve_coords(traces, limit_per_trace=100, resolution=100))
             new_after_t = tg.create_task(new_after_task())
             new_before_t = tg.create_task(new_before_task())
         new_after = new_after_t.result()
@@ -75,7 +74,7 @@ async def _get_traces_data(
     if tag is not None:
         base_url += f'/tag/{tag}'
 
-    traces_coords = json_encodes(tuple(trace.coords for trace in traces))
+    traces_coords = json_encodes(tuple(TracePreview.decode(trace.preview) for trace in traces))
 
     if user is None:
         active_tab = 0  # viewing public traces
@@ -14,6 +14,7 @@ from app.lib.date_utils import format_short_date, get_month_name, get_weekday_na
 from app.lib.exceptions_context import raise_for
 from app.lib.legal import legal_terms
 from app.lib.render_response import render_response
+from app.lib.trace_preview import TracePreview
 from app.limits import (
     DISPLAY_NAME_MAX_LENGTH,
     EMAIL_MIN_LENGTH,
@@ -32,7 +33,6 @@ from app.queries.changeset_query import ChangesetQuery
 from app.queries.note_comment_query import NoteCommentQuery
 from app.queries.note_query import NoteQuery
 from app.queries.trace_query import TraceQuery
-from app.queries.trace_segment_query import TraceSegmentQuery
 from app.queries.user_query import UserQuery
 from app.utils import json_encodes
 
@@ -97,8 +97,7 @@ async def index(display_name: Annotated[str, Path(min_length=1, max_length=DISPL
         sort='desc',
         limit=USER_RECENT_ACTIVITY_ENTRIES,
     )
-    await TraceSegmentQuery.resolve_coords(traces, limit_per_trace=100, resolution=100)
-    traces_coords = json_encodes(tuple(trace.coords for trace in traces))
+    traces_coords = json_encodes(tuple(TracePreview.decode(trace.preview) for trace in traces))
 
     # TODO: diaries
     diaries_count = 0
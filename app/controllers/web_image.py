@@ -15,7 +15,7 @@ async def gravatar(
     user_id: Annotated[PositiveInt, Path()],
 ) -> Response:
     file = await ImageQuery.get_gravatar(user_id)
-    content_type = magic.from_buffer(file[:2048], mime=True)
+    content_type = magic.from_buffer(bytes(file[:2048]), mime=True)
     return Response(file, media_type=content_type)
 
 
@@ -24,7 +24,7 @@ async def avatar(
     avatar_id: Annotated[StorageKey, Path(min_length=1)],
 ) -> Response:
     file = await ImageQuery.get_avatar(avatar_id)
-    content_type = magic.from_buffer(file[:2048], mime=True)
+    content_type = magic.from_buffer(bytes(file[:2048]), mime=True)
     return Response(file, media_type=content_type)
 
 
@@ -33,5 +33,5 @@ async def background(
     background_id: Annotated[StorageKey, Path(min_length=1)],
 ) -> Response:
     file = await ImageQuery.get_background(background_id)
-    content_type = magic.from_buffer(file[:2048], mime=True)
+    content_type = magic.from_buffer(bytes(file[:2048]), mime=True)
     return Response(file, media_type=content_type)
@@ -15,6 +15,10 @@ class TraceExceptionsMixin:
     def trace_points_query_area_too_big(self) -> NoReturn:
         raise NotImplementedError
 
+    @abstractmethod
+    def trace_points_query_page_too_deep(self) -> NoReturn:
+        raise NotImplementedError
+
     @abstractmethod
     def trace_file_unsupported_format(self, content_type: str) -> NoReturn:
         raise NotImplementedError
@@ -4,7 +4,7 @@ from starlette import status
 
 from app.exceptions.api_error import APIError
 from app.exceptions.trace_mixin import TraceExceptionsMixin
-from app.limits import TRACE_POINT_QUERY_AREA_MAX_SIZE
+from app.limits import TRACE_POINT_QUERY_AREA_MAX_SIZE, TRACE_POINT_QUERY_LEGACY_MAX_SKIP
 
 
 class TraceExceptions06Mixin(TraceExceptionsMixin):
@@ -23,6 +23,13 @@ class TraceExceptions06Mixin(TraceExceptionsMixin):
             detail=f'The maximum bbox size is {TRACE_POINT_QUERY_AREA_MAX_SIZE}, and your request was too large. Please request a smaller area.',
         )
 
+    @override
+    def trace_points_query_page_too_deep(self) -> NoReturn:
+        raise APIError(
+            status.HTTP_400_BAD_REQUEST,
+            detail=f'Paging deeper than {TRACE_POINT_QUERY_LEGACY_MAX_SKIP} points requires the X-Cursor of the previous page.',
+        )
+
     @override
     def trace_file_unsupported_format(self, content_type: str) -> NoReturn:
         raise APIError(status.HTTP_400_BAD_REQUEST, detail=f'Unsupported trace file format {content_type!r}')
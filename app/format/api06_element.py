@@ -47,6 +47,24 @@ class Element06Mixin:
                 result[element.type].append(_encode_element(element, is_json=False))
             return result  # pyright: ignore[reportReturnType]
 
+    @staticmethod
+    def encode_elements_flat(elements: Iterable[Element]) -> tuple[dict, ...] | tuple[tuple[ElementType, dict], ...]:
+        """
+        Like encode_elements, but preserves the order and does not merge elements.
+
+        Suitable for streaming with OSMResponse.serialize_stream.
+
+        >>> encode_elements_flat([
+        ...     Element(type='node', id=1, version=1, ...),
+        ...     Element(type=ElementType.way, id=2, version=1,
+        ... ])
+        (('node', {'@id': 1, '@version': 1, ...}), ('way', {'@id': 2, '@version': 1, ...}))
+        """
+        if format_is_json():
+            return tuple(_encode_element(element, is_json=True) for element in elements)
+        else:
+            return tuple((element.type, _encode_element(element, is_json=False)) for element in elements)
+
     @staticmethod
     def decode_element(element: tuple[ElementType, dict]) -> Element:
         """
@@ -47,19 +47,20 @@ def _encode_gpx_file(trace: Trace) -> dict:
     >>> _encode_gpx_file(Trace(...))
     {'@id': 1, '@uid': 1234, ...}
     """
-    trace_coords = trace.coords
-    if trace_coords is None:
-        raise AssertionError('Trace coords must be set')
-    return {
+    result = {
         '@id': trace.id,
         '@uid': trace.user_id,
         '@user': trace.user.display_name,
         '@timestamp': trace.created_at,
         '@name': trace.name,
-        '@lon': trace_coords[0],
-        '@lat': trace_coords[1],
         '@visibility': trace.visibility,
-        '@pending': False,
+        '@pending': trace.pending,
         'description': trace.description,
         'tag': trace.tags,
     }
+    # pending traces have no points yet
+    start_point = trace.start_point
+    if start_point is not None:
+        result['@lon'] = start_point.x
+        result['@lat'] = start_point.y
+    return result
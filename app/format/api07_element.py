@@ -1,11 +1,22 @@
-from collections.abc import Iterable
+from collections.abc import Collection, Iterable, Sequence
+from datetime import UTC, datetime, timedelta
 
 import cython
 import numpy as np
-from shapely import Point, lib
+from shapely import Point, get_coordinates, lib
 
+from app.lib.varint import encode_varints, zigzag_encode
 from app.models.db.element import Element
 from app.models.db.element_member import ElementMember
+from app.models.element import ElementType
+
+COLUMNAR_MEDIA_TYPE = 'application/vnd.openstreetmap.columnar'
+
+_columnar_magic = b'OSMC\x01'
+_columnar_types: tuple[ElementType, ...] = ('node', 'way', 'relation')
+_columnar_type_codes: dict[ElementType, int] = {'node': 0, 'way': 1, 'relation': 2}
+_epoch = datetime(1970, 1, 1, tzinfo=UTC)
+_microsecond = timedelta(microseconds=1)
 
 
 class Element07Mixin:
@@ -17,6 +28,34 @@ class Element07Mixin:
     def encode_elements(elements: Iterable[Element]) -> tuple[dict, ...]:
         return tuple(_encode_element(element) for element in elements)
 
+    @staticmethod
+    def encode_elements_columnar(elements: Iterable[Element]) -> bytes:
+        """
+        Encode elements in the compact binary columnar format.
+
+        See spec/api07_data_model.md for the format description.
+        """
+        type_elements: dict[ElementType, list[Element]] = {type: [] for type in _columnar_types}
+        for element in elements:
+            type_elements[element.type].append(element)
+
+        strings: dict[str, int] = {}
+        blocks = [
+            _encode_columnar_block(type, sorted(type_elements[type], key=_element_id), strings)
+            for type in _columnar_types
+        ]
+
+        encoded_strings = tuple(s.encode() for s in strings)
+        return b''.join(
+            (
+                _columnar_magic,
+                encode_varints(np.array((len(encoded_strings),))),
+                _column(encode_varints(np.fromiter(map(len, encoded_strings), np.uint64, len(encoded_strings)))),
+                _column(b''.join(encoded_strings)),
+                *blocks,
+            )
+        )
+
 
 @cython.cfunc
 def _encode_members(members: Iterable[ElementMember]) -> tuple[dict, ...]:
@@ -52,3 +91,102 @@ def _encode_point(point: Point | None) -> dict:
         return {}
     x, y = lib.get_coordinates(np.asarray(point, dtype=object), False, False)[0].tolist()
     return {'lon': x, 'lat': y}
+
+
+@cython.cfunc
+def _element_id(element: Element) -> int:
+    return element.id
+
+
+@cython.cfunc
+def _column(data: bytes) -> bytes:
+    """
+    Prefix the column data with its length.
+    """
+    return encode_varints(np.array((len(data),))) + data
+
+
+@cython.cfunc
+def _delta_column(values: np.ndarray) -> bytes:
+    """
+    Encode the values as zigzag varints of the differences between consecutive values.
+    """
+    return _column(encode_varints(zigzag_encode(np.diff(values, prepend=0))))
+
+
+@cython.cfunc
+def _string_index(strings: dict[str, int], s: str) -> int:
+    index = strings.get(s)
+    if index is None:
+        index = strings[s] = len(strings)
+    return index
+
+
+@cython.cfunc
+def _encode_columnar_block(type: ElementType, elements: Collection[Element], strings: dict[str, int]) -> bytes:
+    num_elements = len(elements)
+    columns: list[bytes] = [encode_varints(np.array((num_elements,)))]
+    if not num_elements:
+        return columns[0]
+
+    visible = np.fromiter((element.visible for element in elements), np.bool, num_elements)
+    user_ids = np.fromiter(
+        (user_id + 1 if (user_id := element.user_id) is not None else 0 for element in elements),
+        np.uint64,
+        num_elements,
+    )
+    created_at = np.fromiter(
+        ((element.created_at - _epoch) // _microsecond for element in elements),
+        np.int64,
+        num_elements,
+    )
+    columns.extend(
+        (
+            _delta_column(np.fromiter((element.id for element in elements), np.int64, num_elements)),
+            _column(encode_varints(np.fromiter((element.version for element in elements), np.uint64, num_elements))),
+            _delta_column(np.fromiter((element.changeset_id for element in elements), np.int64, num_elements)),
+            _column(encode_varints(user_ids)),
+            _delta_column(created_at),
+            _column(np.packbits(visible, bitorder='little').tobytes()),
+        )
+    )
+
+    if type == 'node':
+        points = np.fromiter((element.point for element in elements if element.point is not None), object)
+        coords = get_coordinates(points)
+        coords = np.round(coords * 10_000_000).astype(np.int64)
+        columns.append(_delta_column(coords[:, 0]))
+        columns.append(_delta_column(coords[:, 1]))
+
+    tags: list[int] = []
+    for element in elements:
+        element_tags = element.tags
+        tags.append(len(element_tags))
+        for key, value in element_tags.items():
+            tags.append(_string_index(strings, key))
+            tags.append(_string_index(strings, value))
+    columns.append(_column(encode_varints(np.array(tags, np.uint64))))
+
+    if type != 'node':
+        counts: list[int] = []
+        members_ids: list[int] = []
+        members_types: list[int] = []
+        members_roles: list[int] = []
+        type_codes = _columnar_type_codes
+        for element in elements:
+            element_members: Sequence[ElementMember] | None = element.members
+            if element_members is None:
+                raise AssertionError('Element members must be set')
+            counts.append(len(element_members))
+            for member in element_members:
+                members_ids.append(member.id)
+                if type == 'relation':
+                    members_types.append(type_codes[member.type])
+                    members_roles.append(_string_index(strings, member.role))
+        columns.append(_column(encode_varints(np.array(counts, np.uint64))))
+        columns.append(_delta_column(np.array(members_ids, np.int64)))
+        if type == 'relation':
+            columns.append(_column(encode_varints(np.array(members_types, np.uint64))))
+            columns.append(_column(encode_varints(np.array(members_roles, np.uint64))))
+
+    return b''.join(columns)
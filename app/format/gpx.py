@@ -1,11 +1,14 @@
-from collections.abc import Iterable, Sequence, Sized
-from datetime import datetime
+from collections.abc import Iterable, Sequence
+from datetime import UTC, datetime, timedelta
+from io import BytesIO
 from itertools import zip_longest
 
 import cython
+import lxml.etree as ET
 import numpy as np
-from shapely import Point, lib, multipoints
+from shapely import MultiPoint, is_valid, lib, multipoints
 
+from app.lib.exceptions_context import raise_for
 from app.limits import (
     GEO_COORDINATE_PRECISION,
     TRACE_SEGMENT_MAX_AREA,
@@ -14,10 +17,13 @@ from app.limits import (
 )
 from app.models.db.trace_ import Trace
 from app.models.db.trace_segment import TraceSegment
-from app.validators.geometry import validate_geometry
 
 _default = object()
 
+_epoch = datetime(1970, 1, 1, tzinfo=UTC)
+_microsecond = timedelta(microseconds=1)
+_nat = np.iinfo(np.int64).min  # NaT in datetime64
+
 
 class FormatGPX:
     @staticmethod
@@ -99,51 +105,64 @@ class FormatGPX:
         return {'trk': trks}
 
     @staticmethod
-    def decode_tracks(tracks: Iterable[dict], *, track_num_start: cython.int = 0) -> list[TraceSegment]:
+    def decode_gpx(buffer: bytes, *, track_num_start: cython.int = 0) -> list[TraceSegment]:
         """
-        >>> decode_tracks([{'trkseg': [{'trkpt': [{'@lon': 1, '@lat': 2}]}]}])
+        Decode the GPX file tracks, streaming over the track points.
+
+        >>> decode_gpx(b'<gpx><trk><trkseg><trkpt lat="2" lon="1"/></trkseg></trk></gpx>')
         [TraceSegment(...)]
         """
         segment_max_area: cython.double = TRACE_SEGMENT_MAX_AREA
         segment_max_area_length: cython.double = TRACE_SEGMENT_MAX_AREA_LENGTH
         segment_max_size: cython.int = TRACE_SEGMENT_MAX_SIZE
-        result: list[TraceSegment] = []
-
-        track_num: cython.int
-        segment_num: cython.int
-        current_minx: cython.double
-        current_miny: cython.double
-        current_maxx: cython.double
-        current_maxy: cython.double
-        points: list[tuple[float, float]] = []
-        capture_times: list[datetime | None] = []
-        elevations: list[float | None] = []
-
-        trk: dict
-        trkseg: dict
-        trkpt: dict
-
-        for trk in tracks:
-            track_num = track_num_start
-            for track_num, trkseg in enumerate(trk.get('trkseg', ()), track_num_start):
-                segment_num = 0
-                current_minx = 180
-                current_miny = 90
-                current_maxx = -180
-                current_maxy = -90
-
-                for trkpt in trkseg.get('trkpt', ()):
-                    lon: float | None = trkpt.get('@lon')
-                    lat: float | None = trkpt.get('@lat')
-                    if lon is None or lat is None:
-                        continue
-
-                    lon_c: cython.double = lon
-                    lat_c: cython.double = lat
-                    time_str: str | None = trkpt.get('time')
-                    time = datetime.fromisoformat(time_str) if time_str is not None else None
-                    elevation_str: str | None = trkpt.get('ele')
-                    elevation = float(elevation_str) if elevation_str is not None else None
+        segments = _SegmentsBuffer()
+
+        # a segment never exceeds the max size, the buffers are reused
+        lons = np.empty(segment_max_size, np.float64)
+        lats = np.empty(segment_max_size, np.float64)
+        elevations = np.empty(segment_max_size, np.float64)
+        capture_times = np.empty(segment_max_size, 'datetime64[us]')
+        capture_times_us = capture_times.view(np.int64)
+        size: cython.int = 0
+
+        track_num: cython.int = track_num_start
+        segment_num: cython.int = 0
+        track_has_segments: cython.char = False
+        current_minx: cython.double = 180
+        current_miny: cython.double = 90
+        current_maxx: cython.double = -180
+        current_maxy: cython.double = -90
+
+        for event, element in ET.iterparse(
+            BytesIO(buffer),
+            events=('start', 'end'),
+            tag=('{*}trk', '{*}trkseg', '{*}trkpt'),
+            remove_comments=True,
+            remove_pis=True,
+            resolve_entities=False,
+            collect_ids=False,
+            huge_tree=True,
+            no_network=True,
+        ):
+            tag: str = element.tag.rpartition('}')[2]
+
+            if event == 'start':
+                if tag == 'trk':
+                    track_has_segments = False
+                elif tag == 'trkseg':
+                    segment_num = 0
+                    current_minx = 180
+                    current_miny = 90
+                    current_maxx = -180
+                    current_maxy = -90
+                continue
+
+            if tag == 'trkpt':
+                lon_str: str | None = element.get('lon')
+                lat_str: str | None = element.get('lat')
+                if lon_str is not None and lat_str is not None:
+                    lon_c: cython.double = float(lon_str)
+                    lat_c: cython.double = float(lat_str)
 
                     current_minx = min(current_minx, lon_c)
                     current_miny = min(current_miny, lat_c)
@@ -158,38 +177,154 @@ class FormatGPX:
                         miny=current_miny,
                         maxx=current_maxx,
                         maxy=current_maxy,
-                        points=points,
+                        size=size,
                     ):
-                        _finish_segment(
-                            result=result,
-                            points=points,
-                            capture_times=capture_times,
-                            elevations=elevations,
+                        segments.append(
                             track_num=track_num,
                             segment_num=segment_num,
+                            lons=lons[:size],
+                            lats=lats[:size],
+                            capture_times=capture_times[:size],
+                            elevations=elevations[:size],
                         )
+                        size = 0
                         current_minx = lon_c
                         current_miny = lat_c
                         current_maxx = lon_c
                         current_maxy = lat_c
                         segment_num += 1
 
-                    points.append((lon, lat))
-                    capture_times.append(time)
-                    elevations.append(elevation)
-
-                _finish_segment(
-                    result=result,
+                    lons[size] = lon_c
+                    lats[size] = lat_c
+                    elevations[size] = np.nan
+                    capture_times_us[size] = _nat
+                    for child in element:
+                        text: str | None = child.text
+                        if text is None:
+                            continue
+                        child_tag: str = child.tag.rpartition('}')[2]
+                        if child_tag == 'ele':
+                            elevations[size] = float(text)
+                        elif child_tag == 'time':
+                            capture_times_us[size] = _parse_time_us(text)
+                    size += 1
+
+                # free processed elements, including the already cleared siblings
+                element.clear(keep_tail=False)
+                parent = element.getparent()
+                if parent is not None:
+                    while element.getprevious() is not None:
+                        del parent[0]
+
+            elif tag == 'trkseg':
+                segments.append(
                     track_num=track_num,
                     segment_num=segment_num,
-                    points=points,
-                    capture_times=capture_times,
-                    elevations=elevations,
+                    lons=lons[:size],
+                    lats=lats[:size],
+                    capture_times=capture_times[:size],
+                    elevations=elevations[:size],
                 )
+                size = 0
+                track_num += 1
+                track_has_segments = True
+                element.clear(keep_tail=False)
+
+            else:  # trk
+                # tracks without segments still take a track number
+                if not track_has_segments:
+                    track_num += 1
+                element.clear(keep_tail=False)
+
+        return segments.build()
+
+
+class _SegmentsBuffer:
+    """
+    Collect the segments data, building the geometries at once.
+    """
+
+    __slots__ = ('_capture_times', '_coords', '_elevations', '_segment_nums', '_sizes', '_track_nums')
+
+    def __init__(self) -> None:
+        self._track_nums: list[int] = []
+        self._segment_nums: list[int] = []
+        self._sizes: list[int] = []
+        self._coords: list[np.ndarray] = []
+        self._capture_times: list[list[datetime | None] | None] = []
+        self._elevations: list[list[float | None] | None] = []
+
+    def append(
+        self,
+        *,
+        track_num: int,
+        segment_num: int,
+        lons: np.ndarray,
+        lats: np.ndarray,
+        capture_times: np.ndarray,
+        elevations: np.ndarray,
+    ) -> None:
+        size = len(lons)
+        if not size:
+            return
+
+        self._track_nums.append(track_num)
+        self._segment_nums.append(segment_num)
+        self._sizes.append(size)
+        self._coords.append(np.column_stack((lons, lats)))
+
+        capture_times_nat = np.isnat(capture_times)
+        self._capture_times.append(
+            [
+                capture_time.replace(tzinfo=UTC) if capture_time is not None else None
+                for capture_time in capture_times.tolist()
+            ]
+            if not capture_times_nat.all()
+            else None
+        )
 
-            track_num_start = track_num + 1
+        elevations_nan = np.isnan(elevations)
+        self._elevations.append(
+            np.where(elevations_nan, None, elevations).tolist()  #
+            if not elevations_nan.all()
+            else None
+        )
 
-        return result
+    def build(self) -> list[TraceSegment]:
+        if not self._sizes:
+            return []
+
+        coords = np.concatenate(self._coords).round(GEO_COORDINATE_PRECISION)
+        if not np.all(
+            (coords[:, 0] >= -180)
+            & (coords[:, 0] <= 180)  #
+            & (coords[:, 1] >= -90)
+            & (coords[:, 1] <= 90)
+        ):
+            raise_for().bad_geometry_coordinates()
+
+        indices = np.repeat(np.arange(len(self._sizes)), self._sizes)
+        geoms: Sequence[MultiPoint] = multipoints(coords, indices=indices)
+        if not is_valid(geoms).all():
+            raise_for().bad_geometry()
+
+        return [
+            TraceSegment(
+                track_num=track_num,
+                segment_num=segment_num,
+                points=points,
+                capture_times=capture_times,
+                elevations=elevations,
+            )
+            for track_num, segment_num, points, capture_times, elevations in zip(
+                self._track_nums,
+                self._segment_nums,
+                geoms,
+                self._capture_times,
+                self._elevations,
+                strict=True,
+            )
+        ]
 
 
 @cython.cfunc
@@ -202,7 +337,7 @@ def _should_finish_segment(
     miny: cython.double,
     maxx: cython.double,
     maxy: cython.double,
-    points: Sized,
+    size: cython.int,
 ) -> cython.char:
     """
     Check if the segment should be finished before adding the point.
@@ -213,40 +348,16 @@ def _should_finish_segment(
         width * height > segment_max_area  # check area
         or width > segment_max_area_length  # check width
         or height > segment_max_area_length  # check height
-        or len(points) + 1 >= segment_max_size  # check length
+        or size + 1 >= segment_max_size  # check length
     )
 
 
 @cython.cfunc
-def _finish_segment(
-    *,
-    result: list[TraceSegment],
-    track_num: cython.int,
-    segment_num: cython.int,
-    points: list[tuple[float, float]],
-    capture_times: list[datetime | None],
-    elevations: list[float | None],
-):
+def _parse_time_us(value: str) -> int:
     """
-    Finish the segment and add it to the result.
+    Parse the ISO 8601 time into microseconds since the epoch, assuming UTC if naive.
     """
-    if not points:
-        return
-
-    points_: Sequence[Point] = lib.points(np.array(points, np.float64).round(GEO_COORDINATE_PRECISION))
-    multipoint = validate_geometry(multipoints(points_))
-    capture_times_ = capture_times.copy() if any(v is not None for v in capture_times) else None
-    elevations_ = elevations.copy() if any(v is not None for v in elevations) else None
-    result.append(
-        TraceSegment(
-            track_num=track_num,
-            segment_num=segment_num,
-            points=multipoint,
-            capture_times=capture_times_,
-            elevations=elevations_,
-        )
-    )
-
-    points.clear()
-    capture_times.clear()
-    elevations.clear()
+    time = datetime.fromisoformat(value)
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=UTC)
+    return (time - _epoch) // _microsecond
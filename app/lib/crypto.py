@@ -1,3 +1,4 @@
+import hmac
 from hashlib import sha256
 
 import cython
@@ -34,6 +35,17 @@ def hash_hex(s: str | bytes) -> str:
     return _hash(s).hexdigest()
 
 
+def hmac_bytes(s: str | bytes) -> bytes:
+    """
+    Compute a HMAC-SHA256 of a string, keyed with the application secret.
+
+    Returns a buffer of the hash.
+    """
+    if isinstance(s, str):
+        s = s.encode()
+    return hmac.new(SECRET_32b, s, sha256).digest()
+
+
 def encrypt(s: str) -> bytes:
     """
     Encrypt a string using AES-CTR.
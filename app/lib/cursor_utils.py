@@ -0,0 +1,57 @@
+import hmac
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import timedelta
+
+from google.protobuf.message import DecodeError
+
+from app.lib.crypto import hmac_bytes
+from app.lib.exceptions_context import raise_for
+from app.models.messages_pb2 import Cursor
+
+# truncated signature size, in bytes
+_signature_size = 16
+
+
+class CursorUtils:
+    @staticmethod
+    def from_str(s: str, *, expire: timedelta | None) -> Cursor:
+        """
+        Parse the given string into a cursor.
+
+        The cursor signature is verified, and if expire is provided, the cursor timestamp is checked against it.
+        """
+        try:
+            buffer = urlsafe_b64decode(s + '=' * (-len(s) % 4))
+        except (BinasciiError, ValueError):
+            raise_for().bad_cursor()
+
+        signature = buffer[:_signature_size]
+        payload = buffer[_signature_size:]
+        if len(signature) != _signature_size or not hmac.compare_digest(
+            signature, hmac_bytes(payload)[:_signature_size]
+        ):
+            raise_for().bad_cursor()
+
+        try:
+            cursor = Cursor.FromString(payload)
+        except DecodeError:
+            raise_for().bad_cursor()
+
+        if expire is not None:
+            if not cursor.HasField('timestamp'):
+                raise_for().bad_cursor()
+            if cursor.timestamp + expire.total_seconds() < time.time():
+                raise_for().cursor_expired()
+
+        return cursor
+
+    @staticmethod
+    def to_str(cursor: Cursor) -> str:
+        """
+        Convert the given cursor into an opaque, signed string.
+        """
+        payload = cursor.SerializeToString()
+        signature = hmac_bytes(payload)[:_signature_size]
+        return urlsafe_b64encode(signature + payload).rstrip(b'=').decode()
@@ -0,0 +1,74 @@
+from collections.abc import Iterable
+
+from sqlalchemy import ARRAY, BigInteger, Unicode, and_, bindparam, cast, column, func
+
+from app.models.db.element import Element
+from app.models.db.element_member import ElementMember
+from app.models.element import ElementRef, VersionedElementRef
+
+_element_type_enum = Element.__table__.c.type.type
+
+
+def unnest_refs(element_refs: Iterable[ElementRef]):
+    """
+    Build a table of the given element refs, bound as typed arrays.
+
+    The statement shape doesn't depend on the number of refs, so it's cached and prepared only once.
+    """
+    types: list[str] = []
+    ids: list[int] = []
+    for element_ref in element_refs:
+        types.append(element_ref.type)
+        ids.append(element_ref.id)
+    return (
+        func.unnest(
+            bindparam('types', types, type_=ARRAY(Unicode)),
+            bindparam('ids', ids, type_=ARRAY(BigInteger)),
+        )
+        .table_valued(column('type', Unicode), column('id', BigInteger))
+        .render_derived('refs')
+    )
+
+
+def unnest_versioned_refs(versioned_refs: Iterable[VersionedElementRef]):
+    """
+    Build a table of the given versioned element refs, bound as typed arrays.
+    """
+    types: list[str] = []
+    ids: list[int] = []
+    versions: list[int] = []
+    for versioned_ref in versioned_refs:
+        types.append(versioned_ref.type)
+        ids.append(versioned_ref.id)
+        versions.append(versioned_ref.version)
+    return (
+        func.unnest(
+            bindparam('types', types, type_=ARRAY(Unicode)),
+            bindparam('ids', ids, type_=ARRAY(BigInteger)),
+            bindparam('versions', versions, type_=ARRAY(BigInteger)),
+        )
+        .table_valued(column('type', Unicode), column('id', BigInteger), column('version', BigInteger))
+        .render_derived('refs')
+    )
+
+
+def match_refs(model: type[Element] | type[ElementMember], refs):
+    """
+    Build a join condition between the model and the refs table.
+    """
+    # cast the text type to enum, for the index to be used
+    return and_(
+        model.type == cast(refs.c.type, _element_type_enum),
+        model.id == refs.c.id,
+    )
+
+
+def match_versioned_refs(model: type[Element], refs):
+    """
+    Build a join condition between the model and the versioned refs table.
+    """
+    return and_(
+        model.type == cast(refs.c.type, _element_type_enum),
+        model.id == refs.c.id,
+        model.version == refs.c.version,
+    )
@@ -1,140 +1,493 @@
+import fcntl
 import logging
+import mmap
+import sqlite3
+import struct
 import time
-from asyncio import get_running_loop
+import zlib
+from asyncio import get_running_loop, sleep
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from contextlib import asynccontextmanager
 from datetime import timedelta
-from functools import lru_cache
+from functools import cache, lru_cache
 from pathlib import Path
-from typing import NamedTuple
+from threading import Lock
+from typing import BinaryIO, NamedTuple
 
-from google.protobuf.message import DecodeError
 from sizestr import sizestr
+from zstandard import ZstdError
 
 from app.config import FILE_CACHE_DIR, FILE_CACHE_SIZE_GB
 from app.lib.buffered_random import buffered_randbytes
 from app.lib.crypto import hash_hex
-from app.models.messages_pb2 import FileCacheMeta
+from app.lib.zstd_dict import ZstdDict
+from app.limits import (
+    CACHE_COMPRESS_DICT_MIN_SIZE,
+    CACHE_COMPRESS_ZSTD_LEVEL,
+    FILE_CACHE_ACCESS_UPDATE_INTERVAL,
+    FILE_CACHE_CLEANUP_BATCH_SIZE,
+    FILE_CACHE_CLEANUP_INTERVAL,
+)
 
+# entry header: magic, zstd dictionary version (0 = none), expires_at (0 = none), data length, data crc32
+_header_struct = struct.Struct('>4sB3xqQI')
+_header_magic = b'OFC\x01'
 
-class _CleanupInfo(NamedTuple):
-    expires_at: int | float
-    size: int
-    path: Path
+_index_schema = """
+CREATE TABLE IF NOT EXISTS entry (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    expires_at INTEGER,
+    last_access INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entry_expires_at_idx ON entry (expires_at);
+CREATE INDEX IF NOT EXISTS entry_last_access_idx ON entry (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_size INTEGER NOT NULL,
+    imported INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS entry_insert AFTER INSERT ON entry BEGIN
+    UPDATE stats SET total_size = total_size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entry_update AFTER UPDATE OF size ON entry BEGIN
+    UPDATE stats SET total_size = total_size - OLD.size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entry_delete AFTER DELETE ON entry BEGIN
+    UPDATE stats SET total_size = total_size - OLD.size;
+END;
+"""
+
+
+class _EntryHeader(NamedTuple):
+    zstd_dict_version: int | None
+    expires_at: int | None
+    length: int
+    checksum: int
+
+
+class _IndexEntry(NamedTuple):
+    expires_at: int | None
+    last_access: int
+
+
+class _Index:
+    """
+    SQLite index of the file cache entries, shared between processes.
+
+    The total size is maintained by triggers, so eviction never scans the cache.
+    """
+
+    __slots__ = ('_conn', '_lock')
+
+    def __init__(self, path: Path):
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            self._conn.executescript(_index_schema)
+
+    def get(self, key: str) -> _IndexEntry | None:
+        with self._lock:
+            row = self._conn.execute('SELECT expires_at, last_access FROM entry WHERE key = ?', (key,)).fetchone()
+        return _IndexEntry(*row) if row is not None else None
+
+    def put(self, key: str, size: int, expires_at: int | None, now: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO entry VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET '
+                'size = excluded.size, expires_at = excluded.expires_at, last_access = excluded.last_access',
+                (key, size, expires_at, now),
+            )
+
+    def touch(self, key: str, now: int) -> None:
+        with self._lock:
+            self._conn.execute('UPDATE entry SET last_access = ? WHERE key = ?', (now, key))
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.executemany('DELETE FROM entry WHERE key = ?', ((key,) for key in keys))
+
+    def get_expired(self, now: int, limit: int) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key FROM entry WHERE expires_at < ? LIMIT ?',
+                (now, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_least_recent(self, limit: int) -> list[tuple[str, int]]:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT key, size FROM entry ORDER BY last_access LIMIT ?',
+                (limit,),
+            ).fetchall()
+
+    def get_total_size(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT total_size FROM stats').fetchone()[0]
+
+    def is_imported(self) -> bool:
+        with self._lock:
+            return self._conn.execute('SELECT imported FROM stats').fetchone()[0]
+
+    def set_imported(self) -> None:
+        with self._lock:
+            self._conn.execute('UPDATE stats SET imported = 1')
 
 
 class FileCache:
-    __slots__ = ('_base_dir',)
+    __slots__ = ('_base_dir', '_context')
 
     def __init__(self, context: str, *, cache_dir: Path = FILE_CACHE_DIR):
+        self._context = context
         self._base_dir: Path = cache_dir.joinpath(context)
 
-    async def get(self, key: str) -> bytes | None:
+    @asynccontextmanager
+    @staticmethod
+    async def context():
+        """
+        Context manager for the file cache cleanup runner.
+        """
+        loop = get_running_loop()
+        task = loop.create_task(_cleanup_task())
+        yield
+        task.cancel()  # avoid "Task was destroyed" warning during tests
+
+    async def get(self, key: str) -> memoryview | None:
         """
         Get a value from the file cache by key string.
 
+        The value is memory-mapped, it is not copied until used.
         Returns None if the cache is not found.
         """
-        path = _get_path(self._base_dir, key)
-
-        try:
-            loop = get_running_loop()
-            entry_bytes = await loop.run_in_executor(None, path.read_bytes)
-            entry = FileCacheMeta.FromString(entry_bytes)
-        except (OSError, DecodeError):
-            logging.debug('Cache read error for %r', key)
+        loop = get_running_loop()
+        result = await loop.run_in_executor(None, _read, self._base_dir, key)
+        if result is None:
             return None
 
-        # if provided, check time-to-live
-        if entry.HasField('expires_at') and entry.expires_at < time.time():
-            logging.debug('Cache miss for %r', key)
-            path.unlink(missing_ok=True)
+        header, data = result
+        if header.zstd_dict_version is None:
+            logging.debug('Cache hit for %r', key)
+            return data
+
+        try:
+            data = memoryview(ZstdDict.get_decompressor(self._context, header.zstd_dict_version).decompress(data))
+        except (KeyError, ZstdError):
+            logging.debug('Cache decompress error for %r', key)
             return None
 
         logging.debug('Cache hit for %r', key)
-        return entry.data
+        return data
 
     async def set(self, key: str, data: bytes, *, ttl: timedelta | None) -> None:
         """
         Set a value in the file cache by key string.
         """
-        path = _get_path(self._base_dir, key)
-        path.parent.mkdir(parents=True, exist_ok=True)
-
         expires_at = int(time.time() + ttl.total_seconds()) if (ttl is not None) else None
-        entry = FileCacheMeta(data=data, expires_at=expires_at)
-        entry_bytes = entry.SerializeToString()
 
-        temp_name = f'.{buffered_randbytes(16).hex()}.tmp'
-        temp_path = path.with_name(temp_name)
+        zstd_dict_version: int | None = None
+        if len(data) >= CACHE_COMPRESS_DICT_MIN_SIZE:
+            compressor = ZstdDict.get_compressor(self._context, level=CACHE_COMPRESS_ZSTD_LEVEL)
+            if compressor is not None:
+                zstd_dict_version, compressor_ = compressor
+                data = compressor_.compress(data)
 
-        with temp_path.open('xb') as f:
-            loop = get_running_loop()
-            await loop.run_in_executor(None, f.write, entry_bytes)
+        loop = get_running_loop()
+        await loop.run_in_executor(None, _write, self._base_dir, key, data, zstd_dict_version, expires_at)
 
-        temp_path.rename(path)
+    async def set_stream(self, key: str, chunks: AsyncIterable[bytes], *, ttl: timedelta | None) -> None:
+        """
+        Set a value in the file cache by key string, writing the chunks as they arrive.
+
+        The value becomes visible once the stream is complete.
+        """
+        async for _ in self.tee(key, chunks, ttl=ttl):
+            pass
+
+    async def tee(self, key: str, chunks: AsyncIterable[bytes], *, ttl: timedelta | None) -> AsyncIterator[bytes]:
+        """
+        Pass the chunks through, caching them as they arrive.
+
+        The value is only cached if the stream is fully consumed.
+        """
+        expires_at = int(time.time() + ttl.total_seconds()) if (ttl is not None) else None
+        loop = get_running_loop()
+        writer = await loop.run_in_executor(None, _EntryWriter, self._base_dir, key)
+        try:
+            async for chunk in chunks:
+                await loop.run_in_executor(None, writer.write, chunk)
+                yield chunk
+            await loop.run_in_executor(None, writer.commit, None, expires_at)
+        except BaseException:
+            writer.abort()
+            raise
 
     def delete(self, key: str) -> None:
         """
         Delete a key from the file cache.
         """
-        path = _get_path(self._base_dir, key)
-        path.unlink(missing_ok=True)
+        key_hash = _get_key_hash(key)
+        _get_path(self._base_dir, key_hash).unlink(missing_ok=True)
+        _get_index(self._base_dir).delete((key_hash,))
 
-    # TODO: runner, with lock
-    async def cleanup(self):
-        """
-        Cleanup the file cache, removing stale entries.
+    async def sample(self, limit: int) -> list[bytes]:
         """
-        infos: list[_CleanupInfo] = []
-        total_size: int = 0
-        limit_size: int = FILE_CACHE_SIZE_GB * 1024 * 1024 * 1024
-        now = time.time()
+        Sample up to limit decoded values from the file cache.
 
+        Used for training the compression dictionaries.
+        """
+        result: list[bytes] = []
+        loop = get_running_loop()
         for path in self._base_dir.rglob('*'):
-            key = path.name
-
+            if not path.is_file() or path.name.startswith('.'):
+                continue
+            entry = await loop.run_in_executor(None, _read_path, path)
+            if entry is None:
+                continue
+            header, data = entry
             try:
-                loop = get_running_loop()
-                entry_bytes = await loop.run_in_executor(None, path.read_bytes)
-                entry = FileCacheMeta.FromString(entry_bytes)
-            except (OSError, DecodeError):
-                logging.debug('Cache read error for %r', key)
+                result.append(
+                    ZstdDict.get_decompressor(self._context, header.zstd_dict_version).decompress(data)
+                    if header.zstd_dict_version is not None
+                    else bytes(data)
+                )
+            except (KeyError, ZstdError):
+                continue
+            if len(result) >= limit:
+                break
+        return result
+
+    async def cleanup(self) -> None:
+        """
+        Cleanup the file cache, removing expired entries and the least recently used ones over the size limit.
+
+        Only one cleanup runs at a time across processes, the cost depends on the number of removed entries.
+        """
+        loop = get_running_loop()
+        await loop.run_in_executor(None, _cleanup, self._base_dir)
+
+
+async def _cleanup_task() -> None:
+    """
+    Periodically cleanup all the file cache contexts.
+    """
+    loop = get_running_loop()
+    while True:
+        await sleep(FILE_CACHE_CLEANUP_INTERVAL.total_seconds())
+        for base_dir in FILE_CACHE_DIR.iterdir():
+            if not base_dir.is_dir():
                 continue
+            try:
+                await loop.run_in_executor(None, _cleanup, base_dir)
+            except Exception:
+                logging.warning('File cache %r cleanup failed', base_dir.name, exc_info=True)
+
+
+def _read(base_dir: Path, key: str) -> tuple[_EntryHeader, memoryview] | None:
+    key_hash = _get_key_hash(key)
+    path = _get_path(base_dir, key_hash)
+    index = _get_index(base_dir)
+    now = int(time.time())
+
+    # check time-to-live without opening the entry
+    info = index.get(key_hash)
+    if info is not None and info.expires_at is not None and info.expires_at < now:
+        logging.debug('Cache miss for %r', key)
+        path.unlink(missing_ok=True)
+        index.delete((key_hash,))
+        return None
+
+    entry = _read_path(path)
+    if entry is None:
+        logging.debug('Cache read error for %r', key)
+        if info is not None:
+            index.delete((key_hash,))
+        return None
+
+    header, data = entry
+    if header.expires_at is not None and header.expires_at < now:
+        logging.debug('Cache miss for %r', key)
+        path.unlink(missing_ok=True)
+        index.delete((key_hash,))
+        return None
+
+    if info is None:
+        # entry written before the index existed
+        index.put(key_hash, _header_struct.size + header.length, header.expires_at, now)
+    elif info.last_access < now - FILE_CACHE_ACCESS_UPDATE_INTERVAL.total_seconds():
+        index.touch(key_hash, now)
+
+    return header, data
+
+
+def _read_path(path: Path) -> tuple[_EntryHeader, memoryview] | None:
+    try:
+        with path.open('rb') as f:
+            header = _read_header(f)
+            if header is None:
+                return None
+            return header, _map_data(f, header)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_header(f: BinaryIO) -> _EntryHeader | None:
+    buffer = f.read(_header_struct.size)
+    if len(buffer) < _header_struct.size:
+        return None
+    magic, zstd_dict_version, expires_at, length, checksum = _header_struct.unpack(buffer)
+    if magic != _header_magic:
+        return None
+    return _EntryHeader(zstd_dict_version or None, expires_at or None, length, checksum)
+
+
+def _map_data(f: BinaryIO, header: _EntryHeader) -> memoryview:
+    """
+    Memory-map the entry data, verifying its length and checksum.
+    """
+    if not header.length:
+        data = memoryview(b'')
+    else:
+        # the memoryview keeps the mapping alive, it is unmapped once released
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = memoryview(mm)[_header_struct.size : _header_struct.size + header.length]
+    if len(data) != header.length or zlib.crc32(data) != header.checksum:
+        raise ValueError('Corrupted entry data')
+    return data
+
+
+class _EntryWriter:
+    """
+    Write an entry to a temporary file, making it visible on commit.
+    """
+
+    __slots__ = ('_base_dir', '_checksum', '_file', '_key_hash', '_length', '_path', '_temp_path')
+
+    def __init__(self, base_dir: Path, key: str):
+        self._base_dir = base_dir
+        self._key_hash = _get_key_hash(key)
+        self._path = _get_path(base_dir, self._key_hash)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._temp_path = self._path.with_name(f'.{buffered_randbytes(16).hex()}.tmp')
+        self._file = self._temp_path.open('xb')
+        self._file.write(bytes(_header_struct.size))  # written on commit
+        self._length = 0
+        self._checksum = 0
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._length += len(chunk)
+        self._checksum = zlib.crc32(chunk, self._checksum)
+
+    def commit(self, zstd_dict_version: int | None, expires_at: int | None) -> None:
+        self._file.seek(0)
+        self._file.write(
+            _header_struct.pack(_header_magic, zstd_dict_version or 0, expires_at or 0, self._length, self._checksum)
+        )
+        self._file.close()
+        self._temp_path.rename(self._path)
+        size = _header_struct.size + self._length
+        _get_index(self._base_dir).put(self._key_hash, size, expires_at, int(time.time()))
+
+    def abort(self) -> None:
+        self._file.close()
+        self._temp_path.unlink(missing_ok=True)
+
 
-            if entry.HasField('expires_at'):
-                if entry.expires_at < now:
-                    logging.debug('Cache cleanup for %r (reason: time)', key)
-                    path.unlink(missing_ok=True)
-                    continue
-                expires_at = entry.expires_at
-            else:
-                expires_at = float('inf')
-
-            size = path.stat().st_size
-            infos.append(_CleanupInfo(expires_at, size, path))
-            total_size += size
-
-        logging.debug('File cache usage is %s of %s', sizestr(total_size), sizestr(limit_size))
-        if total_size <= limit_size:
+def _write(base_dir: Path, key: str, data: bytes, zstd_dict_version: int | None, expires_at: int | None) -> None:
+    writer = _EntryWriter(base_dir, key)
+    try:
+        writer.write(data)
+        writer.commit(zstd_dict_version, expires_at)
+    except BaseException:
+        writer.abort()
+        raise
+
+
+def _cleanup(base_dir: Path) -> None:
+    base_dir.mkdir(parents=True, exist_ok=True)
+    with base_dir.joinpath('.cleanup.lock').open('ab') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logging.debug('File cache %r cleanup is already running', base_dir.name)
             return
 
-        # prioritize cleanup of entries closer to expiration (iterating in reverse)
-        infos.sort(key=lambda info: info.expires_at, reverse=True)
+        index = _get_index(base_dir)
+        if not index.is_imported():
+            _import(base_dir, index)
+
+        now = int(time.time())
+        while keys := index.get_expired(now, FILE_CACHE_CLEANUP_BATCH_SIZE):
+            logging.debug('Cache cleanup of %d entries (reason: time)', len(keys))
+            _evict(base_dir, index, keys)
+
+        total_size = index.get_total_size()
+        limit_size: int = FILE_CACHE_SIZE_GB * 1024 * 1024 * 1024
+        logging.debug('File cache %r usage is %s of %s', base_dir.name, sizestr(total_size), sizestr(limit_size))
 
         while total_size > limit_size:
-            info = infos.pop()
-            key = info.path.name
-            logging.debug('Cache cleanup for %r (reason: size)', key)
-            info.path.unlink(missing_ok=True)
-            total_size -= info.size
+            rows = index.get_least_recent(FILE_CACHE_CLEANUP_BATCH_SIZE)
+            if not rows:
+                break
+            keys: list[str] = []
+            for key_hash, size in rows:
+                keys.append(key_hash)
+                total_size -= size
+                if total_size <= limit_size:
+                    break
+            logging.debug('Cache cleanup of %d entries (reason: size)', len(keys))
+            _evict(base_dir, index, keys)
+
+
+def _evict(base_dir: Path, index: _Index, keys: list[str]) -> None:
+    for key_hash in keys:
+        _get_path(base_dir, key_hash).unlink(missing_ok=True)
+    index.delete(keys)
+
+
+def _import(base_dir: Path, index: _Index) -> None:
+    """
+    Index the entries written before the index existed, once.
+    """
+    logging.info('Indexing file cache %r', base_dir.name)
+    now = int(time.time())
+    for path in base_dir.rglob('*'):
+        if not path.is_file() or path.name.startswith('.'):
+            continue
+        # only the header is read
+        try:
+            with path.open('rb') as f:
+                header = _read_header(f)
+        except OSError:
+            continue
+        if header is None:
+            path.unlink(missing_ok=True)
+            continue
+        index.put(path.name, _header_struct.size + header.length, header.expires_at, now)
+    index.set_imported()
+
+
+@cache
+def _get_index(base_dir: Path) -> _Index:
+    base_dir.mkdir(parents=True, exist_ok=True)
+    return _Index(base_dir.joinpath('.index.sqlite'))
 
 
 @lru_cache(maxsize=1024)
-def _get_path(base_dir: Path, key_str: str) -> Path:
+def _get_key_hash(key_str: str) -> str:
+    return hash_hex(key_str)
+
+
+def _get_path(base_dir: Path, key_hash: str) -> Path:
     """
-    Get the path to a file in the file cache by key string.
+    Get the path to a file in the file cache by key hash.
 
-    >>> _get_path(Path('context'), 'file_key')
+    >>> _get_path(Path('context'), '468e5f...')
     Path('.../context/46/8e/468e5f...')
     """
-    key: str = hash_hex(key_str)
-    return base_dir.joinpath(key[:2], key[2:4], key)
+    return base_dir.joinpath(key_hash[:2], key_hash[2:4], key_hash)
@@ -1,4 +1,6 @@
 import cython
+import numpy as np
+from numpy.typing import NDArray
 from shapely import MultiPolygon, Point, Polygon, box, get_coordinates
 
 from app.lib.exceptions_context import raise_for
@@ -36,6 +38,35 @@ def radians_to_meters(radians: float) -> float:
     return radians * 6371000  # R
 
 
+def hilbert_key(lons: NDArray[np.float64], lats: NDArray[np.float64], *, order: int = 16) -> NDArray[np.int64]:
+    """
+    Get the Hilbert curve index of the coordinates, on a 2^order x 2^order grid over the world.
+
+    Nearby coordinates are likely to have nearby keys.
+
+    >>> hilbert_key(np.array([-180, 179.9]), np.array([-90, -90]), order=1).tolist()
+    [0, 3]
+    """
+    n = 1 << order
+    x = ((lons + 180) * (n / 360)).astype(np.int64).clip(0, n - 1)
+    y = ((lats + 90) * (n / 180)).astype(np.int64).clip(0, n - 1)
+    result = np.zeros(len(x), np.int64)
+
+    s = n >> 1
+    while s:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        result += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant
+        flip = rx & ~ry
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s >>= 1
+
+    return result
+
+
 def haversine_distance(p1: Point, p2: Point) -> float:
     """
     Calculate the distance between two points on the Earth's surface using the Haversine formula.
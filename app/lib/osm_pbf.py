@@ -0,0 +1,157 @@
+import struct
+import zlib
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+import cython
+
+from app.config import GENERATOR
+from app.limits import EXPORT_PBF_COMPRESS_ZLIB_LEVEL
+from app.models.element import ElementType
+from app.models.osmpbf_pb2 import (
+    Blob,
+    BlobHeader,
+    DenseNodes,
+    HeaderBlock,
+    PrimitiveBlock,
+    Relation,
+    Way,
+)
+from app.utils import JSON_DECODE
+
+# row layout: [id, version, visible, changeset_id, timestamp, user_id, display_name, tags, lon, lat, members]
+PBFRow = Sequence[Any]
+
+_member_types = {
+    'node': Relation.NODE,
+    'way': Relation.WAY,
+    'relation': Relation.RELATION,
+}
+
+
+class OSMPBF:
+    @staticmethod
+    def encode_header(*, bounds: tuple[float, float, float, float] | None, history: bool) -> bytes:
+        """
+        Encode the OSMHeader file block.
+
+        Bounds are (min_lon, min_lat, max_lon, max_lat).
+        """
+        header = HeaderBlock(
+            required_features=('OsmSchema-V0.6', 'DenseNodes', *(('HistoricalInformation',) if history else ())),
+            writingprogram=GENERATOR,
+        )
+        if bounds is not None:
+            header.bbox.left = round(bounds[0] * 1e9)
+            header.bbox.bottom = round(bounds[1] * 1e9)
+            header.bbox.right = round(bounds[2] * 1e9)
+            header.bbox.top = round(bounds[3] * 1e9)
+        return _encode_file_block('OSMHeader', header.SerializeToString())
+
+    @staticmethod
+    def encode_block(type: ElementType, lines: Iterable[bytes], *, history: bool) -> bytes:
+        """
+        Encode an OSMData file block with elements of a single type.
+
+        The lines are JSON rows, as produced by COPY ... TO STDOUT in the text format.
+        """
+        # COPY text format escapes backslashes, JSON has no raw control characters
+        rows: list[PBFRow] = [JSON_DECODE(line.replace(b'\\\\', b'\\')) for line in lines]
+        strings: dict[str, int] = {'': 0}
+        block = PrimitiveBlock()
+        group = block.primitivegroup.add()
+
+        if type == 'node':
+            _encode_dense_nodes(group.dense, rows, strings, history)
+        elif type == 'way':
+            for row in rows:
+                way = group.ways.add()
+                _encode_element(way, row, strings, history)
+                way.refs.extend(_delta(member[1] for member in row[10]))
+        elif type == 'relation':
+            for row in rows:
+                relation = group.relations.add()
+                _encode_element(relation, row, strings, history)
+                members = row[10]
+                relation.roles_sid.extend(_string_id(strings, member[2]) for member in members)
+                relation.memids.extend(_delta(member[1] for member in members))
+                relation.types.extend(_member_types[member[0]] for member in members)
+        else:
+            raise NotImplementedError(f'Unsupported element type {type!r}')
+
+        block.stringtable.s.extend(s.encode() for s in strings)
+        return _encode_file_block('OSMData', block.SerializeToString())
+
+
+@cython.cfunc
+def _encode_file_block(type: str, data: bytes) -> bytes:
+    """
+    Encode a file block: header length, BlobHeader, zlib-compressed Blob.
+    """
+    blob = Blob(raw_size=len(data), zlib_data=zlib.compress(data, EXPORT_PBF_COMPRESS_ZLIB_LEVEL)).SerializeToString()
+    header = BlobHeader(type=type, datasize=len(blob)).SerializeToString()
+    return struct.pack('>I', len(header)) + header + blob
+
+
+@cython.cfunc
+def _string_id(strings: dict[str, int], s: str) -> int:
+    result = strings.get(s)
+    if result is None:
+        result = strings[s] = len(strings)
+    return result
+
+
+def _delta(values: Iterable[int]) -> list[int]:
+    """
+    Delta-encode the values.
+
+    >>> _delta([5, 7, 6])
+    [5, 2, -1]
+    """
+    result: list[int] = []
+    prev: cython.longlong = 0
+    for value in values:
+        result.append(value - prev)
+        prev = value
+    return result
+
+
+@cython.cfunc
+def _encode_element(message: Way | Relation, row: PBFRow, strings: dict[str, int], history: cython.char) -> None:
+    message.id = row[0]
+    tags: dict[str, str] = row[7]
+    message.keys.extend(_string_id(strings, k) for k in tags)
+    message.vals.extend(_string_id(strings, v) for v in tags.values())
+    info = message.info
+    info.version = row[1]
+    info.timestamp = row[4]
+    info.changeset = row[3]
+    info.uid = row[5] or 0
+    info.user_sid = _string_id(strings, row[6] or '')
+    if history:
+        info.visible = row[2]
+
+
+@cython.cfunc
+def _encode_dense_nodes(dense: DenseNodes, rows: list[PBFRow], strings: dict[str, int], history: cython.char) -> None:
+    dense.id.extend(_delta(row[0] for row in rows))
+    # deleted nodes have no location, encode them at 0,0
+    dense.lat.extend(_delta(round(row[9] * 1e7) if row[9] is not None else 0 for row in rows))
+    dense.lon.extend(_delta(round(row[8] * 1e7) if row[8] is not None else 0 for row in rows))
+
+    info = dense.denseinfo
+    info.version.extend(row[1] for row in rows)
+    info.timestamp.extend(_delta(row[4] for row in rows))
+    info.changeset.extend(_delta(row[3] for row in rows))
+    info.uid.extend(_delta(row[5] or 0 for row in rows))
+    info.user_sid.extend(_delta(_string_id(strings, row[6] or '') for row in rows))
+    if history:
+        info.visible.extend(row[2] for row in rows)
+
+    keys_vals: list[int] = []
+    for row in rows:
+        for k, v in row[7].items():
+            keys_vals.append(_string_id(strings, k))
+            keys_vals.append(_string_id(strings, v))
+        keys_vals.append(0)
+    dense.keys_vals.extend(keys_vals)
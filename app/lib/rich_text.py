@@ -1,6 +1,5 @@
 import logging
 import tomllib
-from asyncio import TaskGroup
 from collections.abc import Sequence
 from enum import Enum
 from html import escape
@@ -16,7 +15,7 @@ from sqlalchemy import update
 
 from app.db import db_commit
 from app.limits import RICH_TEXT_CACHE_EXPIRE
-from app.services.cache_service import CacheContext, CacheEntry, CacheService
+from app.services.cache_service import CacheContext, CacheEntry, CacheRequest, CacheService
 
 
 class TextFormat(str, Enum):
@@ -57,27 +56,13 @@ async def rich_text(text: str, cache_id: bytes | None, text_format: TextFormat)
 
     If cache_id is provided, it will be used to accelerate cache lookup.
     """
-    cache_context = CacheContext(f'RichText:{text_format.value}')
-
-    async def factory() -> bytes:
-        return process_rich_text(text, text_format).encode()
-
-    # accelerate cache lookup by id if available
-    if cache_id is not None:
-        return await CacheService.get(
-            cache_id,
-            cache_context,
-            factory,
-            ttl=RICH_TEXT_CACHE_EXPIRE,
-        )
-    else:
-        return await CacheService.get(
-            text,
-            cache_context,
-            factory,
-            hash_key=True,
+    return (
+        await CacheService.get_many(
+            (_rich_text_request(text, cache_id, text_format),),
             ttl=RICH_TEXT_CACHE_EXPIRE,
+            local=True,
         )
+    )[0]
 
 
 class RichTextMixin:
@@ -86,6 +71,8 @@ class RichTextMixin:
     async def resolve_rich_text(self) -> None:
         """
         Resolve rich text fields.
+
+        All unresolved fields are fetched from the cache together.
         """
         fields = self.__rich_text_fields__
         num_fields: int = len(fields)
@@ -93,44 +80,73 @@ class RichTextMixin:
             logging.warning('%s has not defined rich text fields', type(self).__qualname__)
             return
 
-        logging.debug('Resolving %d rich text fields', num_fields)
-        async with TaskGroup() as tg:
-            for field_name, text_format in fields:
-                tg.create_task(self._resolve_rich_text_task(field_name, text_format))
-
-    async def _resolve_rich_text_task(self, field_name: str, text_format: TextFormat) -> None:
-        rich_field_name = field_name + '_rich'
-        rich_hash_field_name = field_name + '_rich_hash'
-
         # skip if already resolved
-        if getattr(self, rich_field_name) is not None:
+        fields = tuple(
+            (field_name, text_format)
+            for field_name, text_format in fields
+            if getattr(self, field_name + '_rich') is None
+        )
+        if not fields:
             return
 
-        text = getattr(self, field_name)
-        text_rich_hash: bytes | None = getattr(self, rich_hash_field_name)
-        cache_entry = await rich_text(text, text_rich_hash, text_format)
-        cache_entry_id: bytes = cache_entry.id
+        logging.debug('Resolving %d rich text fields', len(fields))
+        cache_entries = await CacheService.get_many(
+            tuple(
+                _rich_text_request(
+                    getattr(self, field_name),
+                    getattr(self, field_name + '_rich_hash'),
+                    text_format,
+                )
+                for field_name, text_format in fields
+            ),
+            ttl=RICH_TEXT_CACHE_EXPIRE,
+            local=True,
+        )
+
+        changed_hashes: list[tuple[str, bytes | None, bytes]] = []
+        for (field_name, _), cache_entry in zip(fields, cache_entries, strict=True):
+            rich_hash_field_name = field_name + '_rich_hash'
+            text_rich_hash: bytes | None = getattr(self, rich_hash_field_name)
+            cache_entry_id: bytes = cache_entry.id
+
+            # assign new hash if changed
+            if text_rich_hash != cache_entry_id:
+                changed_hashes.append((rich_hash_field_name, text_rich_hash, cache_entry_id))
 
-        # assign new hash if changed
-        if text_rich_hash != cache_entry_id:
+            # assign value to instance
+            setattr(self, field_name + '_rich', cache_entry.value.decode())
+
+        if changed_hashes:
+            cls = type(self)
             async with db_commit() as session:
-                cls = type(self)
-                stmt = (
-                    update(cls)
-                    .where(
-                        cls.id == self.id,  # pyright: ignore[reportAttributeAccessIssue]
-                        getattr(cls, rich_hash_field_name) == text_rich_hash,
+                for rich_hash_field_name, text_rich_hash, cache_entry_id in changed_hashes:
+                    stmt = (
+                        update(cls)
+                        .where(
+                            cls.id == self.id,  # pyright: ignore[reportAttributeAccessIssue]
+                            getattr(cls, rich_hash_field_name) == text_rich_hash,
+                        )
+                        .values({rich_hash_field_name: cache_entry_id})
+                        .inline()
                     )
-                    .values({rich_hash_field_name: cache_entry_id})
-                    .inline()
-                )
-                await session.execute(stmt)
+                    await session.execute(stmt)
 
-            logging.debug('Rich text field %r hash was changed', field_name)
-            setattr(self, rich_hash_field_name, cache_entry_id)
+            for rich_hash_field_name, _, cache_entry_id in changed_hashes:
+                logging.debug('Rich text field %r hash was changed', rich_hash_field_name)
+                setattr(self, rich_hash_field_name, cache_entry_id)
 
-        # assign value to instance
-        setattr(self, rich_field_name, cache_entry.value.decode())
+
+def _rich_text_request(text: str, cache_id: bytes | None, text_format: TextFormat) -> CacheRequest:
+    cache_context = CacheContext(f'RichText:{text_format.value}')
+
+    async def factory() -> bytes:
+        return process_rich_text(text, text_format).encode()
+
+    # accelerate cache lookup by id if available
+    if cache_id is not None:
+        return CacheRequest(cache_id, cache_context, factory)
+    else:
+        return CacheRequest(text, cache_context, factory, hash_key=True)
 
 
 @cython.cfunc
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterable, AsyncIterator
 
 from app.lib.buffered_random import buffered_rand_urlsafe
 from app.limits import STORAGE_KEY_MAX_LENGTH
@@ -24,18 +25,48 @@ class StorageBase(ABC):
         return StorageKey(key)
 
     @abstractmethod
-    async def load(self, key: StorageKey) -> bytes:
+    async def load(self, key: StorageKey) -> bytes | memoryview:
         """
         Load a file from storage by key.
+
+        Cached backends may return a memory-mapped buffer.
         """
         ...
 
+    def load_stream(self, key: StorageKey) -> AsyncIterator[bytes | memoryview]:
+        """
+        Load a file from storage by key, in chunks.
+
+        Cached backends may yield memory-mapped buffers.
+        """
+        raise NotImplementedError
+
     async def save(self, data: bytes, suffix: str) -> StorageKey:
         """
         Save a file to storage and return its key.
         """
         raise NotImplementedError
 
+    async def put(self, key: StorageKey, data: bytes) -> None:
+        """
+        Save a file to storage under the given key, atomically replacing any existing file.
+        """
+        raise NotImplementedError
+
+    async def save_stream(self, chunks: AsyncIterable[bytes], suffix: str) -> StorageKey:
+        """
+        Save a file to storage from chunks and return its key.
+        """
+        key = self._make_key(suffix)
+        await self.put_stream(key, chunks)
+        return key
+
+    async def put_stream(self, key: StorageKey, chunks: AsyncIterable[bytes]) -> None:
+        """
+        Save a file to storage from chunks under the given key, atomically replacing any existing file.
+        """
+        raise NotImplementedError
+
     async def delete(self, key: StorageKey) -> None:
         """
         Delete a key from storage.
@@ -24,7 +24,7 @@ class GravatarStorage(StorageBase):
         self._fc = FileCache(context)
 
     @override
-    async def load(self, key: str) -> bytes:
+    async def load(self, key: str) -> bytes | memoryview:
         """
         Load an avatar from Gravatar by email.
         """
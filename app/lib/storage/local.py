@@ -1,4 +1,5 @@
 from asyncio import get_running_loop
+from collections.abc import AsyncIterable, AsyncIterator
 from functools import lru_cache
 from pathlib import Path
 from typing import override
@@ -6,6 +7,7 @@ from typing import override
 from app.config import FILE_STORE_DIR
 from app.lib.buffered_random import buffered_randbytes
 from app.lib.storage.base import StorageBase
+from app.limits import STORAGE_STREAM_CHUNK_SIZE
 from app.models.types import StorageKey
 
 
@@ -26,9 +28,22 @@ class LocalStorage(StorageBase):
         loop = get_running_loop()
         return await loop.run_in_executor(None, path.read_bytes)
 
+    @override
+    async def load_stream(self, key: StorageKey) -> AsyncIterator[bytes | memoryview]:
+        path = _get_path(self._base_dir, key)
+        loop = get_running_loop()
+        with await loop.run_in_executor(None, path.open, 'rb') as f:
+            while chunk := await loop.run_in_executor(None, f.read, STORAGE_STREAM_CHUNK_SIZE):
+                yield chunk
+
     @override
     async def save(self, data: bytes, suffix: str) -> StorageKey:
         key = self._make_key(suffix)
+        await self.put(key, data)
+        return key
+
+    @override
+    async def put(self, key: StorageKey, data: bytes) -> None:
         path = _get_path(self._base_dir, key)
         path.parent.mkdir(parents=True, exist_ok=True)
 
@@ -39,8 +54,26 @@ class LocalStorage(StorageBase):
             loop = get_running_loop()
             await loop.run_in_executor(None, f.write, data)
 
-        temp_path.rename(path)
-        return key
+        temp_path.replace(path)
+
+    @override
+    async def put_stream(self, key: StorageKey, chunks: AsyncIterable[bytes]) -> None:
+        path = _get_path(self._base_dir, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        temp_name = f'.{buffered_randbytes(16).hex()}.tmp'
+        temp_path = path.with_name(temp_name)
+
+        try:
+            with temp_path.open('xb') as f:
+                loop = get_running_loop()
+                async for chunk in chunks:
+                    await loop.run_in_executor(None, f.write, chunk)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        temp_path.replace(path)
 
     @override
     async def delete(self, key: StorageKey) -> None:
@@ -1,10 +1,11 @@
+from collections.abc import AsyncIterable, AsyncIterator
 from typing import override
 
 import aioboto3
 
 from app.lib.file_cache import FileCache
 from app.lib.storage.base import StorageBase
-from app.limits import S3_CACHE_EXPIRE
+from app.limits import S3_CACHE_EXPIRE, S3_MULTIPART_PART_SIZE, STORAGE_STREAM_CHUNK_SIZE
 from app.models.types import StorageKey
 
 _s3 = aioboto3.Session()
@@ -24,7 +25,7 @@ class S3Storage(StorageBase):
         self._fc = FileCache(context)
 
     @override
-    async def load(self, key: StorageKey) -> bytes:
+    async def load(self, key: StorageKey) -> bytes | memoryview:
         if (data := await self._fc.get(key)) is not None:
             return data
 
@@ -34,14 +35,75 @@ class S3Storage(StorageBase):
         await self._fc.set(key, data, ttl=S3_CACHE_EXPIRE)
         return data
 
+    @override
+    async def load_stream(self, key: StorageKey) -> AsyncIterator[bytes | memoryview]:
+        if (data := await self._fc.get(key)) is not None:
+            for i in range(0, len(data), STORAGE_STREAM_CHUNK_SIZE):
+                yield data[i : i + STORAGE_STREAM_CHUNK_SIZE]
+            return
+
+        async for chunk in self._fc.tee(key, _get_object_stream(self._context, key), ttl=S3_CACHE_EXPIRE):
+            yield chunk
+
     @override
     async def save(self, data: bytes, suffix: str) -> StorageKey:
         key = self._make_key(suffix)
+        await self.put(key, data)
+        return key
 
+    @override
+    async def put(self, key: StorageKey, data: bytes) -> None:
         async with _s3.client('s3') as s3:
             await s3.put_object(Bucket=self._context, Key=key, Body=data)
 
-        return key
+        self._fc.delete(key)
+
+    @override
+    async def put_stream(self, key: StorageKey, chunks: AsyncIterable[bytes]) -> None:
+        async with _s3.client('s3') as s3:
+            upload_id: str | None = None
+            parts: list[dict] = []
+            buffer = bytearray()
+
+            async def upload_part() -> None:
+                nonlocal upload_id
+                if upload_id is None:
+                    upload_id = (await s3.create_multipart_upload(Bucket=self._context, Key=key))['UploadId']
+                part_number = len(parts) + 1
+                response = await s3.upload_part(
+                    Bucket=self._context,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=bytes(buffer),
+                )
+                parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+                buffer.clear()
+
+            try:
+                async for chunk in chunks:
+                    buffer += chunk
+                    if len(buffer) >= S3_MULTIPART_PART_SIZE:
+                        await upload_part()
+
+                if upload_id is None:
+                    # small file, a single request is enough
+                    await s3.put_object(Bucket=self._context, Key=key, Body=bytes(buffer))
+                else:
+                    if buffer:
+                        await upload_part()
+                    await s3.complete_multipart_upload(
+                        Bucket=self._context,
+                        Key=key,
+                        UploadId=upload_id,
+                        MultipartUpload={'Parts': parts},
+                    )
+            except BaseException:
+                if upload_id is not None:
+                    await s3.abort_multipart_upload(Bucket=self._context, Key=key, UploadId=upload_id)
+                raise
+
+        self._fc.delete(key)
 
     @override
     async def delete(self, key: StorageKey) -> None:
@@ -49,3 +111,10 @@ class S3Storage(StorageBase):
             await s3.delete_object(Bucket=self._context, Key=key)
 
         self._fc.delete(key)
+
+
+async def _get_object_stream(bucket: str, key: StorageKey) -> AsyncIterator[bytes]:
+    async with _s3.client('s3') as s3:
+        body = (await s3.get_object(Bucket=bucket, Key=key))['Body']
+        async for chunk in body.iter_chunks(STORAGE_STREAM_CHUNK_SIZE):
+            yield chunk
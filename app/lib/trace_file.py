@@ -4,7 +4,7 @@ import logging
 import tarfile
 import zipfile
 from abc import ABC, abstractmethod
-from collections.abc import Collection
+from collections.abc import AsyncIterable, AsyncIterator, Collection
 from io import BytesIO
 from typing import ClassVar, override
 
@@ -64,7 +64,16 @@ class TraceFile:
         return _ZstdProcessor.compress(buffer), _ZstdProcessor.suffix
 
     @staticmethod
-    def decompress_if_needed(buffer: bytes, file_id: str) -> bytes:
+    def compress_stream(chunks: AsyncIterable[bytes]) -> tuple[AsyncIterator[bytes], str]:
+        """
+        Compress the trace file chunks.
+
+        Returns the compressed chunks and the file name suffix.
+        """
+        return _ZstdProcessor.compress_stream(chunks), _ZstdProcessor.suffix
+
+    @staticmethod
+    def decompress_if_needed(buffer: bytes | memoryview, file_id: str) -> bytes | memoryview:
         """
         Decompress the trace file buffer if needed.
         """
@@ -73,6 +82,19 @@ class TraceFile:
 
         return buffer
 
+    @staticmethod
+    def decompress_stream_if_needed(
+        chunks: AsyncIterable[bytes | memoryview],
+        file_id: str,
+    ) -> AsyncIterable[bytes | memoryview]:
+        """
+        Decompress the trace file chunks if needed.
+        """
+        if file_id.endswith(_ZstdProcessor.suffix):
+            return _ZstdProcessor.decompress_stream(chunks)
+
+        return chunks
+
 
 class _TraceProcessor(ABC):
     media_type: ClassVar[str]
@@ -215,6 +237,24 @@ class _ZstdProcessor(_TraceProcessor):
         logging.debug('Trace %r archive compressed size is %s', cls.media_type, sizestr(len(result)))
         return result
 
+    @classmethod
+    async def compress_stream(cls, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        compressobj = ZstdCompressor(
+            level=TRACE_FILE_COMPRESS_ZSTD_LEVEL,
+            threads=TRACE_FILE_COMPRESS_ZSTD_THREADS,
+        ).compressobj()
+        async for chunk in chunks:
+            if result := compressobj.compress(chunk):
+                yield result
+        yield compressobj.flush()
+
+    @classmethod
+    async def decompress_stream(cls, chunks: AsyncIterable[bytes | memoryview]) -> AsyncIterator[bytes]:
+        decompressobj = ZstdDecompressor().decompressobj()
+        async for chunk in chunks:
+            if result := decompressobj.decompress(chunk):
+                yield result
+
 
 _trace_processors: dict[str, type[_TraceProcessor]] = {
     processor.media_type: processor
@@ -0,0 +1,38 @@
+import numpy as np
+from numpy.typing import NDArray
+
+from app.lib.mercator import mercator
+from app.limits import TRACE_PREVIEW_MAX_POINTS, TRACE_PREVIEW_RESOLUTION
+
+_preview_dtype = np.dtype('<i2')
+
+
+class TracePreview:
+    @staticmethod
+    def encode(coords: NDArray[np.float64]) -> bytes:
+        """
+        Encode the downsampled trace coordinates as packed int16 (x, y) pixel pairs.
+
+        >>> TracePreview.encode(np.array([[0, 0], [1, 1]]))
+        b'\\x00\\x00d\\x00c\\x00\\x00\\x00'
+        """
+        size = len(coords)
+        if size < 2:
+            return b''
+        if size > TRACE_PREVIEW_MAX_POINTS:
+            indices = np.round(np.linspace(0, size - 1, TRACE_PREVIEW_MAX_POINTS)).astype(np.intp)
+            coords = coords[indices]
+        pixels = mercator(coords, TRACE_PREVIEW_RESOLUTION, TRACE_PREVIEW_RESOLUTION).astype(_preview_dtype)
+        return pixels.tobytes()
+
+    @staticmethod
+    def decode(preview: bytes | None) -> list[int]:
+        """
+        Decode the trace preview into a flat list of pixel coordinates.
+
+        >>> TracePreview.decode(b'\\x00\\x00d\\x00d\\x00\\x00\\x00')
+        [0, 100, 100, 0]
+        """
+        if not preview:
+            return []
+        return np.frombuffer(preview, _preview_dtype).tolist()
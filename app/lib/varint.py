@@ -0,0 +1,85 @@
+import cython
+import numpy as np
+
+
+def zigzag_encode(values: np.ndarray) -> np.ndarray:
+    """
+    Map signed integers to unsigned integers, so that small magnitudes have small values.
+
+    >>> zigzag_encode(np.array([0, -1, 1, -2]))
+    array([0, 1, 2, 3], dtype=uint64)
+    """
+    values = values.astype(np.int64, copy=False)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def zigzag_decode(values: np.ndarray) -> np.ndarray:
+    """
+    Reverse zigzag_encode.
+
+    >>> zigzag_decode(np.array([0, 1, 2, 3], np.uint64))
+    array([ 0, -1,  1, -2])
+    """
+    values = values.astype(np.uint64, copy=False)
+    return ((values >> np.uint64(1)).view(np.int64)) ^ -((values & np.uint64(1)).view(np.int64))
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """
+    Encode unsigned integers as concatenated LEB128 varints.
+
+    >>> encode_varints(np.array([1, 300]))
+    b'\\x01\\xac\\x02'
+    """
+    values = values.astype(np.uint64, copy=True)
+    if not values.size:
+        return b''
+
+    # number of 7-bit groups per value
+    lengths = np.ones(values.shape, np.int64)
+    remaining = values >> np.uint64(7)
+    while remaining.any():
+        lengths += remaining != 0
+        remaining >>= np.uint64(7)
+
+    result = np.empty(int(lengths.sum()), np.uint8)
+    offsets = np.cumsum(lengths) - lengths
+    max_length: cython.int = int(lengths.max())
+    i: cython.int
+    for i in range(max_length):
+        active = lengths > i
+        group = (values[active] & np.uint64(0x7F)).astype(np.uint8)
+        continuation = (lengths[active] > i + 1).astype(np.uint8) << 7
+        result[offsets[active] + i] = group | continuation
+        values >>= np.uint64(7)
+    return result.tobytes()
+
+
+def decode_varints(data: bytes) -> np.ndarray:
+    """
+    Decode concatenated LEB128 varints.
+
+    >>> decode_varints(b'\\x01\\xac\\x02')
+    array([  1, 300], dtype=uint64)
+    """
+    buffer = np.frombuffer(data, np.uint8)
+    if not buffer.size:
+        return np.empty(0, np.uint64)
+    if buffer[-1] & 0x80:
+        raise ValueError('Truncated varint data')
+
+    # each value ends at a byte without the continuation bit
+    ends = np.flatnonzero((buffer & 0x80) == 0)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+
+    groups = (buffer & 0x7F).astype(np.uint64)
+    result = np.zeros(ends.shape, np.uint64)
+    max_length: cython.int = int(lengths.max())
+    i: cython.int
+    for i in range(max_length):
+        active = lengths > i
+        result[active] |= groups[starts[active] + i] << np.uint64(7 * i)
+    return result
@@ -1,6 +1,7 @@
 import logging
-from collections.abc import Callable, Sequence
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable, Sequence
 from datetime import UTC, datetime
+from io import BytesIO
 from typing import Any, Literal, Protocol, overload
 
 import cython
@@ -70,6 +71,49 @@ class XMLToDict:
         else:
             return result.decode()
 
+    @staticmethod
+    async def unparse_stream(
+        root_k: str,
+        root_v: dict[str, Any],
+        items: AsyncIterable[Iterable[tuple[str, Any]]],
+    ) -> AsyncIterator[bytes]:
+        """
+        Unparse dict to XML string, incrementally.
+
+        The root element is unparsed from root_v, followed by the streamed (key, value) items.
+        Each chunk of items is flushed as soon as it's unparsed.
+        """
+        buffer = BytesIO()
+        size: cython.Py_ssize_t = 0
+
+        with ET.xmlfile(buffer, encoding='UTF-8') as xf:
+            xf.write_declaration()
+            attrib = {k[1:]: _to_string(v) for k, v in root_v.items() if k and k[0] == '@'}
+            with xf.element(root_k, attrib):
+                for k, v in root_v.items():
+                    if not k or k[0] != '@':
+                        for element in _unparse_element(k, v):
+                            xf.write(element)
+                xf.flush()
+                if data := _drain_buffer(buffer):
+                    size += len(data)
+                    yield data
+
+                async for chunk in items:
+                    for k, v in chunk:
+                        for element in _unparse_element(k, v):
+                            xf.write(element)
+                    xf.flush()
+                    if data := _drain_buffer(buffer):
+                        size += len(data)
+                        yield data
+
+        if data := _drain_buffer(buffer):
+            size += len(data)
+            yield data
+
+        logging.debug('Unparsed %s XML stream', sizestr(size))
+
 
 @cython.cfunc
 def _parse_element(element: ET._Element):
@@ -276,6 +320,14 @@ def _to_string(v: Any) -> str:
         return str(v)
 
 
+@cython.cfunc
+def _drain_buffer(buffer: BytesIO) -> bytes:
+    result = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return result
+
+
 @cython.cfunc
 def _strip_namespace(tag: str) -> str:
     return tag.rpartition('}')[2]
@@ -0,0 +1,91 @@
+import logging
+from functools import cache
+from pathlib import Path
+
+import cython
+from zstandard import ZstdCompressionDict, ZstdCompressor, ZstdDecompressor
+
+from app.config import ZSTD_DICT_DIR
+
+# versions are stored in a single marker byte by the users
+ZSTD_DICT_MAX_VERSION = 126
+
+
+class ZstdDict:
+    @staticmethod
+    def get_compressor(context: str, *, level: int) -> tuple[int, ZstdCompressor] | None:
+        """
+        Get the latest dictionary version and its compressor for the context.
+
+        Returns None if the context has no dictionary.
+        """
+        versions = _load_dicts().get(context)
+        if not versions:
+            return None
+        version = max(versions)
+        return version, _get_compressor(context, version, level)
+
+    @staticmethod
+    def get_decompressor(context: str, version: int) -> ZstdDecompressor:
+        """
+        Get the decompressor for the context dictionary version.
+
+        Raises KeyError if the dictionary is not available.
+        """
+        return _get_decompressor(context, version)
+
+    @staticmethod
+    def get_path(context: str, version: int) -> Path:
+        """
+        Get the dictionary file path.
+        """
+        return ZSTD_DICT_DIR.joinpath(f'{_escape_context(context)}.{version}.zdict')
+
+    @staticmethod
+    def get_versions(context: str) -> list[int]:
+        """
+        Get the available dictionary versions for the context, from the disk.
+        """
+        return sorted(
+            int(path.name.rsplit('.', 2)[1])  #
+            for path in ZSTD_DICT_DIR.glob(f'{_escape_context(context)}.*.zdict')
+        )
+
+
+@cache
+def _load_dicts() -> dict[str, dict[int, ZstdCompressionDict]]:
+    """
+    Load all the dictionaries from the disk, once per process.
+    """
+    result: dict[str, dict[int, ZstdCompressionDict]] = {}
+    for path in ZSTD_DICT_DIR.glob('*.zdict'):
+        escaped_context, version_str, _ = path.name.rsplit('.', 2)
+        context = _unescape_context(escaped_context)
+        version = int(version_str)
+        if not 1 <= version <= ZSTD_DICT_MAX_VERSION:
+            logging.warning('Ignoring zstd dictionary %r with invalid version', path.name)
+            continue
+        result.setdefault(context, {})[version] = ZstdCompressionDict(path.read_bytes())
+    if result:
+        logging.info('Loaded zstd dictionaries for %d contexts', len(result))
+    return result
+
+
+@cache
+def _get_compressor(context: str, version: int, level: int) -> ZstdCompressor:
+    return ZstdCompressor(level=level, dict_data=_load_dicts()[context][version])
+
+
+@cache
+def _get_decompressor(context: str, version: int) -> ZstdDecompressor:
+    return ZstdDecompressor(dict_data=_load_dicts()[context][version])
+
+
+@cython.cfunc
+def _escape_context(context: str) -> str:
+    return context.replace(':', '~')
+
+
+@cython.cfunc
+def _unescape_context(escaped_context: str) -> str:
+    return escaped_context.replace('~', ':')
@@ -16,12 +16,22 @@ BACKGROUND_MAX_FILE_SIZE = 320 * _kb  # 320 KB
 # this is in-memory cache configuration
 CACHE_DEFAULT_EXPIRE = timedelta(days=3)
 CACHE_COMPRESS_MIN_SIZE = 512
+CACHE_COMPRESS_DICT_MIN_SIZE = 64  # with a context dictionary, small values compress well too
 CACHE_COMPRESS_ZSTD_LEVEL = 1
 CACHE_COMPRESS_ZSTD_THREADS = 0  # disabled
+# this is in-process cache tier configuration (per worker)
+CACHE_LOCAL_MAX_SIZE = 10_000  # in entries
+CACHE_LOCAL_MAX_VALUE_SIZE = 64 * _kb
+CACHE_LOCAL_MAX_EXPIRE = timedelta(minutes=5)
+CACHE_NEGATIVE_EXPIRE = timedelta(seconds=30)
+CACHE_REFRESH_LOCK_EXPIRE = timedelta(minutes=1)
 
 CHANGESET_IDLE_TIMEOUT = timedelta(hours=1)
 CHANGESET_OPEN_TIMEOUT = timedelta(days=1)
 CHANGESET_EMPTY_DELETE_TIMEOUT = timedelta(hours=1)
+# closed changesets are immutable, expire to refresh user names and feature data
+CHANGESET_SUMMARY_CACHE_EXPIRE = timedelta(days=1)
+CHANGESET_DOWNLOAD_STREAM_BATCH_SIZE = 1_000
 CHANGESET_COMMENT_BODY_MAX_LENGTH = 5_000  # NOTE: value TBD
 CHANGESET_QUERY_DEFAULT_LIMIT = 100
 CHANGESET_QUERY_MAX_LIMIT = 100
@@ -49,6 +59,12 @@ DISPLAY_NAME_MAX_LENGTH = 255
 EMAIL_DELIVERABILITY_CACHE_EXPIRE = timedelta(minutes=20)
 EMAIL_DELIVERABILITY_DNS_TIMEOUT = timedelta(seconds=10)
 
+# this is in-process cache configuration (per worker, in entries)
+ELEMENT_CACHE_ELEMENTS_MAX_SIZE = 50_000
+ELEMENT_CACHE_MEMBERS_MAX_SIZE = 20_000
+ELEMENT_CACHE_INDEX_MAX_SIZE = 200_000
+ELEMENT_CACHE_LISTEN_RETRY_DELAY = timedelta(seconds=1)
+
 ELEMENT_HISTORY_PAGE_SIZE = 10
 ELEMENT_TAGS_LIMIT = 600
 ELEMENT_TAGS_MAX_SIZE = 64 * _kb
@@ -56,8 +72,16 @@ ELEMENT_TAGS_KEY_MAX_LENGTH = 63
 ELEMENT_WAY_MEMBERS_LIMIT = 2_000
 ELEMENT_RELATION_MEMBERS_LIMIT = 32_000
 
+EXPORT_PBF_BLOCK_SIZE = 8_000  # entities per block, as recommended by the format
+EXPORT_PBF_COMPRESS_ZLIB_LEVEL = 6
+EXPORT_PBF_PENDING_BLOCKS_PER_WORKER = 2
+
 FEATURE_PREFIX_TAGS_LIMIT = 100
 
+FILE_CACHE_ACCESS_UPDATE_INTERVAL = timedelta(hours=1)  # last_access precision, limits index writes
+FILE_CACHE_CLEANUP_BATCH_SIZE = 1_000
+FILE_CACHE_CLEANUP_INTERVAL = timedelta(minutes=5)
+
 FIND_LIMIT = 100
 
 GEO_COORDINATE_PRECISION = 7
@@ -74,6 +98,9 @@ MAIL_UNPROCESSED_EXPIRE = timedelta(days=3)
 
 MAP_QUERY_AREA_MAX_SIZE = 0.25  # in square degrees
 MAP_QUERY_LEGACY_NODES_LIMIT = 50_000
+MAP_QUERY_STREAM_BATCH_SIZE = 2_000
+MAP_QUERY_PAGE_NODES_LIMIT = 10_000
+MAP_QUERY_CURSOR_EXPIRE = timedelta(minutes=5)
 
 MESSAGE_BODY_MAX_LENGTH = 50_000  # NOTE: value TBD
 
@@ -84,6 +111,7 @@ NEARBY_USERS_RADIUS_METERS = 50_000
 
 NOMINATIM_CACHE_LONG_EXPIRE = timedelta(days=7)
 NOMINATIM_CACHE_SHORT_EXPIRE = timedelta(hours=1)
+NOMINATIM_CACHE_STALE_EXPIRE = timedelta(days=1)
 NOMINATIM_HTTP_LONG_TIMEOUT = timedelta(seconds=10)
 NOMINATIM_HTTP_SHORT_TIMEOUT = timedelta(seconds=5)
 
@@ -110,6 +138,7 @@ OAUTH_SILENT_AUTH_QUERY_SESSION_LIMIT = 10
 OPTIMISTIC_DIFF_RETRY_TIMEOUT = timedelta(seconds=30)
 
 OVERPASS_CACHE_EXPIRE = timedelta(hours=1)
+OVERPASS_CACHE_STALE_EXPIRE = timedelta(hours=6)
 
 # TODO: check pwned passwords
 EMAIL_MIN_LENGTH = 5
@@ -117,11 +146,17 @@ PASSWORD_MIN_LENGTH = 6
 PASSWORD_MAX_LENGTH = 255  # TODO:
 ACTIVE_SESSIONS_DISPLAY_LIMIT = 100
 
+REPLICATION_BATCH_SIZE = 5_000
+REPLICATION_MAX_ELEMENTS = 1_000_000  # per replication file, longer backlogs span multiple files
+REPLICATION_COMPRESS_GZIP_LEVEL = 6
+REPLICATION_COMPRESS_ZSTD_LEVEL = 9
+
 REPORT_BODY_MAX_LENGTH = 50_000  # NOTE: value TBD
 
 RICH_TEXT_CACHE_EXPIRE = timedelta(hours=8)
 
 S3_CACHE_EXPIRE = timedelta(days=1)
+S3_MULTIPART_PART_SIZE = 8 * _mb  # minimum is 5 MB
 
 SEARCH_LOCAL_AREA_LIMIT = 100  # in square degrees
 SEARCH_LOCAL_MAX_ITERATIONS = 7
@@ -130,6 +165,7 @@ SEARCH_QUERY_MAX_LENGTH = 255
 SEARCH_RESULTS_LIMIT = 100  # nominatim has hard-coded upper limit of 50
 
 STORAGE_KEY_MAX_LENGTH = 64
+STORAGE_STREAM_CHUNK_SIZE = 256 * _kb
 
 TRACE_TAG_MAX_LENGTH = 40
 TRACE_TAGS_LIMIT = 10
@@ -141,6 +177,13 @@ TRACE_FILE_MAX_LAYERS = 2
 TRACE_FILE_COMPRESS_ZSTD_THREADS = 0  # disabled
 # TODO: background task to recompress files on disk
 TRACE_FILE_COMPRESS_ZSTD_LEVEL = 1
+TRACE_FILE_BACKGROUND_MIN_SIZE = 1 * _mb  # larger uploads are processed in the background
+TRACE_PROCESS_WORKERS = 2  # processes per app worker
+TRACE_PROCESS_CLAIM_EXPIRE = timedelta(minutes=15)  # reclaimed after, if the processing worker died
+TRACE_PROCESS_SWEEP_INTERVAL = timedelta(minutes=5)
+
+TRACE_PREVIEW_MAX_POINTS = 100
+TRACE_PREVIEW_RESOLUTION = 100  # in pixels, fits in int16
 
 TRACE_POINT_QUERY_AREA_MAX_SIZE = 0.25  # in square degrees
 TRACE_POINT_QUERY_DEFAULT_LIMIT = 5_000
@@ -151,6 +194,7 @@ TRACE_POINT_QUERY_CURSOR_EXPIRE = timedelta(hours=1)
 TRACE_SEGMENT_MAX_AREA = 0.003**2  # in square degrees
 TRACE_SEGMENT_MAX_AREA_LENGTH = 0.01  # in degrees
 TRACE_SEGMENT_MAX_SIZE = 100
+TRACE_SEGMENT_INSERT_BATCH_SIZE = 1_000
 
 TRACES_LIST_PAGE_SIZE = 30
 
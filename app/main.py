@@ -22,6 +22,7 @@ from app.config import (
     RAPID_VERSION,
     TEST_ENV,
 )
+from app.lib.file_cache import FileCache
 from app.lib.starlette_convertor import ElementTypeConvertor
 from app.limits import (
     COMPRESS_HTTP_BROTLI_QUALITY,
@@ -44,9 +45,11 @@ from app.middlewares.unsupported_browser_middleware import UnsupportedBrowserMid
 from app.middlewares.version_middleware import VersionMiddleware
 from app.responses.osm_response import setup_api_router_response
 from app.responses.precompressed_static_files import PrecompressedStaticFiles
+from app.services.element_cache_service import ElementCacheService
 from app.services.email_service import EmailService
 from app.services.system_app_service import SystemAppService
 from app.services.test_service import TestService
+from app.services.trace_service import TraceService
 
 # set the timezone to UTC
 # note that "export TZ=UTC" from shell.nix is unreliable for some users
@@ -83,7 +86,7 @@ async def lifespan(_):
 
     await SystemAppService.on_startup()
 
-    async with EmailService.context():
+    async with EmailService.context(), ElementCacheService.context(), FileCache.context(), TraceService.context():
         yield
 
 
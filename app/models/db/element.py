@@ -10,6 +10,7 @@ from sqlalchemy import (
     Index,
     PrimaryKeyConstraint,
     and_,
+    func,
     null,
     true,
 )
@@ -56,4 +57,10 @@ class Element(Base.NoID, CreatedAtMixin):
             postgresql_where=and_(type == 'node', visible == true(), next_sequence_id == null()),
             postgresql_using='gist',
         ),
+        Index(
+            'element_node_geohash_idx',
+            func.ST_GeoHash(point, 12),
+            id,
+            postgresql_where=and_(type == 'node', visible == true(), next_sequence_id == null()),
+        ),
     )
@@ -1,7 +1,10 @@
 from collections.abc import Collection, Container
+from datetime import datetime
 from typing import Literal, get_args
 
-from sqlalchemy import ARRAY, ColumnElement, Enum, ForeignKey, Integer, Unicode, true
+from shapely import Point
+from sqlalchemy import ARRAY, Boolean, ColumnElement, Enum, ForeignKey, Index, Integer, LargeBinary, Unicode, true
+from sqlalchemy.dialects.postgresql import TIMESTAMP
 from sqlalchemy.ext.hybrid import hybrid_method, hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
 
@@ -10,6 +13,7 @@ from app.models.db.base import Base
 from app.models.db.created_at_mixin import CreatedAtMixin
 from app.models.db.updated_at_mixin import UpdatedAtMixin
 from app.models.db.user import User
+from app.models.geometry import PointType
 from app.models.scope import Scope
 from app.models.types import StorageKey
 
@@ -30,6 +34,15 @@ class Trace(Base.Sequential, CreatedAtMixin, UpdatedAtMixin):
 
     size: Mapped[int] = mapped_column(Integer, nullable=False)
     file_id: Mapped[StorageKey] = mapped_column(Unicode(STORAGE_KEY_MAX_LENGTH), init=False, nullable=False)
+    # the file is stored, but not yet processed into segments
+    pending: Mapped[bool] = mapped_column(Boolean, init=False, nullable=False, server_default='false')
+    # set while a worker is processing the pending file
+    processing_at: Mapped[datetime | None] = mapped_column(
+        TIMESTAMP(True), init=False, nullable=True, server_default=None
+    )
+    # precomputed once processed, see TracePreview
+    preview: Mapped[bytes | None] = mapped_column(LargeBinary, init=False, nullable=True, server_default=None)
+    start_point: Mapped[Point | None] = mapped_column(PointType, init=False, nullable=True, server_default=None)
 
     # defaults
     tags: Mapped[list[str]] = mapped_column(
@@ -41,6 +54,14 @@ class Trace(Base.Sequential, CreatedAtMixin, UpdatedAtMixin):
     # runtime
     coords: list[int | float] | None = None
 
+    __table_args__ = (
+        Index(
+            'trace_pending_idx',
+            'id',
+            postgresql_where=pending == true(),
+        ),
+    )
+
     @validates('tags')
     def validate_tags(self, _: str, value: Collection[str]):
         if len(value) > TRACE_TAGS_LIMIT:
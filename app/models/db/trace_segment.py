@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from shapely import MultiPoint
-from sqlalchemy import ARRAY, REAL, ForeignKey, Index, PrimaryKeyConstraint, SmallInteger
+from sqlalchemy import ARRAY, REAL, BigInteger, ForeignKey, Index, PrimaryKeyConstraint, SmallInteger
 from sqlalchemy.dialects.postgresql import TIMESTAMP
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -23,6 +23,8 @@ class TraceSegment(Base.NoID):
         ARRAY(TIMESTAMP(True), dimensions=1), nullable=True
     )
     elevations: Mapped[list[float | None] | None] = mapped_column(ARRAY(REAL, dimensions=1), nullable=True)
+    # hilbert_key of the points bounds center, the heap is clustered by it
+    spatial_key: Mapped[int | None] = mapped_column(BigInteger, init=False, nullable=True, server_default=None)
 
     __table_args__ = (
         PrimaryKeyConstraint(trace_id, track_num, segment_num),
@@ -31,4 +33,9 @@ class TraceSegment(Base.NoID):
             points,
             postgresql_using='gist',
         ),
+        Index(
+            'trace_segment_spatial_key_idx',
+            spatial_key,
+            postgresql_using='brin',
+        ),
     )
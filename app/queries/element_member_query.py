@@ -7,6 +7,7 @@ from app.db import db
 from app.lib.bundle import TupleBundle
 from app.models.db.element import Element
 from app.models.db.element_member import ElementMember
+from app.services.element_cache_service import ElementCacheService
 
 
 class ElementMemberQuery:
@@ -22,7 +23,12 @@ class ElementMemberQuery:
                 continue
             element_members = element.members = []
             if element.visible:
-                id_members_map[element.sequence_id] = element_members
+                element_sequence_id = element.sequence_id
+                cached_members = ElementCacheService.get_members(element_sequence_id)
+                if cached_members is not None:
+                    element_members.extend(cached_members)
+                else:
+                    id_members_map[element_sequence_id] = element_members
         if not id_members_map:
             return
 
@@ -43,6 +49,9 @@ class ElementMemberQuery:
                 current_members = id_members_map[member_sequence_id]
             current_members.append(member)
 
+        for sequence_id, element_members in id_members_map.items():
+            ElementCacheService.set_members(sequence_id, element_members)
+
 
 @cython.cfunc
 def _select():
@@ -1,23 +1,43 @@
+import heapq
 import logging
 from asyncio import TaskGroup
 from collections import defaultdict
-from collections.abc import Collection, Iterable, Sequence
-from itertools import chain
+from collections.abc import AsyncGenerator, AsyncIterator, Collection, Iterable, Sequence
+from itertools import batched, chain, islice
 from typing import Literal
 
 import cython
 from shapely.geometry.base import BaseGeometry
-from sqlalchemy import Select, and_, func, null, or_, select, text, true, union_all
+from sqlalchemy import (
+    ARRAY,
+    BigInteger,
+    Select,
+    and_,
+    any_,
+    bindparam,
+    func,
+    literal,
+    null,
+    or_,
+    select,
+    text,
+    true,
+    tuple_,
+    union_all,
+)
+from sqlalchemy.orm import aliased
 
 from app.config import LEGACY_SEQUENCE_ID_MARGIN
 from app.db import db
 from app.lib.bundle import NamespaceBundle
+from app.lib.element_refs_table import match_refs, match_versioned_refs, unnest_refs, unnest_versioned_refs
 from app.lib.exceptions_context import raise_for
-from app.limits import MAP_QUERY_LEGACY_NODES_LIMIT
+from app.limits import MAP_QUERY_LEGACY_NODES_LIMIT, MAP_QUERY_STREAM_BATCH_SIZE
 from app.models.db.element import Element
 from app.models.db.element_member import ElementMember
 from app.models.element import ElementId, ElementRef, ElementType, VersionedElementRef
 from app.queries.element_member_query import ElementMemberQuery
+from app.services.element_cache_service import ElementCacheService
 
 
 class ElementQuery:
@@ -67,21 +87,12 @@ class ElementQuery:
             return True
 
         async with db() as session:
+            refs = unnest_versioned_refs(versioned_refs)
             stmt = (
                 select(text('1'))
-                .where(
-                    Element.next_sequence_id != null(),
-                    or_(
-                        *(
-                            and_(
-                                Element.type == versioned_ref.type,
-                                Element.id == versioned_ref.id,
-                                Element.version == versioned_ref.version,
-                            )
-                            for versioned_ref in versioned_refs
-                        ),
-                    ),
-                )
+                .select_from(refs)
+                .join(Element, match_versioned_refs(Element, refs))
+                .where(Element.next_sequence_id != null())
                 .limit(1)
             )
             return await session.scalar(stmt) is None
@@ -97,20 +108,12 @@ class ElementQuery:
             return True
 
         async with db() as session:
+            refs = unnest_refs(member_refs)
             stmt = (
                 select(text('1'))
-                .where(
-                    ElementMember.sequence_id > after_sequence_id,
-                    or_(
-                        *(
-                            and_(
-                                ElementMember.type == member_ref.type,
-                                ElementMember.id == member_ref.id,
-                            )
-                            for member_ref in member_refs
-                        ),
-                    ),
-                )
+                .select_from(refs)
+                .join(ElementMember, match_refs(ElementMember, refs))
+                .where(ElementMember.sequence_id > after_sequence_id)
                 .limit(1)
             )
             return await session.scalar(stmt) is None
@@ -124,32 +127,52 @@ class ElementQuery:
         """
         Filter the given element refs to only include the visible elements.
         """
-        type_id_map: dict[ElementType, set[ElementId]] = defaultdict(set)
-        for element_ref in element_refs:
-            type_id_map[element_ref.type].add(element_ref.id)
-        if not type_id_map:
+        element_refs = set(element_refs)
+        if not element_refs:
             return ()
 
         async with db() as session:
-            stmt = select(Element.type, Element.id).where(
-                *(
-                    (Element.next_sequence_id == null(),)
-                    if at_sequence_id is None
-                    else (
-                        Element.sequence_id <= at_sequence_id,
-                        or_(Element.next_sequence_id == null(), Element.next_sequence_id > at_sequence_id),
-                    )
-                ),
-                or_(
+            refs = unnest_refs(element_refs)
+            stmt = (
+                select(Element.type, Element.id)
+                .select_from(refs)
+                .join(Element, match_refs(Element, refs))
+                .where(
                     *(
-                        and_(
-                            Element.type == type,
-                            Element.id.in_(text(','.join(map(str, ids)))),
+                        (Element.next_sequence_id == null(),)
+                        if at_sequence_id is None
+                        else (
+                            Element.sequence_id <= at_sequence_id,
+                            or_(Element.next_sequence_id == null(), Element.next_sequence_id > at_sequence_id),
                         )
-                        for type, ids in type_id_map.items()
-                    )
-                ),
-                Element.visible == true(),
+                    ),
+                    Element.visible == true(),
+                )
+            )
+            rows = (await session.execute(stmt)).all()
+            return tuple(ElementRef(type, id) for type, id in rows)
+
+    @staticmethod
+    async def filter_changed_refs(
+        element_refs: Iterable[ElementRef],
+        *,
+        after_sequence_id: int,
+    ) -> tuple[ElementRef, ...]:
+        """
+        Filter the given element refs to only include the elements modified after the given sequence_id.
+        """
+        element_refs = set(element_refs)
+        if not element_refs:
+            return ()
+
+        async with db() as session:
+            refs = unnest_refs(element_refs)
+            stmt = (
+                select(Element.type, Element.id)
+                .select_from(refs)
+                .join(Element, match_refs(Element, refs))
+                .where(Element.sequence_id > after_sequence_id)
+                .distinct()
             )
             rows = (await session.execute(stmt)).all()
             return tuple(ElementRef(type, id) for type, id in rows)
@@ -225,25 +248,35 @@ class ElementQuery:
         if not versioned_refs:
             return ()
 
+        cache_generation = ElementCacheService.generation()
+        result: list[Element] = []
+        missing_refs: list[VersionedElementRef] = []
+        for versioned_ref in versioned_refs:
+            element = ElementCacheService.get_by_versioned_ref(versioned_ref, at_sequence_id=at_sequence_id)
+            if element is not None:
+                result.append(element)
+            else:
+                missing_refs.append(versioned_ref)
+
+        if not missing_refs or (limit is not None and len(result) >= limit):
+            return result if (limit is None) else result[:limit]
+
         async with db() as session:
-            stmt = _select().where(
-                *((Element.sequence_id <= at_sequence_id,) if (at_sequence_id is not None) else ()),
-                or_(
-                    *(
-                        and_(
-                            Element.type == versioned_ref.type,
-                            Element.id == versioned_ref.id,
-                            Element.version == versioned_ref.version,
-                        )
-                        for versioned_ref in versioned_refs
-                    )
-                ),
+            refs = unnest_versioned_refs(missing_refs)
+            stmt = (
+                _select()
+                .join(refs, match_versioned_refs(Element, refs))
+                .where(*((Element.sequence_id <= at_sequence_id,) if (at_sequence_id is not None) else ()))
             )
 
             if limit is not None:
-                stmt = stmt.limit(limit)
+                stmt = stmt.limit(limit - len(result))
 
-            return (await session.scalars(stmt)).all()
+            elements = (await session.scalars(stmt)).all()
+
+        ElementCacheService.set_elements(elements, generation=cache_generation)
+        result.extend(elements)
+        return result
 
     @staticmethod
     async def get_by_refs(
@@ -265,34 +298,48 @@ class ElementQuery:
             type_id_map[element_ref.type].add(element_ref.id)
 
         async def task(type: ElementType, ids: set[ElementId]) -> Iterable[Element]:
-            async with db() as session:
-                stmt = _select().where(
-                    *(
-                        (Element.next_sequence_id == null(),)
-                        if at_sequence_id is None
-                        else (
-                            Element.sequence_id <= at_sequence_id,
-                            or_(Element.next_sequence_id == null(), Element.next_sequence_id > at_sequence_id),
-                        )
-                    ),
-                    Element.type == type,
-                    Element.id.in_(text(','.join(map(str, ids)))),
-                )
+            cache_generation = ElementCacheService.generation()
+            elements: list[Element] = []
+            missing_ids: list[ElementId] = []
+            for id in ids:
+                element = ElementCacheService.get_by_ref(ElementRef(type, id), at_sequence_id=at_sequence_id)
+                if element is not None:
+                    elements.append(element)
+                else:
+                    missing_ids.append(id)
+
+            if missing_ids and (limit is None or len(elements) < limit):
+                async with db() as session:
+                    stmt = _select().where(
+                        *(
+                            (Element.next_sequence_id == null(),)
+                            if at_sequence_id is None
+                            else (
+                                Element.sequence_id <= at_sequence_id,
+                                or_(Element.next_sequence_id == null(), Element.next_sequence_id > at_sequence_id),
+                            )
+                        ),
+                        Element.type == type,
+                        Element.id == any_(bindparam('ids', missing_ids, type_=ARRAY(BigInteger))),
+                    )
 
-                if limit is not None:
-                    stmt = stmt.limit(limit)
+                    if limit is not None:
+                        stmt = stmt.limit(limit - len(elements))
 
-                elements = (await session.scalars(stmt)).all()
+                    missing_elements = (await session.scalars(stmt)).all()
 
-                if type == 'way' and recurse_ways:
-                    await ElementMemberQuery.resolve_members(elements)
-                    node_ids = {member.id for element in elements for member in element.members}
-                    node_ids.difference_update(type_id_map['node'])
-                    if node_ids:
-                        logging.debug('Found %d nodes for %d recurse ways', len(node_ids), len(ids))
-                        elements = chain(elements, await task('node', node_ids))
+                ElementCacheService.set_elements(missing_elements, generation=cache_generation)
+                elements.extend(missing_elements)
 
-                return elements
+            if type == 'way' and recurse_ways:
+                await ElementMemberQuery.resolve_members(elements)
+                node_ids = {member.id for element in elements for member in element.members}  # pyright: ignore[reportOptionalIterable]
+                node_ids.difference_update(type_id_map['node'])
+                if node_ids:
+                    logging.debug('Found %d nodes for %d recurse ways', len(node_ids), len(ids))
+                    return chain(elements, await task('node', node_ids))
+
+            return elements
 
         async with TaskGroup() as tg:
             tasks = tuple(tg.create_task(task(type, ids)) for type, ids in type_id_map.items())
@@ -383,17 +430,17 @@ class ElementQuery:
         """
         if not member_refs:
             return ()
-        type_id_map: dict[ElementType, list[ElementId]] = defaultdict(list)
-        for member_ref in member_refs:
-            type_id_map[member_ref.type].append(member_ref.id)
         # optimization: ways and relations can only be members of relations
-        if parent_type is None and (not type_id_map.get('node')):
+        if parent_type is None and not any(member_ref.type == 'node' for member_ref in member_refs):
             parent_type = 'relation'
 
         async with db() as session:
+            refs = unnest_refs(member_refs)
             # 1: find lifetime of each ref
             cte_sub = (
                 select(Element.type, Element.id, Element.sequence_id, Element.next_sequence_id)
+                .select_from(refs)
+                .join(Element, match_refs(Element, refs))
                 .where(
                     *(
                         (Element.next_sequence_id == null(),)
@@ -403,15 +450,6 @@ class ElementQuery:
                             or_(Element.next_sequence_id == null(), Element.next_sequence_id > at_sequence_id),
                         )
                     ),
-                    or_(
-                        *(
-                            and_(
-                                Element.type == type,
-                                Element.id.in_(text(','.join(map(str, ids)))),
-                            )
-                            for type, ids in type_id_map.items()
-                        )
-                    ),
                 )
                 .subquery()
             )
@@ -467,14 +505,13 @@ class ElementQuery:
         """
         if not member_refs:
             return {}
-        type_id_map: dict[ElementType, list[ElementId]] = defaultdict(list)
-        for member_ref in member_refs:
-            type_id_map[member_ref.type].append(member_ref.id)
-
         async with db() as session:
+            refs = unnest_refs(member_refs)
             # 1: find lifetime of each ref
             cte_sub = (
                 select(Element.type, Element.id, Element.sequence_id, Element.next_sequence_id)
+                .select_from(refs)
+                .join(Element, match_refs(Element, refs))
                 .where(
                     *(
                         (Element.next_sequence_id == null(),)
@@ -484,15 +521,6 @@ class ElementQuery:
                             or_(Element.next_sequence_id == null(), Element.next_sequence_id > at_sequence_id),
                         )
                     ),
-                    or_(
-                        *(
-                            and_(
-                                Element.type == type,
-                                Element.id.in_(text(','.join(map(str, ids)))),
-                            )
-                            for type, ids in type_id_map.items()
-                        )
-                    ),
                 )
                 .subquery()
             )
@@ -551,6 +579,48 @@ class ElementQuery:
             )
             return (await session.scalars(stmt)).all()
 
+    @staticmethod
+    async def stream_by_changeset(changeset_id: int, *, batch_size: int) -> AsyncIterator[Sequence[Element]]:
+        """
+        Stream elements of the changeset in batches, ordered by sequence id.
+
+        Each batch has resolved members.
+        """
+        async with db() as session:
+            stmt = (
+                _select()
+                .where(Element.changeset_id == changeset_id)
+                .order_by(Element.sequence_id.asc())
+                .execution_options(yield_per=batch_size)
+            )
+            async for elements in (await session.stream_scalars(stmt)).partitions():
+                await ElementMemberQuery.resolve_members(elements)
+                yield elements
+
+    @staticmethod
+    async def stream_many_by_sequence_id(
+        after_sequence_id: int,
+        *,
+        limit: int | None,
+        batch_size: int,
+    ) -> AsyncIterator[Sequence[Element]]:
+        """
+        Stream elements created after the given sequence id in batches, ordered by sequence id.
+
+        Each batch has resolved members.
+        Sequence ids are gap-free, so the streamed range is always contiguous.
+        """
+        async with db() as session:
+            stmt = _select().where(Element.sequence_id > after_sequence_id).order_by(Element.sequence_id.asc())
+
+            if limit is not None:
+                stmt = stmt.limit(limit)
+
+            stmt = stmt.execution_options(yield_per=batch_size)
+            async for elements in (await session.stream_scalars(stmt)).partitions():
+                await ElementMemberQuery.resolve_members(elements)
+                yield elements
+
     @staticmethod
     async def find_many_by_geom(
         geometry: BaseGeometry,
@@ -604,56 +674,242 @@ class ElementQuery:
         if legacy_nodes_limit and len(nodes) > MAP_QUERY_LEGACY_NODES_LIMIT:
             raise_for().map_query_nodes_limit_exceeded()
 
-        nodes_refs = tuple(ElementRef('node', node.id) for node in nodes)
-        result_sequences: list[Iterable[Element]] = [nodes]
+        return await _find_nodes_related(
+            nodes,
+            at_sequence_id=at_sequence_id,
+            partial_ways=partial_ways,
+            include_relations=include_relations,
+        )
 
-        async def fetch_parents(element_refs: Collection[ElementRef], parent_type: ElementType) -> Sequence[Element]:
-            parents = await ElementQuery.get_parents_by_refs(
-                element_refs,
-                at_sequence_id=at_sequence_id,
-                parent_type=parent_type,
-                limit=None,
-            )
-            result_sequences.append(parents)
-            return parents
+    @staticmethod
+    async def find_many_by_geom_page(
+        geometry: BaseGeometry,
+        *,
+        at_sequence_id: int | None,
+        after: tuple[str, ElementId] | None,
+        nodes_limit: int,
+    ) -> tuple[list[Element], int, tuple[str, ElementId] | None]:
+        """
+        Find a page of elements within the given geometry.
 
-        async with TaskGroup() as tg:
+        Nodes are ordered by their geohash and id, which is used as the page position.
+        Each page contains the page nodes and all their related elements (see find_many_by_geom),
+        so the related elements may repeat between pages.
 
-            async def way_task() -> None:
-                # fetch parent ways
-                ways = await fetch_parents(nodes_refs, 'way')
-
-                # fetch ways' parent relations
-                if include_relations:
-                    ways_refs = tuple(ElementRef('way', way.id) for way in ways)
-                    tg.create_task(fetch_parents(ways_refs, 'relation'))
-
-                # fetch ways' nodes
-                if not partial_ways:
-                    await ElementMemberQuery.resolve_members(ways)
-                    members_refs = {ElementRef('node', node.id) for way in ways for node in way.members}  # pyright: ignore[reportOptionalIterable]
-                    members_refs.difference_update(nodes_refs)
-                    ways_nodes = await ElementQuery.get_by_refs(
-                        members_refs,
-                        at_sequence_id=at_sequence_id,
-                        limit=len(members_refs),
+        If at_sequence_id is None, the current sequence_id is used.
+
+        Returns the elements, the at_sequence_id and the position after the last node (or None if last page).
+        """
+        min_lon, min_lat, max_lon, max_lat = geometry.bounds
+        geohash = func.ST_GeoHash(Element.point, 12)
+        where_page = (
+            Element.type == 'node',
+            Element.visible == true(),
+            func.ST_Intersects(Element.point, func.ST_GeomFromText(geometry.wkt, 4326)),
+            # narrow the index range scan, geohash is a Z-order curve over the bounds corners
+            geohash.between(
+                func.ST_GeoHash(func.ST_SetSRID(func.ST_MakePoint(min_lon, min_lat), 4326), 12),
+                func.ST_GeoHash(func.ST_SetSRID(func.ST_MakePoint(max_lon, max_lat), 4326), 12),
+            ),
+            *(
+                (tuple_(geohash, Element.id) > tuple_(literal(after[0]), literal(after[1])),)
+                if (after is not None)
+                else ()
+            ),
+        )
+
+        # read the sequence_id and the nodes in the same snapshot,
+        # so that the first page doesn't need to look at the history
+        async with db() as session:
+            await session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+
+            if at_sequence_id is None:
+                at_sequence_id = await session.scalar(select(func.max(Element.sequence_id)))
+                if at_sequence_id is None:
+                    return [], 0, None
+                is_current: cython.char = True
+            else:
+                is_current = False
+
+            # index stores only the current nodes
+            stmt = (
+                _select()
+                .add_columns(geohash)
+                .where(
+                    Element.next_sequence_id == null(),
+                    Element.sequence_id <= at_sequence_id,
+                    *where_page,
+                )
+                .order_by(geohash, Element.id)
+                .limit(nodes_limit + 1)
+            )
+            rows: Iterable[tuple[Element, str]] = (await session.execute(stmt)).all()  # pyright: ignore[reportAssignmentType]
+
+            # nodes that were modified after at_sequence_id
+            if not is_current:
+                E = aliased(Element)  # noqa: N806
+                stmt = (
+                    _select()
+                    .add_columns(geohash)
+                    .join(
+                        E, and_(E.type == Element.type, E.id == Element.id, E.sequence_id == Element.next_sequence_id)
                     )
-                    result_sequences.append(ways_nodes)
+                    .where(
+                        E.sequence_id > at_sequence_id,
+                        E.type == 'node',
+                        Element.sequence_id <= at_sequence_id,
+                        *where_page,
+                    )
+                    .order_by(geohash, Element.id)
+                    .limit(nodes_limit + 1)
+                )
+                historical_rows = (await session.execute(stmt)).all()
+                rows = heapq.merge(rows, historical_rows, key=_page_row_key)  # pyright: ignore[reportArgumentType]
+
+        rows = tuple(islice(rows, nodes_limit + 1))
+
+        next_after: tuple[str, ElementId] | None = None
+        if len(rows) > nodes_limit:
+            rows = rows[:nodes_limit]
+            last_node, last_geohash = rows[-1]
+            next_after = (last_geohash, last_node.id)
+
+        nodes = [node for node, _ in rows]
+        elements = await _find_nodes_related(
+            nodes,
+            at_sequence_id=at_sequence_id,
+            partial_ways=False,
+            include_relations=True,
+        )
+        return elements, at_sequence_id, next_after
 
-            tg.create_task(way_task())
-            if include_relations:
-                tg.create_task(fetch_parents(nodes_refs, 'relation'))
+    @staticmethod
+    async def stream_many_by_geom(
+        geometry: BaseGeometry,
+        *,
+        partial_ways: bool = False,
+        include_relations: bool = True,
+        nodes_limit: int | None,
+        legacy_nodes_limit: bool = False,
+        batch_size: int = MAP_QUERY_STREAM_BATCH_SIZE,
+    ) -> AsyncGenerator[Sequence[Element], None]:
+        """
+        Stream elements within the given geometry in batches.
 
-        # remove duplicates and preserve order
-        result_set: set[int] = set()
-        result: list[Element] = []
-        for elements in result_sequences:
-            for element in elements:
-                element_sequence_id = element.sequence_id
-                if element_sequence_id not in result_set:
-                    result_set.add(element_sequence_id)
-                    result.append(element)
-        return result
+        Yields the same elements as find_many_by_geom, in order:
+        nodes, ways' nodes, ways, relations.
+
+        Each batch contains elements of a single type, with resolved members.
+        Only the element ids are kept in memory between the batches.
+
+        With legacy_nodes_limit, the limit is checked before the first batch is yielded.
+        """
+        if legacy_nodes_limit and nodes_limit != MAP_QUERY_LEGACY_NODES_LIMIT:
+            raise ValueError('nodes_limit must be ==MAP_QUERY_NODES_LEGACY_LIMIT when legacy_nodes_limit is True')
+
+        nodes_ids: set[ElementId] = set()
+
+        # stream all the matching nodes
+        async with db() as session:
+            await session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+
+            stmt = select(func.max(Element.sequence_id))
+            at_sequence_id = await session.scalar(stmt)
+            if at_sequence_id is None:
+                return
+
+            # index stores only the current nodes
+            where_and = (
+                Element.next_sequence_id == null(),
+                Element.visible == true(),
+                Element.type == 'node',
+                func.ST_Intersects(Element.point, func.ST_GeomFromText(geometry.wkt, 4326)),
+            )
+
+            # count in the same snapshot, for the stream to be consistent with the check
+            if legacy_nodes_limit:
+                subq = select(text('1')).where(*where_and).limit(MAP_QUERY_LEGACY_NODES_LIMIT + 1).subquery()
+                nodes_count = await session.scalar(select(func.count()).select_from(subq))
+                if nodes_count is not None and nodes_count > MAP_QUERY_LEGACY_NODES_LIMIT:
+                    raise_for().map_query_nodes_limit_exceeded()
+
+            stmt = _select().where(*where_and)
+
+            if nodes_limit is not None:
+                stmt = stmt.limit(nodes_limit)
+
+            stmt = stmt.execution_options(yield_per=batch_size)
+            async for nodes in (await session.stream_scalars(stmt)).partitions():
+                nodes_ids.update(node.id for node in nodes)
+                await ElementMemberQuery.resolve_members(nodes)
+                yield nodes
+
+        if not nodes_ids:
+            return
+
+        # fetch parent ways
+        ways_ids: set[ElementId] = set()
+        ways_nodes_ids: set[ElementId] = set()
+        for refs in batched((ElementRef('node', id) for id in nodes_ids), batch_size):
+            ways = await ElementQuery.get_parents_by_refs(
+                refs,
+                at_sequence_id=at_sequence_id,
+                parent_type='way',
+                limit=None,
+            )
+            ways = [way for way in ways if way.id not in ways_ids]
+            if not ways:
+                continue
+            ways_ids.update(way.id for way in ways)
+            await ElementMemberQuery.resolve_members(ways)
+
+            if partial_ways:
+                yield ways
+            else:
+                ways_nodes_ids.update(member.id for way in ways for member in way.members)  # pyright: ignore[reportOptionalIterable]
+
+        if not partial_ways:
+            # fetch ways' nodes
+            ways_nodes_ids.difference_update(nodes_ids)
+            for ids in batched(ways_nodes_ids, batch_size):
+                ways_nodes = await ElementQuery.get_by_refs(
+                    tuple(ElementRef('node', id) for id in ids),
+                    at_sequence_id=at_sequence_id,
+                    limit=None,
+                )
+                await ElementMemberQuery.resolve_members(ways_nodes)
+                yield ways_nodes
+
+            # fetch ways again, they were discarded to keep the memory bounded
+            for ids in batched(ways_ids, batch_size):
+                ways = await ElementQuery.get_by_refs(
+                    tuple(ElementRef('way', id) for id in ids),
+                    at_sequence_id=at_sequence_id,
+                    limit=None,
+                )
+                await ElementMemberQuery.resolve_members(ways)
+                yield ways
+
+        # fetch nodes' and ways' parent relations
+        if include_relations:
+            relations_ids: set[ElementId] = set()
+            members_refs = chain(
+                (ElementRef('node', id) for id in nodes_ids),
+                (ElementRef('way', id) for id in ways_ids),
+            )
+            for refs in batched(members_refs, batch_size):
+                relations = await ElementQuery.get_parents_by_refs(
+                    refs,
+                    at_sequence_id=at_sequence_id,
+                    parent_type='relation',
+                    limit=None,
+                )
+                relations = [relation for relation in relations if relation.id not in relations_ids]
+                if not relations:
+                    continue
+                relations_ids.update(relation.id for relation in relations)
+                await ElementMemberQuery.resolve_members(relations)
+                yield relations
 
     @staticmethod
     async def get_last_visible_sequence_id(element: Element) -> int | None:
@@ -677,6 +933,78 @@ class ElementQuery:
             return await session.scalar(stmt)
 
 
+async def _find_nodes_related(
+    nodes: Sequence[Element],
+    *,
+    at_sequence_id: int,
+    partial_ways: bool,
+    include_relations: bool,
+) -> list[Element]:
+    """
+    Find the nodes' related elements, see ElementQuery.find_many_by_geom.
+
+    Results include the nodes and are deduplicated.
+    """
+    if not nodes:
+        return []
+
+    nodes_refs = tuple(ElementRef('node', node.id) for node in nodes)
+    result_sequences: list[Iterable[Element]] = [nodes]
+
+    async def fetch_parents(element_refs: Collection[ElementRef], parent_type: ElementType) -> Sequence[Element]:
+        parents = await ElementQuery.get_parents_by_refs(
+            element_refs,
+            at_sequence_id=at_sequence_id,
+            parent_type=parent_type,
+            limit=None,
+        )
+        result_sequences.append(parents)
+        return parents
+
+    async with TaskGroup() as tg:
+
+        async def way_task() -> None:
+            # fetch parent ways
+            ways = await fetch_parents(nodes_refs, 'way')
+
+            # fetch ways' parent relations
+            if include_relations:
+                ways_refs = tuple(ElementRef('way', way.id) for way in ways)
+                tg.create_task(fetch_parents(ways_refs, 'relation'))
+
+            # fetch ways' nodes
+            if not partial_ways:
+                await ElementMemberQuery.resolve_members(ways)
+                members_refs = {ElementRef('node', node.id) for way in ways for node in way.members}  # pyright: ignore[reportOptionalIterable]
+                members_refs.difference_update(nodes_refs)
+                ways_nodes = await ElementQuery.get_by_refs(
+                    members_refs,
+                    at_sequence_id=at_sequence_id,
+                    limit=len(members_refs),
+                )
+                result_sequences.append(ways_nodes)
+
+        tg.create_task(way_task())
+        if include_relations:
+            tg.create_task(fetch_parents(nodes_refs, 'relation'))
+
+    # remove duplicates and preserve order
+    result_set: set[int] = set()
+    result: list[Element] = []
+    for elements in result_sequences:
+        for element in elements:
+            element_sequence_id = element.sequence_id
+            if element_sequence_id not in result_set:
+                result_set.add(element_sequence_id)
+                result.append(element)
+    return result
+
+
+@cython.cfunc
+def _page_row_key(row: tuple[Element, str]) -> tuple[str, int]:
+    return row[1], row[0].id
+
+
 @cython.cfunc
 def _select():
     bundle = NamespaceBundle(
@@ -7,7 +7,7 @@ from app.storage import AVATAR_STORAGE, BACKGROUND_STORAGE, GRAVATAR_STORAGE
 
 class ImageQuery:
     @staticmethod
-    async def get_gravatar(user_id: int) -> bytes:
+    async def get_gravatar(user_id: int) -> bytes | memoryview:
         """
         Get a user's gravatar image.r
         """
@@ -19,7 +19,7 @@ class ImageQuery:
         return await GRAVATAR_STORAGE.load(user.email)
 
     @staticmethod
-    async def get_avatar(avatar_id: StorageKey) -> bytes:
+    async def get_avatar(avatar_id: StorageKey) -> bytes | memoryview:
         """
         Get a custom avatar image.
         """
@@ -29,7 +29,7 @@ class ImageQuery:
             raise_for().image_not_found()
 
     @staticmethod
-    async def get_background(background_id: StorageKey) -> bytes:
+    async def get_background(background_id: StorageKey) -> bytes | memoryview:
         """
         Get a custom background image.
         """
@@ -15,6 +15,7 @@ from app.lib.translation import primary_translation_locale
 from app.limits import (
     NOMINATIM_CACHE_LONG_EXPIRE,
     NOMINATIM_CACHE_SHORT_EXPIRE,
+    NOMINATIM_CACHE_STALE_EXPIRE,
     NOMINATIM_HTTP_LONG_TIMEOUT,
     NOMINATIM_HTTP_SHORT_TIMEOUT,
 )
@@ -57,6 +58,8 @@ class NominatimQuery:
             context=_cache_context,
             factory=factory,
             ttl=NOMINATIM_CACHE_LONG_EXPIRE,
+            stale_ttl=NOMINATIM_CACHE_STALE_EXPIRE,
+            negative_value=b'{}',  # no result
         )
         response_entries = (JSON_DECODE(cache.value),)
         result = await _get_result(at_sequence_id=None, response_entries=response_entries)
@@ -133,6 +136,8 @@ async def _search(
             factory=factory,
             hash_key=True,
             ttl=NOMINATIM_CACHE_SHORT_EXPIRE,
+            stale_ttl=NOMINATIM_CACHE_STALE_EXPIRE,
+            negative_value=b'[]',  # no results
         )
         response = cache.value
     else:
@@ -6,7 +6,7 @@ from aiohttp import ClientTimeout
 from shapely import Point, get_coordinates
 
 from app.config import OVERPASS_INTERPRETER_URL
-from app.limits import OVERPASS_CACHE_EXPIRE
+from app.limits import OVERPASS_CACHE_EXPIRE, OVERPASS_CACHE_STALE_EXPIRE
 from app.models.db.element import Element
 from app.services.cache_service import CacheContext, CacheService
 from app.utils import JSON_DECODE, http_post
@@ -45,7 +45,14 @@ class OverpassQuery:
             ) as r:
                 return await r.read()
 
-        cache = await CacheService.get(query, _cache_context, factory, ttl=OVERPASS_CACHE_EXPIRE)
+        cache = await CacheService.get(
+            query,
+            _cache_context,
+            factory,
+            ttl=OVERPASS_CACHE_EXPIRE,
+            stale_ttl=OVERPASS_CACHE_STALE_EXPIRE,
+            negative_value=b'{"elements":[]}',  # no results
+        )
         elements: list[dict[str, Any]] = JSON_DECODE(cache.value)['elements']  # pyright: ignore[reportInvalidTypeForm]
         elements.sort(key=_get_bounds_size)
 
@@ -1,4 +1,4 @@
-from collections.abc import Sequence
+from collections.abc import AsyncIterable, Sequence
 from typing import Literal
 
 from sqlalchemy import any_, func, select, text
@@ -33,18 +33,15 @@ class TraceQuery:
         return trace
 
     @staticmethod
-    async def get_one_data_by_id(trace_id: int) -> bytes:
+    async def get_one_data_stream_by_id(trace_id: int) -> AsyncIterable[bytes | memoryview]:
         """
-        Get a trace data file by id.
+        Get a trace data file stream by id.
 
         Raises if the trace is not visible to the current user.
-
-        Returns a tuple of (filename, file).
         """
         trace = await TraceQuery.get_one_by_id(trace_id)
-        file_buffer = await TRACES_STORAGE.load(trace.file_id)
-        file_bytes = TraceFile.decompress_if_needed(file_buffer, trace.file_id)
-        return file_bytes
+        file_chunks = TRACES_STORAGE.load_stream(trace.file_id)
+        return TraceFile.decompress_stream_if_needed(file_chunks, trace.file_id)
 
     @staticmethod
     async def find_many_by_user_id(
@@ -1,11 +1,11 @@
-from collections import Counter
 from collections.abc import Collection, Sequence
+from itertools import compress
 
 import cython
 import numpy as np
-from shapely import MultiPoint, STRtree, from_wkb, get_parts, lib, multipoints
+from shapely import MultiPoint, from_wkb, get_num_geometries, intersects_xy, lib, multipoints
 from shapely.geometry.base import BaseGeometry
-from sqlalchemy import func, literal_column, select, text, union_all
+from sqlalchemy import and_, func, literal, literal_column, or_, select, text, tuple_, union_all
 from sqlalchemy.sql.selectable import Select
 
 from app.db import db
@@ -14,6 +14,9 @@ from app.lib.options_context import apply_options_context
 from app.models.db.trace_ import Trace
 from app.models.db.trace_segment import TraceSegment
 
+# (trace_id, track_num, segment_num)
+TraceSegmentKey = tuple[int, int, int]
+
 
 # TODO: limit offset for safety
 class TraceSegmentQuery:
@@ -41,96 +44,84 @@ class TraceSegmentQuery:
         identifiable_trackable: bool,
         limit: int | None,
         legacy_offset: int | None = None,
-    ) -> Sequence[TraceSegment]:
+        after: TraceSegmentKey | None = None,
+    ) -> tuple[Sequence[TraceSegment], TraceSegmentKey | None]:
         """
         Find trace segments by geometry.
 
-        Returns modified segments, containing only points within the geometry.
+        Returns modified segments, containing only points within the geometry,
+        and the key to continue after, if the limit was reached.
         """
         visibility = ('identifiable', 'trackable') if identifiable_trackable else ('public', 'private')
+        where = [
+            func.ST_Intersects(TraceSegment.points, func.ST_GeomFromText(geometry.wkt, 4326)),
+            Trace.visibility.in_(visibility),
+        ]
+        if after is not None:
+            after_trace_id, after_track_num, after_segment_num = after
+            where.append(
+                or_(
+                    TraceSegment.trace_id < after_trace_id,
+                    and_(
+                        TraceSegment.trace_id == after_trace_id,
+                        tuple_(TraceSegment.track_num, TraceSegment.segment_num)
+                        > tuple_(literal(after_track_num), literal(after_segment_num)),
+                    ),
+                )
+            )
+        order_by = (
+            TraceSegment.trace_id.desc(),
+            TraceSegment.track_num.asc(),
+            TraceSegment.segment_num.asc(),
+        )
 
         async with db() as session:
-            stmt = (
-                select(TraceSegment)
-                .join(TraceSegment.trace)
-                .where(
-                    func.ST_Intersects(TraceSegment.points, func.ST_GeomFromText(geometry.wkt, 4326)),
-                    Trace.visibility.in_(visibility),
-                )
-                .order_by(
-                    TraceSegment.trace_id.desc(),
-                    TraceSegment.track_num.asc(),
-                    TraceSegment.segment_num.asc(),
+            if identifiable_trackable:
+                stmt = select(TraceSegment).join(TraceSegment.trace).where(*where).order_by(*order_by)
+                stmt = apply_options_context(stmt)
+            else:
+                # only the points and the keys are returned
+                stmt = (
+                    select(
+                        TraceSegment.trace_id,
+                        TraceSegment.track_num,
+                        TraceSegment.segment_num,
+                        TraceSegment.points,
+                    )
+                    .join(TraceSegment.trace)
+                    .where(*where)
+                    .order_by(*order_by)
                 )
-            )
-            stmt = apply_options_context(stmt)
             if legacy_offset is not None:
                 stmt = stmt.offset(legacy_offset)
             if limit is not None:
                 stmt = stmt.limit(limit)
-            segments = (await session.scalars(stmt)).all()
-
-        if not segments:
-            return ()
-
-        # extract points and check for intersections
-        segments_points = tuple(segment.points for segment in segments)
-        segments_parts_ = get_parts(segments_points, return_index=True)
-        segments_parts = segments_parts_[0]
-        segments_indices = segments_parts_[1]
-        tree = STRtree((geometry,))
-        intersect_indices = tree.query(segments_parts, predicate='intersects')[0]
-        if not intersect_indices.size:
-            return ()
-
-        # filter non-intersecting points
-        segments_parts = segments_parts[intersect_indices]
-        segments_indices = segments_indices[intersect_indices]
-        split_indices = np.unique(segments_indices, return_index=True)[1][1:]
-        new_parts = np.split(segments_parts, split_indices)
-        new_parts_flat = np.concatenate(new_parts)
+            rows = (await session.execute(stmt)).all()
+
+        if not rows:
+            return (), None
 
         if identifiable_trackable:
-            # reconstruct multipoints
-            split_indices_ex = np.empty(len(split_indices) + 2, dtype=split_indices.dtype)
-            split_indices_ex[0] = 0
-            split_indices_ex[1:-1] = split_indices
-            split_indices_ex[-1] = len(segments_parts)
-            new_parts_sizes = split_indices_ex[1:] - split_indices_ex[:-1]
-            new_parts_max_size: int = new_parts_sizes.max()
-            new_parts_fixed = np.empty((len(new_parts), new_parts_max_size), dtype=object)
-            mask = np.arange(new_parts_max_size) < new_parts_sizes[:, None]
-            new_parts_fixed[mask] = new_parts_flat
-            new_points_list: Sequence[MultiPoint] = multipoints(new_parts_fixed)  # pyright: ignore[reportAssignmentType]
-
-            # assign filtered multipoints and return
-            for segment, points in zip(segments, new_points_list, strict=True):
-                segment.points = points
-
-            # filter extra attributes
-            data_flat = np.empty(segments_parts_[0].size, dtype=object)
-            data_lens = Counter(segments_parts_[1]).values()
-            dirty: cython.char = False
-            for attr_name in ('capture_times', 'elevations'):
-                if dirty:
-                    data_flat.fill(None)
-                    dirty = False
-                i: int = 0
-                for segment, data_len in zip(segments, data_lens, strict=True):
-                    data = getattr(segment, attr_name)
-                    if data:
-                        data_flat[i : i + data_len] = data
-                        dirty = True
-                    i += data_len
-                if dirty:
-                    new_data = np.split(data_flat[intersect_indices], split_indices)
-                    for segment, data in zip(segments, new_data, strict=True):
-                        setattr(segment, attr_name, data.tolist())
-
-            return segments
+            segments: list[TraceSegment] = [row[0] for row in rows]
+            last = segments[-1]
+            next_after: TraceSegmentKey | None = (last.trace_id, last.track_num, last.segment_num)
+            segments_points = np.asarray([segment.points for segment in segments], dtype=object)
         else:
+            segments = []
+            next_after = tuple(rows[-1][:3])  # pyright: ignore[reportAssignmentType]
+            segments_points = np.asarray([row[3] for row in rows], dtype=object)
+        if limit is None or len(rows) < limit:
+            next_after = None
+
+        # filter the points on raw coordinates
+        coords = lib.get_coordinates(segments_points, False, False)
+        mask = intersects_xy(geometry, coords[:, 0], coords[:, 1])
+        if not mask.any():
+            return (), next_after
+
+        if not identifiable_trackable:
             # reconstruct dummy multipoint
-            new_points: MultiPoint = multipoints(new_parts_flat)  # pyright: ignore[reportAssignmentType]
+            new_points: MultiPoint = multipoints(coords[mask])  # pyright: ignore[reportAssignmentType]
             return (
                 TraceSegment(
                     track_num=0,
@@ -139,7 +130,32 @@ class TraceSegmentQuery:
                     capture_times=None,
                     elevations=None,
                 ),
-            )
+            ), next_after
+
+        sizes = get_num_geometries(segments_points)
+        segments_indices = np.repeat(np.arange(len(segments)), sizes)[mask]
+        segments_masks = np.split(mask, np.cumsum(sizes[:-1]))
+
+        # reconstruct multipoints, skipping segments without points
+        kept_indices = np.unique(segments_indices)
+        new_points_list: Sequence[MultiPoint] = multipoints(  # pyright: ignore[reportAssignmentType]
+            coords[mask],
+            indices=np.searchsorted(kept_indices, segments_indices),
+        )
+
+        result: list[TraceSegment] = []
+        for i, points in zip(kept_indices.tolist(), new_points_list, strict=True):
+            segment = segments[i]
+            segment_mask = segments_masks[i]
+            segment.points = points
+            capture_times = segment.capture_times
+            if capture_times:
+                segment.capture_times = list(compress(capture_times, segment_mask))
+            elevations = segment.elevations
+            if elevations:
+                segment.elevations = list(compress(elevations, segment_mask))
+            result.append(segment)
+        return result, next_after
 
     @staticmethod
     async def resolve_coords(
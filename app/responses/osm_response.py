@@ -1,10 +1,11 @@
-from collections.abc import Callable, Mapping, Sequence
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable, Mapping, Sequence
 from functools import wraps
 from typing import Any, NoReturn, override
 
 import cython
 from fastapi import APIRouter, Response
 from fastapi.dependencies.utils import get_dependant
+from fastapi.responses import StreamingResponse
 from fastapi.routing import APIRoute
 from starlette.routing import request_response
 
@@ -55,14 +56,7 @@ class OSMResponse(Response):
         style = format_style()
 
         if style == 'json':
-            # include json attributes if api 0.6 and not notes
-            request_path: str = get_request().url.path
-            if request_path.startswith('/api/0.6/') and not request_path.startswith('/api/0.6/notes'):
-                if isinstance(content, Mapping):
-                    content = {**_json_attributes, **content}
-                else:
-                    raise TypeError(f'Invalid json content type {type(content)}')
-
+            content = _with_json_attributes(content)
             encoded = JSON_ENCODE(content)
             return Response(encoded, media_type='application/json; charset=utf-8')
 
@@ -97,6 +91,40 @@ class OSMResponse(Response):
         else:
             raise NotImplementedError(f'Unsupported osm format style {style!r}')
 
+    @classmethod
+    def serialize_stream(
+        cls,
+        content: Mapping,
+        stream: AsyncIterable[Iterable[Any]],
+        *,
+        stream_key: str,
+    ) -> StreamingResponse:
+        """
+        Serialize the content followed by the streamed items, incrementally.
+
+        In JSON, the items are encoded as an array under the stream_key.
+        In XML, the items are (key, value) tuples, encoded as the root children.
+        """
+        style = format_style()
+
+        if style == 'json':
+            content = _with_json_attributes(content)
+            if stream_key in content:
+                raise ValueError(f'Stream key {stream_key!r} must not be present in the content')
+            return StreamingResponse(
+                _stream_json(content, stream, stream_key),
+                media_type='application/json; charset=utf-8',
+            )
+
+        elif style == 'xml':
+            return StreamingResponse(
+                XMLToDict.unparse_stream(cls.xml_root, {**_xml_attributes, **content}, stream),
+                media_type='application/xml; charset=utf-8',
+            )
+
+        else:
+            raise NotImplementedError(f'Unsupported osm stream format style {style!r}')
+
 
 class OSMChangeResponse(OSMResponse):
     xml_root = 'osmChange'
@@ -110,6 +138,37 @@ class GPXResponse(OSMResponse):
     xml_root = 'gpx'
 
 
+@cython.cfunc
+def _with_json_attributes(content: Any):
+    # include json attributes if api 0.6 and not notes
+    request_path: str = get_request().url.path
+    if request_path.startswith('/api/0.6/') and not request_path.startswith('/api/0.6/notes'):
+        if isinstance(content, Mapping):
+            return {**_json_attributes, **content}
+        else:
+            raise TypeError(f'Invalid json content type {type(content)}')
+    return content
+
+
+async def _stream_json(content: Mapping, stream: AsyncIterable[Iterable[Any]], stream_key: str) -> AsyncIterator[bytes]:
+    # open the object and the stream array: {"key":"value","stream_key":[
+    encoded = JSON_ENCODE(content)
+    yield encoded[:-1] + (b',' if len(encoded) > 2 else b'') + JSON_ENCODE(stream_key) + b':['
+
+    is_first: cython.char = True
+    async for chunk in stream:
+        encoded_items = b','.join(JSON_ENCODE(item) for item in chunk)
+        if not encoded_items:
+            continue
+        if is_first:
+            is_first = False
+            yield encoded_items
+        else:
+            yield b',' + encoded_items
+
+    yield b']}'
+
+
 def setup_api_router_response(router: APIRouter) -> None:
     """
     Setup APIRouter to use optimized OSMResponse serialization.
@@ -181,6 +181,7 @@ class AuthService:
             context=_credentials_context,
             factory=factory,
             ttl=AUTH_CREDENTIALS_CACHE_EXPIRE,
+            local=True,
         )
 
         if cache.value != b'\xff':
@@ -1,18 +1,30 @@
 import logging
-from collections.abc import Awaitable, Callable
+import struct
+import time
+from asyncio import Task, gather, get_running_loop, shield
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
 from datetime import timedelta
 from typing import NamedTuple, NewType
 
+import cython
+from lrucache_rs import LRUCache
 from sizestr import sizestr
-from zstandard import ZstdCompressor, ZstdDecompressor
+from zstandard import ZstdCompressor, ZstdDecompressor, ZstdError
 
 from app.db import valkey
 from app.lib.crypto import hash_bytes
+from app.lib.zstd_dict import ZstdDict
 from app.limits import (
+    CACHE_COMPRESS_DICT_MIN_SIZE,
     CACHE_COMPRESS_MIN_SIZE,
     CACHE_COMPRESS_ZSTD_LEVEL,
     CACHE_COMPRESS_ZSTD_THREADS,
     CACHE_DEFAULT_EXPIRE,
+    CACHE_LOCAL_MAX_EXPIRE,
+    CACHE_LOCAL_MAX_SIZE,
+    CACHE_LOCAL_MAX_VALUE_SIZE,
+    CACHE_NEGATIVE_EXPIRE,
+    CACHE_REFRESH_LOCK_EXPIRE,
 )
 
 CacheContext = NewType('CacheContext', str)
@@ -20,12 +32,39 @@ CacheContext = NewType('CacheContext', str)
 _compress = ZstdCompressor(level=CACHE_COMPRESS_ZSTD_LEVEL, threads=CACHE_COMPRESS_ZSTD_THREADS).compress
 _decompress = ZstdDecompressor().decompress
 
+# stored value markers (first byte)
+_marker_raw = 0x00
+_marker_zstd = 0xFF
+# followed by the fresh_until unix timestamp (8 bytes, big-endian)
+_marker_raw_soft = 0x01
+_marker_zstd_soft = 0xFE
+_fresh_until_struct = struct.Struct('>Q')
+# zstd with the context dictionary, the marker encodes the dictionary version (1-126)
+_marker_zstd_dict_base = 0x01  # 0x02-0x7F
+_marker_zstd_dict_soft_base = 0x7F  # 0x80-0xFD, followed by fresh_until
+
+# in-process tier, cache_key -> (expires_at monotonic, value)
+_local: LRUCache[str, tuple[float, bytes]] = LRUCache(maxsize=CACHE_LOCAL_MAX_SIZE)
+# in-flight factories, cache_key -> factory task
+_inflight: dict[str, Task[bytes]] = {}
+# background refreshes, referenced until done
+_refresh_tasks: set[Task[None]] = set()
+
 
 class CacheEntry(NamedTuple):
     id: bytes
     value: bytes
 
 
+class CacheRequest(NamedTuple):
+    key: str | bytes
+    context: CacheContext
+    factory: Callable[[], Awaitable[bytes]]
+    hash_key: bool = False
+    negative_value: bytes | None = None
+    """Value to return and cache briefly if the factory fails."""
+
+
 class CacheService:
     @staticmethod
     async def get(
@@ -35,44 +74,298 @@ class CacheService:
         *,
         hash_key: bool = False,
         ttl: timedelta = CACHE_DEFAULT_EXPIRE,
+        stale_ttl: timedelta | None = None,
+        negative_value: bytes | None = None,
+        local: bool = False,
     ) -> CacheEntry:
         """
         Get a value from the cache.
 
         If the value is not in the cache, call the async factory to obtain it.
+        Concurrent misses for the same key share a single factory call.
+
+        With stale_ttl, an expired value is served for that much longer, while being refreshed in the background.
+        With negative_value, factory failures are cached for CACHE_NEGATIVE_EXPIRE, and negative_value is returned.
+        With local, the value is also cached in-process, for at most CACHE_LOCAL_MAX_EXPIRE.
+        """
+        return (
+            await CacheService.get_many(
+                (CacheRequest(key, context, factory, hash_key, negative_value),),
+                ttl=ttl,
+                stale_ttl=stale_ttl,
+                local=local,
+            )
+        )[0]
+
+    @staticmethod
+    async def get_many(
+        requests: Sequence[CacheRequest],
+        *,
+        ttl: timedelta = CACHE_DEFAULT_EXPIRE,
+        stale_ttl: timedelta | None = None,
+        local: bool = False,
+    ) -> list[CacheEntry]:
         """
-        if hash_key:
-            cache_id = hash_bytes(key)
-        elif isinstance(key, str):
-            cache_id = key.encode()
+        Get multiple values from the cache, in a single round trip.
+
+        Returns the entries in the same order as the requests.
+        """
+        num_requests: cython.Py_ssize_t = len(requests)
+        cache_ids: list[bytes] = [_get_cache_id(request) for request in requests]
+        cache_keys: list[str] = [
+            f'{request.context}:{cache_id.hex()}' for request, cache_id in zip(requests, cache_ids, strict=True)
+        ]
+        values: list[bytes | None] = [None] * num_requests
+        remote_indices: list[int] = []
+
+        i: cython.Py_ssize_t
+        if local:
+            now = time.monotonic()
+            for i in range(num_requests):
+                local_entry = _local.get(cache_keys[i])
+                if local_entry is not None and local_entry[0] > now:
+                    values[i] = local_entry[1]
+                else:
+                    remote_indices.append(i)
         else:
-            cache_id = key
+            remote_indices.extend(range(num_requests))
 
-        cache_key = f'{context}:{cache_id.hex()}'
+        if remote_indices:
+            async with valkey() as conn:
+                values_stored: list[bytes | None]
+                values_stored = await conn.mget([cache_keys[i] for i in remote_indices])
 
+                now_unix = time.time()
+                miss_indices: list[int] = []
+                for i, value_stored in zip(remote_indices, values_stored, strict=True):
+                    if value_stored is None:
+                        miss_indices.append(i)
+                        continue
+
+                    try:
+                        value, fresh_until = _decode_value(requests[i].context, value_stored)
+                    except (KeyError, ZstdError):
+                        # the dictionary version is no longer available
+                        logging.warning('Failed to decode cache %r value', cache_keys[i], exc_info=True)
+                        miss_indices.append(i)
+                        continue
+
+                    values[i] = value
+                    if fresh_until is not None and fresh_until < now_unix:
+                        _schedule_refresh(cache_keys[i], requests[i], ttl, stale_ttl)
+
+                if miss_indices:
+                    # on cache miss, call the factories to generate the values and cache them
+                    # (gather propagates the factory exceptions unwrapped, like a direct call)
+                    miss_results = await gather(*(_generate(cache_keys[i], requests[i]) for i in miss_indices))
+
+                    async with conn.pipeline(transaction=False) as pipe:
+                        for i, (value, is_negative) in zip(miss_indices, miss_results, strict=True):
+                            values[i] = value
+                            cache_key = cache_keys[i]
+                            context = requests[i].context
+                            if is_negative:
+                                value_stored = _encode_value(cache_key, context, value, None)
+                                pipe.set(cache_key, value_stored, ex=CACHE_NEGATIVE_EXPIRE, nx=True)
+                            else:
+                                value_stored = _encode_value(
+                                    cache_key, context, value, _get_fresh_until(ttl, stale_ttl)
+                                )
+                                pipe.set(cache_key, value_stored, ex=_get_expire(ttl, stale_ttl), nx=True)
+                        await pipe.execute()
+
+            if local:
+                now = time.monotonic()
+                expires_at = now + min(ttl, CACHE_LOCAL_MAX_EXPIRE).total_seconds()
+                # negative values may also come from the remote tier, recognize them by value
+                negative_expires_at = now + min(ttl, CACHE_LOCAL_MAX_EXPIRE, CACHE_NEGATIVE_EXPIRE).total_seconds()
+                for i in remote_indices:
+                    value = values[i]
+                    if value is not None and len(value) <= CACHE_LOCAL_MAX_VALUE_SIZE:
+                        is_negative_value = value == requests[i].negative_value
+                        _local[cache_keys[i]] = (negative_expires_at if is_negative_value else expires_at, value)
+
+        return [CacheEntry(id=cache_id, value=value) for cache_id, value in zip(cache_ids, values, strict=True)]  # pyright: ignore[reportArgumentType]
+
+    @staticmethod
+    async def sample(context: CacheContext, limit: int) -> list[bytes]:
+        """
+        Sample up to limit decoded values from the cache context.
+
+        Used for training the compression dictionaries.
+        """
+        result: list[bytes] = []
         async with valkey() as conn:
-            value_stored: bytes | None = await conn.get(cache_key)
+            async for keys in _scan_batches(conn.scan_iter(match=f'{context}:*', count=1000), 1000):
+                for value_stored in await conn.mget(keys):
+                    # skip the missing values and the refresh locks
+                    if not value_stored:
+                        continue
+                    try:
+                        result.append(_decode_value(context, value_stored)[0])
+                    except (KeyError, ZstdError):
+                        continue
+                    if len(result) >= limit:
+                        return result
+        return result
 
-            if value_stored is not None:
-                # on cache hit, decompress the value if needed (first byte is compression marker)
-                if value_stored[0] == 0xFF:
-                    value = _decompress(value_stored[1:], allow_extra_data=False)
-                else:
-                    value = value_stored[1:]
 
-            else:
-                # on cache miss, call the factory to generate the value and cache it
-                value = await factory()
+async def _scan_batches(keys: AsyncIterator[bytes], batch_size: int) -> AsyncIterator[list[bytes]]:
+    batch: list[bytes] = []
+    async for key in keys:
+        batch.append(key)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-                if not isinstance(value, bytes):  # pyright: ignore[reportUnnecessaryIsInstance]
-                    raise TypeError(f'Cache factory returned {type(value)!r}, expected bytes')
 
-                if len(value) >= CACHE_COMPRESS_MIN_SIZE:
-                    logging.debug('Compressing cache %r value of size %s', cache_key, sizestr(len(value)))
-                    value_stored = b'\xff' + _compress(value)
-                else:
-                    value_stored = b'\x00' + value
+@cython.cfunc
+def _get_cache_id(request: CacheRequest) -> bytes:
+    key = request.key
+    if request.hash_key:
+        return hash_bytes(key)
+    elif isinstance(key, str):
+        return key.encode()
+    else:
+        return key
+
+
+@cython.cfunc
+def _get_expire(ttl: timedelta, stale_ttl: timedelta | None) -> timedelta:
+    return ttl + stale_ttl if stale_ttl is not None else ttl
+
+
+@cython.cfunc
+def _get_fresh_until(ttl: timedelta, stale_ttl: timedelta | None) -> int | None:
+    return int(time.time() + ttl.total_seconds()) if stale_ttl is not None else None
+
+
+@cython.cfunc
+def _encode_value(cache_key: str, context: CacheContext, value: bytes, fresh_until: int | None) -> bytes:
+    marker: cython.int
+    soft: cython.char = fresh_until is not None
+    size: cython.Py_ssize_t = len(value)
+    dict_compressor = ZstdDict.get_compressor(context, level=CACHE_COMPRESS_ZSTD_LEVEL)
+
+    if dict_compressor is not None and size >= CACHE_COMPRESS_DICT_MIN_SIZE:
+        version, compressor = dict_compressor
+        logging.debug('Compressing cache %r value of size %s (dictionary v%d)', cache_key, sizestr(size), version)
+        value = compressor.compress(value)
+        marker = (_marker_zstd_dict_soft_base if soft else _marker_zstd_dict_base) + version
+    elif size >= CACHE_COMPRESS_MIN_SIZE:
+        logging.debug('Compressing cache %r value of size %s', cache_key, sizestr(size))
+        value = _compress(value)
+        marker = _marker_zstd_soft if soft else _marker_zstd
+    else:
+        marker = _marker_raw_soft if soft else _marker_raw
+
+    if soft:
+        return bytes((marker,)) + _fresh_until_struct.pack(fresh_until) + value
+    else:
+        return bytes((marker,)) + value
+
+
+@cython.cfunc
+def _decode_value(context: CacheContext, value_stored: bytes) -> tuple[bytes, int | None]:
+    marker: cython.int = value_stored[0]
+    soft: cython.char
+    if marker in (_marker_raw, _marker_zstd):
+        soft = False
+    elif marker in (_marker_raw_soft, _marker_zstd_soft):
+        soft = True
+    else:
+        soft = marker > _marker_zstd_dict_soft_base
+
+    if soft:
+        fresh_until: int | None = _fresh_until_struct.unpack_from(value_stored, 1)[0]
+        data = value_stored[1 + _fresh_until_struct.size :]
+    else:
+        fresh_until = None
+        data = value_stored[1:]
+
+    if marker in (_marker_raw, _marker_raw_soft):
+        return data, fresh_until
+    if marker in (_marker_zstd, _marker_zstd_soft):
+        return _decompress(data, allow_extra_data=False), fresh_until
+
+    version = marker - (_marker_zstd_dict_soft_base if soft else _marker_zstd_dict_base)
+    decompress = ZstdDict.get_decompressor(context, version).decompress
+    return decompress(data, allow_extra_data=False), fresh_until
+
+
+async def _generate(cache_key: str, request: CacheRequest) -> tuple[bytes, bool]:
+    """
+    Generate the value with the request factory.
+
+    Returns the value and whether it's negative.
+    """
+    try:
+        return await _single_flight(cache_key, request.factory), False
+    except Exception:
+        if request.negative_value is None:
+            raise
+        logging.warning('Cache %r factory failed, caching negative value', cache_key, exc_info=True)
+        return request.negative_value, True
+
+
+@cython.cfunc
+def _schedule_refresh(cache_key: str, request: CacheRequest, ttl: timedelta, stale_ttl: timedelta | None) -> None:
+    if cache_key in _inflight:
+        return
+    task = get_running_loop().create_task(_refresh(cache_key, request, ttl, stale_ttl))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def _refresh(cache_key: str, request: CacheRequest, ttl: timedelta, stale_ttl: timedelta | None) -> None:
+    """
+    Refresh a stale value in the background.
+
+    Only one refresh runs at a time across processes, a failed refresh keeps the stale value.
+    """
+    refresh_key = f'{cache_key}:refresh'
+    try:
+        async with valkey() as conn:
+            if not await conn.set(refresh_key, b'', ex=CACHE_REFRESH_LOCK_EXPIRE, nx=True):
+                return
+
+            logging.debug('Refreshing stale cache %r', cache_key)
+            value = await _single_flight(cache_key, request.factory)
+            await conn.set(
+                cache_key,
+                _encode_value(cache_key, request.context, value, _get_fresh_until(ttl, stale_ttl)),
+                ex=_get_expire(ttl, stale_ttl),
+            )
+            await conn.delete(refresh_key)
+    except Exception:
+        logging.warning('Failed to refresh stale cache %r', cache_key, exc_info=True)
+
+
+async def _single_flight(cache_key: str, factory: Callable[[], Awaitable[bytes]]) -> bytes:
+    """
+    Call the factory, coalescing concurrent calls for the same key.
+
+    The factory runs in its own task, so cancelling one caller doesn't affect the others.
+    """
+    task = _inflight.get(cache_key)
+    if task is None:
+        task = _inflight[cache_key] = get_running_loop().create_task(_call_factory(factory))
+        task.add_done_callback(lambda t: _on_factory_done(cache_key, t))
+    # shield: cancelling a caller must not cancel the shared call
+    return await shield(task)
+
+
+async def _call_factory(factory: Callable[[], Awaitable[bytes]]) -> bytes:
+    value = await factory()
+    if not isinstance(value, bytes):  # pyright: ignore[reportUnnecessaryIsInstance]
+        raise TypeError(f'Cache factory returned {type(value)!r}, expected bytes')
+    return value
 
-                await conn.set(cache_key, value_stored, ex=ttl, nx=True)
 
-        return CacheEntry(id=cache_id, value=value)
+def _on_factory_done(cache_key: str, task: Task[bytes]) -> None:
+    del _inflight[cache_key]
+    # mark the exception as retrieved, the callers (if any) re-raise it
+    if not task.cancelled():
+        task.exception()
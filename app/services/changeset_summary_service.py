@@ -0,0 +1,105 @@
+from collections.abc import AsyncIterable, AsyncIterator, Sequence
+
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+from app.format import Format06
+from app.format.element_list import FormatElementList
+from app.lib.file_cache import FileCache
+from app.lib.format_style_context import format_style
+from app.lib.translation import translation_locales
+from app.limits import (
+    CHANGESET_DOWNLOAD_STREAM_BATCH_SIZE,
+    CHANGESET_SUMMARY_CACHE_EXPIRE,
+    STORAGE_STREAM_CHUNK_SIZE,
+)
+from app.models.db.changeset import Changeset
+from app.models.element import ElementType
+from app.queries.element_query import ElementQuery
+from app.queries.user_query import UserQuery
+from app.responses.osm_response import OSMChangeResponse
+from app.utils import JSON_DECODE, JSON_ENCODE
+
+_elements_cache = FileCache('ChangesetElements')
+_osmchange_cache = FileCache('ChangesetOsmChange')
+_media_type_max_size = 256
+
+
+class ChangesetSummaryService:
+    @staticmethod
+    async def get_elements(changeset: Changeset) -> dict[ElementType, list]:
+        """
+        Get the formatted changeset elements, as ChangesetListEntry or their decoded form.
+
+        Results of closed changesets are cached, as they no longer change.
+        """
+        changeset_id = changeset.id
+        if changeset.closed_at is None:
+            elements = await ElementQuery.get_by_changeset(changeset_id, sort_by='id')
+            return await FormatElementList.changeset_elements(elements)
+
+        # element names are translated
+        locales = ','.join(translation_locales())
+        key = f'{changeset_id}:{locales}'
+        cached = await _elements_cache.get(key)
+        if cached is not None:
+            return JSON_DECODE(cached)
+
+        elements = await ElementQuery.get_by_changeset(changeset_id, sort_by='id')
+        result = await FormatElementList.changeset_elements(elements)
+        await _elements_cache.set(key, JSON_ENCODE(result), ttl=CHANGESET_SUMMARY_CACHE_EXPIRE)
+        return result
+
+    @staticmethod
+    async def get_osmchange(changeset: Changeset) -> Response:
+        """
+        Get the changeset osmChange, streamed as it is serialized.
+
+        Results of closed changesets are cached, as they no longer change.
+        """
+        changeset_id = changeset.id
+        if changeset.closed_at is None:
+            return _stream_osmchange(changeset_id)
+
+        key = f'{changeset_id}:{format_style()}'
+        cached = await _osmchange_cache.get(key)
+        if cached is not None:
+            header_size = bytes(cached[:_media_type_max_size]).index(b'\n') + 1
+            return StreamingResponse(
+                _iter_chunks(cached[header_size:]),
+                media_type=bytes(cached[: header_size - 1]).decode(),
+            )
+
+        response = _stream_osmchange(changeset_id)
+        response.body_iterator = _cache_osmchange(key, response.media_type or '', response.body_iterator)
+        return response
+
+
+def _stream_osmchange(changeset_id: int) -> StreamingResponse:
+    async def actions_stream() -> AsyncIterator[Sequence]:
+        async for elements in ElementQuery.stream_by_changeset(
+            changeset_id,
+            batch_size=CHANGESET_DOWNLOAD_STREAM_BATCH_SIZE,
+        ):
+            await UserQuery.resolve_elements_users(elements, display_name=True)
+            yield Format06.encode_osmchange(elements)
+
+    return OSMChangeResponse.serialize_stream({}, actions_stream(), stream_key='osmChange')
+
+
+async def _cache_osmchange(key: str, media_type: str, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    async def entry_chunks() -> AsyncIterator[bytes]:
+        # the media type header line, followed by the body
+        yield media_type.encode() + b'\n'
+        async for chunk in chunks:
+            yield chunk
+
+    stream = _osmchange_cache.tee(key, entry_chunks(), ttl=CHANGESET_SUMMARY_CACHE_EXPIRE)
+    await anext(stream)
+    async for chunk in stream:
+        yield chunk
+
+
+async def _iter_chunks(data: memoryview) -> AsyncIterator[memoryview]:
+    for i in range(0, len(data), STORAGE_STREAM_CHUNK_SIZE):
+        yield data[i : i + STORAGE_STREAM_CHUNK_SIZE]
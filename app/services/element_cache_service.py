@@ -0,0 +1,207 @@
+import logging
+from asyncio import get_running_loop, sleep
+from collections.abc import Collection, Iterable, Sequence
+from contextlib import asynccontextmanager
+
+import cython
+from lrucache_rs import LRUCache
+
+from app.db import valkey
+from app.limits import (
+    ELEMENT_CACHE_ELEMENTS_MAX_SIZE,
+    ELEMENT_CACHE_INDEX_MAX_SIZE,
+    ELEMENT_CACHE_LISTEN_RETRY_DELAY,
+    ELEMENT_CACHE_MEMBERS_MAX_SIZE,
+)
+from app.models.db.element import Element
+from app.models.db.element_member import ElementMember
+from app.models.element import ElementRef, VersionedElementRef
+from app.utils import JSON_DECODE, JSON_ENCODE
+
+_channel = 'element_cache_invalidate'
+
+# element rows and members by sequence_id, only next_sequence_id may change (once)
+_elements: LRUCache[int, Element] = LRUCache(maxsize=ELEMENT_CACHE_ELEMENTS_MAX_SIZE)
+_members: LRUCache[int, tuple[ElementMember, ...]] = LRUCache(maxsize=ELEMENT_CACHE_MEMBERS_MAX_SIZE)
+# versioned ref -> sequence_id, never changes
+_versioned_index: LRUCache[VersionedElementRef, int] = LRUCache(maxsize=ELEMENT_CACHE_INDEX_MAX_SIZE)
+# ref -> current sequence_id, None when invalidated
+_current_index: LRUCache[ElementRef, int | None] = LRUCache(maxsize=ELEMENT_CACHE_INDEX_MAX_SIZE)
+
+# current index is only trusted while receiving invalidations
+_listening: bool = False
+# incremented on every invalidation, prevents caching of results fetched before it
+_generation: int = 0
+
+
+class ElementCacheService:
+    @asynccontextmanager
+    @staticmethod
+    async def context():
+        """
+        Context manager for element cache service.
+
+        Listens for the published invalidations.
+        """
+        loop = get_running_loop()
+        task = loop.create_task(_listen_task())
+        yield
+        task.cancel()  # avoid "Task was destroyed" warning during tests
+
+    @staticmethod
+    def generation() -> int:
+        """
+        Get the current invalidation generation.
+
+        Must be obtained before querying the database, and passed to set_elements.
+        """
+        return _generation
+
+    @staticmethod
+    def get_by_ref(element_ref: ElementRef, *, at_sequence_id: int | None) -> Element | None:
+        """
+        Get the current element by the element ref.
+
+        Returns None if the element is not cached or the cache may be outdated.
+        """
+        if not _listening:
+            return None
+        sequence_id = _current_index.get(element_ref)
+        if sequence_id is None or (at_sequence_id is not None and sequence_id > at_sequence_id):
+            return None
+        element = _elements.get(sequence_id)
+        return _copy_element(element) if (element is not None) else None
+
+    @staticmethod
+    def get_by_versioned_ref(versioned_ref: VersionedElementRef, *, at_sequence_id: int | None) -> Element | None:
+        """
+        Get the element by the versioned ref.
+
+        Returns None if the element is not cached or the cache may be outdated.
+        """
+        sequence_id = _versioned_index.get(versioned_ref)
+        if sequence_id is None or (at_sequence_id is not None and sequence_id > at_sequence_id):
+            return None
+        element = _elements.get(sequence_id)
+        if element is None:
+            return None
+
+        # the current element may have been superseded in the meantime
+        if element.next_sequence_id is None and (
+            not _listening or _current_index.get(ElementRef(element.type, element.id)) != sequence_id
+        ):
+            return None
+
+        return _copy_element(element)
+
+    @staticmethod
+    def set_elements(elements: Iterable[Element], *, generation: int) -> None:
+        """
+        Cache the elements fetched from the database.
+
+        The elements are copied and their runtime fields are not cached.
+        """
+        is_current_valid: cython.char = _listening and generation == _generation
+        for element in elements:
+            sequence_id = element.sequence_id
+            _elements[sequence_id] = _copy_element(element)
+            _versioned_index[VersionedElementRef(element.type, element.id, element.version)] = sequence_id
+            if is_current_valid and element.next_sequence_id is None:
+                _current_index[ElementRef(element.type, element.id)] = sequence_id
+
+    @staticmethod
+    def get_members(sequence_id: int) -> tuple[ElementMember, ...] | None:
+        """
+        Get the element members by the element sequence_id.
+
+        Members never change, so they are always valid.
+        """
+        members = _members.get(sequence_id)
+        return tuple(map(_copy_member, members)) if (members is not None) else None
+
+    @staticmethod
+    def set_members(sequence_id: int, members: Sequence[ElementMember]) -> None:
+        """
+        Cache the element members by the element sequence_id.
+        """
+        _members[sequence_id] = tuple(map(_copy_member, members))
+
+    @staticmethod
+    async def invalidate(element_refs: Collection[ElementRef]) -> None:
+        """
+        Invalidate the current elements in this and other workers.
+
+        Must be called after the changes are committed.
+        """
+        if not element_refs:
+            return
+        _invalidate(element_refs)
+        async with valkey() as conn:
+            await conn.publish(_channel, JSON_ENCODE(element_refs))
+
+
+@cython.cfunc
+def _copy_element(element: Element) -> Element:
+    """
+    Copy the element database fields, without the runtime fields.
+
+    The init=False fields are not copied by the constructor and are set explicitly.
+    """
+    result = Element(
+        changeset_id=element.changeset_id,
+        type=element.type,
+        id=element.id,
+        version=element.version,
+        visible=element.visible,
+        tags=element.tags.copy(),
+        point=element.point,
+    )
+    result.sequence_id = element.sequence_id
+    result.next_sequence_id = element.next_sequence_id
+    result.created_at = element.created_at
+    return result
+
+
+@cython.cfunc
+def _copy_member(member: ElementMember) -> ElementMember:
+    result = ElementMember(order=member.order, type=member.type, id=member.id, role=member.role)
+    result.sequence_id = member.sequence_id
+    return result
+
+
+@cython.cfunc
+def _invalidate(element_refs: Iterable[Iterable]) -> None:
+    global _generation
+    _generation += 1
+    for element_ref in element_refs:
+        element_ref = ElementRef(*element_ref)
+        if _current_index.get(element_ref) is not None:
+            _current_index[element_ref] = None
+
+
+@cython.cfunc
+def _reset_current_index() -> None:
+    global _current_index, _generation
+    _generation += 1
+    _current_index = LRUCache(maxsize=ELEMENT_CACHE_INDEX_MAX_SIZE)
+
+
+async def _listen_task() -> None:
+    global _listening
+    retry_delay = ELEMENT_CACHE_LISTEN_RETRY_DELAY.total_seconds()
+    while True:
+        try:
+            async with valkey() as conn, conn.pubsub() as pubsub:
+                await pubsub.subscribe(_channel)
+                # invalidations may have been missed while not listening
+                _reset_current_index()
+                _listening = True
+                logging.debug('Listening for element cache invalidations')
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        _invalidate(JSON_DECODE(message['data']))
+        except Exception:
+            logging.warning('Element cache listener failed, retrying in %.1fs', retry_delay, exc_info=True)
+        finally:
+            _listening = False
+        await sleep(retry_delay)
@@ -26,10 +26,12 @@ class OptimisticDiff:
 
         ts = time.monotonic()
         attempt: cython.int = 0
+        prep: OptimisticDiffPrepare | None = None
         while True:
             try:
                 attempt += 1
-                prep = OptimisticDiffPrepare(elements)
+                # reuse the still-valid remote state from the previous attempt
+                prep = OptimisticDiffPrepare(elements, previous=prep)
                 await prep.prepare()
                 return await OptimisticDiffApply.apply(prep)
             except* (OptimisticDiffError, IntegrityError) as e:
@@ -1,30 +1,46 @@
 import logging
 from asyncio import Lock, TaskGroup
 from collections import defaultdict
-from collections.abc import Collection, Iterable, Mapping
+from collections.abc import Collection
 from datetime import datetime
 
 import cython
-from sqlalchemy import and_, null, or_, select, text, update
+from sqlalchemy import ARRAY, BigInteger, Boolean, bindparam, null, select, text, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import DeclarativeBase, aliased
+from sqlalchemy.orm import aliased
 
 from app.db import db_commit
 from app.exceptions.optimistic_diff_error import OptimisticDiffError
 from app.lib.date_utils import utcnow
+from app.lib.element_refs_table import match_refs, unnest_refs
 from app.models.db.changeset import Changeset
-from app.models.db.changeset_bounds import ChangesetBounds
 from app.models.db.element import Element
 from app.models.db.element_member import ElementMember
 from app.models.element import ElementId, ElementRef, ElementType, VersionedElementRef
-from app.queries.changeset_query import ChangesetQuery
 from app.queries.element_query import ElementQuery
+from app.services.element_cache_service import ElementCacheService
 from app.services.optimistic_diff.prepare import ElementStateEntry, OptimisticDiffPrepare
 
-# allow reads but prevent writes
-_lock_tables: tuple[type[DeclarativeBase], ...] = (Changeset, ChangesetBounds, Element, ElementMember)
-_lock_tables_names = (f'"{t.__tablename__}"' for t in _lock_tables)
-_lock_tables_sql = text(f'LOCK TABLE {",".join(_lock_tables_names)} IN EXCLUSIVE MODE')
+# advisory lock keys are (namespace << 60) | id
+_lock_namespace_shift = 60
+_lock_namespaces: dict[ElementType, int] = {
+    'node': 0,
+    'way': 1,
+    'relation': 2,
+}
+_lock_sequence_key = 3 << _lock_namespace_shift
+
+# locks are acquired in the key order to prevent deadlocks
+_lock_keys_sql = text(
+    'SELECT CASE WHEN shared THEN pg_advisory_xact_lock_shared(key) ELSE pg_advisory_xact_lock(key) END '
+    'FROM (SELECT * FROM unnest(:keys, :shared) AS t(key, shared) ORDER BY key) AS t'
+).bindparams(
+    bindparam('keys', type_=ARRAY(BigInteger)),
+    bindparam('shared', type_=ARRAY(Boolean)),
+)
+
+# serializes sequence_id allocation until commit, keeping the sequence gap-free and monotonic
+_lock_sequence_sql = text(f'SELECT pg_advisory_xact_lock({_lock_sequence_key})')
 
 # session.add() during .flush() is not supported
 _flush_lock = Lock()
@@ -44,29 +60,89 @@ class OptimisticDiffApply:
         if not assigned_ref_map:
             return {}
 
-        async with db_commit() as session, TaskGroup() as tg:
-            # obtain exclusive lock on the tables
-            await session.execute(_lock_tables_sql)
+        changeset = prepare.changeset
+        if changeset is None:
+            raise AssertionError('Changeset must be set')
 
-            # check if the element_state is valid
-            tg.create_task(_check_elements_latest(prepare.element_state))
+        async with db_commit() as session:
+            # obtain locks on the touched elements only,
+            # diffs that don't overlap can proceed concurrently
+            await _lock_keys(prepare, session)
 
-            # check if the elements have no new references
-            if prepare.reference_check_element_refs:
-                tg.create_task(
-                    _check_elements_unreferenced(
-                        prepare.reference_check_element_refs,
-                        prepare.at_sequence_id,
+            async with TaskGroup() as tg:
+                # lock the changeset row, conflicts with concurrent uploads, close and tags update
+                tg.create_task(_lock_changeset(changeset, session))
+
+                # check if the element_state is valid
+                tg.create_task(_check_elements_latest(prepare.element_state))
+
+                # check if the elements have no new references
+                if prepare.reference_check_element_refs:
+                    tg.create_task(
+                        _check_elements_unreferenced(
+                            prepare.reference_check_element_refs,
+                            prepare.at_sequence_id,
+                        )
                     )
-                )
 
-            now = utcnow()
-            tg.create_task(_update_changeset(prepare.changeset, now, session))  # pyright: ignore[reportArgumentType]
-            tg.create_task(_update_elements(prepare.apply_elements, now, session))
+                # check if the remote members are still visible, now that they're locked
+                members_refs = prepare.get_remote_members_refs()
+                if members_refs:
+                    tg.create_task(_check_members_visible(members_refs))
+
+            # keep the sequence lock as short as possible: after the checks, until commit
+            await session.execute(_lock_sequence_sql)
 
+            now = utcnow()
+            changeset.updated_at = now
+            changeset.auto_close_on_size(now)
+            session.add(changeset)
+            await _update_elements(prepare.apply_elements, now, session)
+
+        # the diff is committed, the cache invalidation is only a hint
+        try:
+            await ElementCacheService.invalidate(
+                tuple({ElementRef(element.type, element.id) for element, _ in prepare.apply_elements})
+            )
+        except Exception:
+            logging.warning('Failed to invalidate the element cache', exc_info=True)
         return assigned_ref_map
 
 
+async def _lock_keys(prepare: OptimisticDiffPrepare, session: AsyncSession) -> None:
+    """
+    Obtain transaction-level advisory locks for the diff.
+
+    Modified elements are locked exclusively.
+    Referenced members are locked in shared mode, to prevent their concurrent deletion.
+    """
+    namespaces = _lock_namespaces
+    shift = _lock_namespace_shift
+    exclusive: set[int] = set()
+    shared: set[int] = set()
+
+    for element, _ in prepare.apply_elements:
+        element_id = element.id
+        if element_id > 0:
+            exclusive.add((namespaces[element.type] << shift) | element_id)
+        element_members = element.members
+        if element_members:
+            for member in element_members:
+                member_id = member.id
+                if member_id > 0:
+                    shared.add((namespaces[member.type] << shift) | member_id)
+
+    shared.difference_update(exclusive)
+    logging.debug('Optimistic locking %d exclusive and %d shared keys', len(exclusive), len(shared))
+    await session.execute(
+        _lock_keys_sql,
+        {
+            'keys': [*exclusive, *shared],
+            'shared': [False] * len(exclusive) + [True] * len(shared),
+        },
+    )
+
+
 async def _check_elements_latest(element_state: dict[ElementRef, ElementStateEntry]) -> None:
     """
     Check if the elements are the current version.
@@ -92,23 +168,29 @@ async def _check_elements_unreferenced(element_refs: Collection[ElementRef], aft
         raise OptimisticDiffError(f'Element is referenced after {after_sequence_id}')
 
 
-async def _update_changeset(changeset: Changeset, now: datetime, session: AsyncSession) -> None:
+async def _check_members_visible(member_refs: Collection[ElementRef]) -> None:
+    """
+    Check if the members are currently visible.
+
+    Raises OptimisticDiffError if they are not.
     """
-    Update the changeset table.
+    visible_refs = await ElementQuery.filter_visible_refs(member_refs)
+    if len(visible_refs) != len(member_refs):
+        raise OptimisticDiffError('Element member was deleted')
+
+
+async def _lock_changeset(changeset: Changeset, session: AsyncSession) -> None:
+    """
+    Lock the changeset row until commit.
 
     Raises OptimisticDiffError if the changeset was modified in the meantime.
     """
     changeset_id = changeset.id
-    changeset_id_updated_map = await ChangesetQuery.get_updated_at_by_ids((changeset_id,))
-    updated_at = changeset_id_updated_map[changeset_id]
+    stmt = select(Changeset.updated_at).where(Changeset.id == changeset_id).with_for_update()
+    updated_at = await session.scalar(stmt)
     if changeset.updated_at != updated_at:
         raise OptimisticDiffError(f'Changeset {changeset_id} is outdated ({changeset.updated_at} != {updated_at})')
 
-    changeset.updated_at = now
-    changeset.auto_close_on_size(now)
-    async with _flush_lock:
-        session.add(changeset)
-
 
 async def _update_elements(
     elements: Collection[tuple[Element, ElementRef]],
@@ -124,7 +206,7 @@ async def _update_elements(
 
     current_sequence_id = current_sequence_task.result()
     current_id_map = current_id_task.result()
-    update_type_ids: dict[ElementType, list[ElementId]] = defaultdict(list)
+    update_refs: list[ElementRef] = []
     insert_members: list[ElementMember] = []
     prev_map: dict[ElementRef, Element] = {}
     assigned_id_map: dict[ElementRef, ElementId] = {}
@@ -140,7 +222,7 @@ async def _update_elements(
         if prev is not None:
             prev.next_sequence_id = sequence_id  # update locally
         elif element.version > 1:
-            update_type_ids[element.type].append(element.id)  # update remotely
+            update_refs.append(element_ref)  # update remotely
         prev_map[element_ref] = element
 
         # assign id
@@ -170,12 +252,12 @@ async def _update_elements(
                 member_ref = ElementRef(member.type, member.id)
                 member.id = assigned_id_map[member_ref]
 
-    await _update_elements_db(current_sequence_id, update_type_ids, insert_elements, insert_members, session)
+    await _update_elements_db(current_sequence_id, update_refs, insert_elements, insert_members, session)
 
 
 async def _update_elements_db(
     current_sequence_id: int,
-    update_type_ids: Mapping[ElementType, Iterable[ElementId]],
+    update_refs: Collection[ElementRef],
     insert_elements: Collection[Element],
     insert_members: Collection[ElementMember],
     session: AsyncSession,
@@ -189,22 +271,15 @@ async def _update_elements_db(
         session.add_all(insert_members)
         await session.flush()
 
-    if update_type_ids:
+    if update_refs:
         E = aliased(Element)  # noqa: N806
+        refs = unnest_refs(update_refs)
         stmt = (
             update(Element)
             .where(
+                match_refs(Element, refs),
                 Element.sequence_id <= current_sequence_id,
                 Element.next_sequence_id == null(),
-                or_(
-                    *(
-                        and_(
-                            Element.type == type,
-                            Element.id.in_(text(','.join(map(str, ids)))),
-                        )
-                        for type, ids in update_type_ids.items()
-                    ),
-                ),
             )
             .values(
                 {
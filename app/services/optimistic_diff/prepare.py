@@ -94,7 +94,27 @@ class OptimisticDiffPrepare:
     Changeset bounding box set of element refs.
     """
 
-    def __init__(self, elements: Collection[Element]) -> None:
+    _previous: 'OptimisticDiffPrepare | None'
+    """
+    Previous (failed) preparation attempt, used to reuse the remote state that is still valid.
+    """
+
+    _changed_refs: frozenset[ElementRef]
+    """
+    Set of element refs modified since the previous attempt.
+    """
+
+    _members_prefetch_refs: frozenset[ElementRef]
+    """
+    Set of remote member refs of the created elements, checked for visibility during the preload.
+    """
+
+    _members_prefetch_visible_refs: frozenset[ElementRef]
+    """
+    Subset of the prefetched member refs that are visible.
+    """
+
+    def __init__(self, elements: Collection[Element], *, previous: 'OptimisticDiffPrepare | None' = None) -> None:
         self.at_sequence_id = 0
         self.apply_elements = []
         self._elements = tuple((element, ElementRef(element.type, element.id)) for element in elements)
@@ -106,14 +126,22 @@ class OptimisticDiffPrepare:
         self.changeset = None
         self._bbox_points = []
         self._bbox_refs = set()
+        self._previous = previous
+        self._changed_refs = frozenset()
+        self._members_prefetch_refs = frozenset()
+        self._members_prefetch_visible_refs = frozenset()
 
     async def prepare(self) -> None:
+        self._prevalidate()
         await self._set_sequence_id()
+        await self._load_changed_refs()
         async with TaskGroup() as tg:
             tg.create_task(self._preload_elements_state())
             tg.create_task(self._preload_elements_parents())
             tg.create_task(self._preload_changeset())
+            tg.create_task(self._prefetch_members_visible())
 
+        # the remaining checks depend on the state left by the preceding elements, so they run in input order
         for element_t in self._elements:
             element, element_ref = element_t
             element_type = element.type
@@ -124,8 +152,6 @@ class OptimisticDiffPrepare:
             if element.version == 1:
                 action = 'create'
 
-                if element.id >= 0:
-                    raise_for().diff_create_bad_id(element)
                 if element_ref in self.element_state:
                     raise AssertionError(f'Element {element_ref!r} must not exist in the element state')
 
@@ -167,6 +193,44 @@ class OptimisticDiffPrepare:
             tg.create_task(self._update_changeset_bounds())
             tg.create_task(self._check_members_remote())
 
+        # release the previous attempt, it's no longer needed
+        self._previous = None
+
+    def get_remote_members_refs(self) -> set[ElementRef]:
+        """
+        Get the newly added member refs that were checked against the database.
+        """
+        result: set[ElementRef] = set()
+        for _, member_refs in self._elements_check_members_remote:
+            result.update(member_refs)
+        return result
+
+    def _prevalidate(self) -> None:
+        """
+        Validate the elements independently of the state, before any remote loads.
+
+        Collect the remote member refs of the created elements, for prefetching.
+        """
+        input_refs: set[ElementRef] = {element_ref for _, element_ref in self._elements}
+        prefetch_refs: set[ElementRef] = set()
+
+        for element, _ in self._elements:
+            if element.version != 1:
+                continue
+            if element.id >= 0:
+                raise_for().diff_create_bad_id(element)
+
+            # all members of the created elements are newly added
+            element_members = element.members
+            if not element_members:
+                continue
+            for member in element_members:
+                if member.id > 0:
+                    prefetch_refs.add(ElementRef(member.type, member.id))
+
+        prefetch_refs.difference_update(input_refs)
+        self._members_prefetch_refs = frozenset(prefetch_refs)
+
     async def _set_sequence_id(self) -> None:
         """
         Set the current sequence_id.
@@ -176,38 +240,71 @@ class OptimisticDiffPrepare:
         self.at_sequence_id = await ElementQuery.get_current_sequence_id()
         logging.debug('Optimistic preparing at sequence_id %d', self.at_sequence_id)
 
+    async def _load_changed_refs(self) -> None:
+        """
+        Load the element refs modified since the previous attempt.
+        """
+        previous = self._previous
+        if previous is None:
+            return
+
+        refs: set[ElementRef] = {ref for ref, entry in previous.element_state.items() if entry.remote is not None}
+        for parents_refs in previous._elements_parents_refs.values():  # noqa: SLF001
+            refs.update(parents_refs)
+        if not refs:
+            return
+
+        self._changed_refs = changed_refs = frozenset(
+            await ElementQuery.filter_changed_refs(refs, after_sequence_id=previous.at_sequence_id)
+        )
+        logging.debug('Optimistic found %d/%d elements changed since last attempt', len(changed_refs), len(refs))
+
     async def _preload_elements_state(self) -> None:
         """
         Preload elements state from the database.
+
+        On retry, the unchanged remote elements are reused from the previous attempt.
         """
         # only preload elements that exist in the database (positive id)
         refs: set[ElementRef] = {ref for _, ref in self._elements if ref.id > 0}
         if not refs:
             return
 
-        refs_len = len(refs)
-        logging.debug('Optimistic preloading %d elements', refs_len)
-        elements = await ElementQuery.get_by_refs(
-            refs,
-            at_sequence_id=self.at_sequence_id,
-            limit=refs_len,
-        )
+        reused: list[Element] = []
+        previous = self._previous
+        if previous is not None:
+            changed_refs = self._changed_refs
+            for ref, entry in previous.element_state.items():
+                remote = entry.remote
+                if remote is not None and ref in refs and ref not in changed_refs:
+                    reused.append(remote)
+            refs.difference_update(ElementRef(element.type, element.id) for element in reused)
+
+        elements: list[Element] = []
+        if refs:
+            refs_len = len(refs)
+            logging.debug('Optimistic preloading %d elements (reused %d)', refs_len, len(reused))
+            elements = await ElementQuery.get_by_refs(
+                refs,
+                at_sequence_id=self.at_sequence_id,
+                limit=refs_len,
+            )
+
+            # check if all elements exist
+            if len(elements) != refs_len:
+                refs.difference_update(ElementRef(element.type, element.id) for element in elements)
+                element_ref = next(iter(refs))
+                raise_for().element_not_found(element_ref)
 
-        # check if all elements exist
-        if len(elements) != refs_len:
-            refs.difference_update(ElementRef(element.type, element.id) for element in elements)
-            element_ref = next(iter(refs))
-            raise_for().element_not_found(element_ref)
+            logging.debug('Optimistic preloading members for %d elements', refs_len)
+            await ElementMemberQuery.resolve_members(elements)
 
-        # if they do, push them to the element state
+        # push them to the element state
         self.element_state = {
             ElementRef(element.type, element.id): ElementStateEntry(remote=element, current=element)
-            for element in elements
+            for element in chain(reused, elements)
         }
 
-        logging.debug('Optimistic preloading members for %d elements', refs_len)
-        await ElementMemberQuery.resolve_members(elements)
-
     async def _preload_elements_parents(self) -> None:
         """
         Preload elements parents from the database.
@@ -221,6 +318,21 @@ class OptimisticDiffPrepare:
         if not refs:
             return
 
+        # on retry, reuse the parents if none of them changed and no new references were added
+        previous = self._previous
+        if (
+            previous is not None
+            and refs.issubset(previous._elements_parents_refs)  # noqa: SLF001
+            and not any(
+                ref in self._changed_refs or not self._changed_refs.isdisjoint(parents_refs)
+                for ref, parents_refs in previous._elements_parents_refs.items()  # noqa: SLF001
+            )
+            and await ElementQuery.check_is_unreferenced(refs, previous.at_sequence_id)
+        ):
+            logging.debug('Optimistic reusing parents for %d elements', len(refs))
+            self._elements_parents_refs = previous._elements_parents_refs  # noqa: SLF001
+            return
+
         refs_len = len(refs)
         logging.debug('Optimistic preloading parents for %d elements', refs_len)
         member_parents_map = await ElementQuery.get_parents_refs_by_refs(
@@ -229,8 +341,8 @@ class OptimisticDiffPrepare:
             limit=None,
         )
         self._elements_parents_refs = {
-            member_ref: frozenset(parents_refs)  #
-            for member_ref, parents_refs in member_parents_map.items()
+            member_ref: frozenset(member_parents_map.get(member_ref, ()))  #
+            for member_ref in refs
         }
 
     def _check_element_can_delete(self, element: Element, element_ref: ElementRef) -> bool:
@@ -324,17 +436,33 @@ class OptimisticDiffPrepare:
         if notfound:
             self._elements_check_members_remote.append((parent_ref, notfound))
 
+    async def _prefetch_members_visible(self) -> None:
+        """
+        Check the remote members of the created elements for visibility, concurrently with the preload.
+        """
+        refs = self._members_prefetch_refs
+        if not refs:
+            return
+
+        logging.debug('Optimistic prefetching visibility of %d members', len(refs))
+        self._members_prefetch_visible_refs = frozenset(
+            await ElementQuery.filter_visible_refs(refs, at_sequence_id=self.at_sequence_id)
+        )
+
     async def _check_members_remote(self) -> None:
         """
         Check if the members exist and are visible using the database.
         """
-        remote_refs: set[ElementRef] = set()
-        for _, member_refs in self._elements_check_members_remote:
-            remote_refs.update(member_refs)
+        remote_refs = self.get_remote_members_refs()
         if not remote_refs:
             return
 
-        visible_refs = await ElementQuery.filter_visible_refs(remote_refs, at_sequence_id=self.at_sequence_id)
+        # reuse the prefetched visibility, query only the remaining refs
+        prefetch_refs = self._members_prefetch_refs
+        query_refs = remote_refs.difference(prefetch_refs)
+        visible_refs = set(self._members_prefetch_visible_refs)
+        if query_refs:
+            visible_refs.update(await ElementQuery.filter_visible_refs(query_refs, at_sequence_id=self.at_sequence_id))
         hidden_refs = remote_refs.difference(visible_refs)
         hidden_ref = next(iter(hidden_refs), None)
         if hidden_ref is None:
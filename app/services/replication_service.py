@@ -0,0 +1,201 @@
+import logging
+import zlib
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
+from typing import Literal, NamedTuple
+
+import cython
+from sqlalchemy import text
+from zstandard import ZstdCompressor
+
+from app.config import GENERATOR
+from app.db import db
+from app.format import Format06
+from app.lib.date_utils import utcnow
+from app.lib.storage.base import StorageBase
+from app.lib.xmltodict import XMLToDict
+from app.limits import (
+    REPLICATION_BATCH_SIZE,
+    REPLICATION_COMPRESS_GZIP_LEVEL,
+    REPLICATION_COMPRESS_ZSTD_LEVEL,
+    REPLICATION_MAX_ELEMENTS,
+)
+from app.models.types import StorageKey
+from app.queries.element_query import ElementQuery
+from app.queries.user_query import UserQuery
+from app.storage import REPLICATION_HOUR_STORAGE, REPLICATION_MINUTE_STORAGE
+
+ReplicationInterval = Literal['minute', 'hour']
+ReplicationCompression = Literal['gz', 'zst']
+
+_storages: dict[ReplicationInterval, StorageBase] = {
+    'minute': REPLICATION_MINUTE_STORAGE,
+    'hour': REPLICATION_HOUR_STORAGE,
+}
+
+# advisory lock keys, outside of the optimistic diff namespaces (0-3)
+_lock_keys: dict[ReplicationInterval, int] = {
+    'minute': (4 << 60) | 0,
+    'hour': (4 << 60) | 1,
+}
+
+_state_key = StorageKey('state.txt')
+
+
+class ReplicationState(NamedTuple):
+    sequence_number: int
+    """Replication file number, incremented by one for each file."""
+    sequence_id: int
+    """The last element sequence id included in the replication."""
+    timestamp: datetime
+    """Time up to which the changes are included."""
+
+
+class ReplicationService:
+    @staticmethod
+    async def init(interval: ReplicationInterval) -> ReplicationState:
+        """
+        Initialize the replication at the current element sequence id.
+
+        Overwrites any existing state.
+        """
+        state = ReplicationState(
+            sequence_number=0,
+            sequence_id=await ElementQuery.get_current_sequence_id(),
+            timestamp=utcnow(),
+        )
+        storage = _storages[interval]
+        await storage.put(_get_state_key(state.sequence_number), _encode_state(state))
+        await storage.put(_state_key, _encode_state(state))
+        return state
+
+    @staticmethod
+    async def get_state(interval: ReplicationInterval) -> ReplicationState:
+        """
+        Get the current replication state.
+        """
+        return _decode_state(await _storages[interval].load(_state_key))
+
+    @staticmethod
+    async def generate(
+        interval: ReplicationInterval,
+        *,
+        compression: ReplicationCompression = 'gz',
+    ) -> ReplicationState | None:
+        """
+        Generate the next replication file and return the new state.
+
+        The files are written before the state, so consumers never observe a state without its data.
+        Returns None if another replication process is running.
+        """
+        storage = _storages[interval]
+        async with db() as session:
+            # held until the session is closed
+            stmt = text(f'SELECT pg_try_advisory_xact_lock({_lock_keys[interval]})')
+            if not await session.scalar(stmt):
+                logging.info('Replication %r is already running', interval)
+                return None
+
+            state = _decode_state(await storage.load(_state_key))
+            now = utcnow()
+            last_created_at = state.timestamp
+            last_sequence_id = state.sequence_id
+            num_elements = 0
+
+            async def changes() -> AsyncIterator[list[tuple[str, dict]]]:
+                nonlocal last_created_at, last_sequence_id, num_elements
+                async for elements in ElementQuery.stream_many_by_sequence_id(
+                    state.sequence_id,
+                    limit=REPLICATION_MAX_ELEMENTS,
+                    batch_size=REPLICATION_BATCH_SIZE,
+                ):
+                    last_element = elements[-1]
+                    last_created_at = last_element.created_at
+                    last_sequence_id = last_element.sequence_id
+                    num_elements += len(elements)
+                    await UserQuery.resolve_elements_users(elements, display_name=True)
+                    yield Format06.encode_osmchange(elements)  # pyright: ignore[reportReturnType]
+
+            async def compressed() -> AsyncIterator[bytes]:
+                compressor = _get_compressor(compression)
+                async for chunk in XMLToDict.unparse_stream(
+                    'osmChange',
+                    {'@version': '0.6', '@generator': GENERATOR},
+                    changes(),
+                ):
+                    compressed_chunk = compressor.compress(chunk)
+                    if compressed_chunk:
+                        yield compressed_chunk
+                yield compressor.flush()
+
+            # the state depends on the streamed elements, it's known only after the file is written
+            sequence_number = state.sequence_number + 1
+            await storage.put_stream(StorageKey(f'{sequence_number:09d}.osc.{compression}'), compressed())
+
+            new_state = ReplicationState(
+                sequence_number=sequence_number,
+                sequence_id=last_sequence_id,
+                # below the limit, the replication is caught up to the start of the run
+                timestamp=now if num_elements < REPLICATION_MAX_ELEMENTS else last_created_at,
+            )
+            encoded_state = _encode_state(new_state)
+            await storage.put(_get_state_key(sequence_number), encoded_state)
+            await storage.put(_state_key, encoded_state)
+
+        logging.info(
+            'Generated %s replication %d with %d elements (up to sequence id %d)',
+            interval,
+            sequence_number,
+            num_elements,
+            new_state.sequence_id,
+        )
+        return new_state
+
+
+@cython.cfunc
+def _get_state_key(sequence_number: int) -> StorageKey:
+    return StorageKey(f'{sequence_number:09d}.state.txt')
+
+
+@cython.cfunc
+def _get_compressor(compression: ReplicationCompression):
+    if compression == 'gz':
+        return zlib.compressobj(REPLICATION_COMPRESS_GZIP_LEVEL, wbits=31)  # 31 = gzip container
+    if compression == 'zst':
+        return ZstdCompressor(level=REPLICATION_COMPRESS_ZSTD_LEVEL).compressobj()
+    raise NotImplementedError(f'Unsupported replication compression {compression!r}')
+
+
+@cython.cfunc
+def _encode_state(state: ReplicationState) -> bytes:
+    """
+    Encode the replication state in the osmosis state.txt format.
+
+    >>> _encode_state(ReplicationState(1, 100, datetime(2024, 1, 1, tzinfo=UTC)))
+    b'#Mon Jan 01 00:00:00 UTC 2024\\nsequenceNumber=1\\nsequenceId=100\\ntimestamp=2024-01-01T00\\\\:00\\\\:00Z\\n'
+    """
+    timestamp = state.timestamp.astimezone(UTC)
+    return (
+        f'#{timestamp:%a %b %d %H:%M:%S} UTC {timestamp:%Y}\n'
+        f'sequenceNumber={state.sequence_number}\n'
+        f'sequenceId={state.sequence_id}\n'
+        f'timestamp={timestamp:%Y-%m-%dT%H\\:%M\\:%SZ}\n'
+    ).encode()
+
+
+@cython.cfunc
+def _decode_state(data: bytes) -> ReplicationState:
+    """
+    Decode the replication state from the osmosis state.txt format.
+    """
+    values: dict[str, str] = {}
+    for line in data.decode().splitlines():
+        if not line or line[0] == '#':
+            continue
+        key, _, value = line.partition('=')
+        values[key.strip()] = value.strip().replace('\\', '')
+    return ReplicationState(
+        sequence_number=int(values['sequenceNumber']),
+        sequence_id=int(values['sequenceId']),
+        timestamp=datetime.strptime(values['timestamp'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=UTC),
+    )
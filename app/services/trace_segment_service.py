@@ -0,0 +1,105 @@
+import struct
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from itertools import batched
+from weakref import WeakSet
+
+import cython
+import numpy as np
+from asyncpg import Connection
+from numpy.typing import NDArray
+from shapely import MultiPoint, bounds, get_coordinates, get_num_geometries
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.lib.geo_utils import hilbert_key
+from app.limits import TRACE_SEGMENT_INSERT_BATCH_SIZE
+from app.models.db.trace_segment import TraceSegment
+
+# (trace_id, track_num, segment_num, points, capture_times, elevations)
+TraceSegmentRow = tuple[int, int, int, MultiPoint, list[datetime | None] | None, list[float | None] | None]
+
+_columns = ('trace_id', 'track_num', 'segment_num', 'points', 'capture_times', 'elevations', 'spatial_key')
+
+# little-endian EWKB: byte order, type with SRID flag, SRID, number of points
+_multipoint_header_struct = struct.Struct('<BIII')
+_multipoint_type = 0x20000004
+_point_dtype = np.dtype([('byte_order', 'u1'), ('type', '<u4'), ('x', '<f8'), ('y', '<f8')])
+
+# connections with the geometry binary codec registered
+_codec_connections: WeakSet[Connection] = WeakSet()
+
+
+class TraceSegmentService:
+    @staticmethod
+    async def insert_many(session: AsyncSession, rows: Iterable[TraceSegmentRow]) -> None:
+        """
+        Insert the trace segment rows within the session transaction.
+        """
+        connection = await (await session.connection()).get_raw_connection()
+        await TraceSegmentService.copy_rows(connection.driver_connection, rows)  # pyright: ignore[reportArgumentType]
+
+    @staticmethod
+    def get_spatial_keys(geoms: NDArray[np.object_]) -> NDArray[np.int64]:
+        """
+        Get the spatial keys of the segments points, from their bounds center.
+        """
+        segments_bounds = bounds(geoms)
+        return hilbert_key(
+            (segments_bounds[:, 0] + segments_bounds[:, 2]) / 2,
+            (segments_bounds[:, 1] + segments_bounds[:, 3]) / 2,
+        )
+
+    @staticmethod
+    async def copy_rows(connection: Connection, rows: Iterable[TraceSegmentRow]) -> None:
+        """
+        Insert the trace segment rows using binary COPY.
+
+        Geometries are encoded as EWKB in batches, bypassing the ORM.
+        """
+        if connection not in _codec_connections:
+            # PostGIS geometry binary format is EWKB
+            await connection.set_type_codec(
+                'geometry',
+                schema='public',
+                encoder=bytes,
+                decoder=bytes,
+                format='binary',
+            )
+            _codec_connections.add(connection)
+
+        await connection.copy_records_to_table(
+            TraceSegment.__tablename__,
+            records=_encode_rows(rows),
+            columns=_columns,
+        )
+
+
+def _encode_rows(rows: Iterable[TraceSegmentRow]) -> Iterator[tuple]:
+    for batch in batched(rows, TRACE_SEGMENT_INSERT_BATCH_SIZE):
+        geoms = np.array([row[3] for row in batch], dtype=object)
+        points_ewkb = _encode_multipoints_ewkb(get_coordinates(geoms), get_num_geometries(geoms))
+        spatial_keys = TraceSegmentService.get_spatial_keys(geoms).tolist()
+        for row, points, spatial_key in zip(batch, points_ewkb, spatial_keys, strict=True):
+            yield row[0], row[1], row[2], points, row[4], row[5], spatial_key
+
+
+@cython.cfunc
+def _encode_multipoints_ewkb(coords: np.ndarray, sizes: np.ndarray) -> list[bytes]:
+    """
+    Encode the coordinates as EWKB multipoints, split by sizes.
+    """
+    points = np.empty(len(coords), _point_dtype)
+    points['byte_order'] = 1
+    points['type'] = 1
+    points['x'] = coords[:, 0]
+    points['y'] = coords[:, 1]
+    data = points.tobytes()
+
+    point_size: cython.Py_ssize_t = _point_dtype.itemsize
+    offset: cython.Py_ssize_t = 0
+    result: list[bytes] = []
+    for size in sizes.tolist():
+        end = offset + size * point_size
+        result.append(_multipoint_header_struct.pack(1, _multipoint_type, 4326, size) + data[offset:end])
+        offset = end
+    return result
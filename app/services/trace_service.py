@@ -1,25 +1,62 @@
 import logging
+from asyncio import Lock, get_running_loop, sleep
+from collections.abc import AsyncIterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from multiprocessing import get_context
 
 import cython
 import numpy as np
 from fastapi import UploadFile
-from shapely import lib
+from numpy.typing import NDArray
+from shapely import Point, lib
+from sqlalchemy import null, or_, select, true
 
 from app.db import db_commit
+from app.exceptions import Exceptions
 from app.format.gpx import FormatGPX
 from app.lib.auth_context import auth_user
 from app.lib.date_utils import utcnow
-from app.lib.exceptions_context import raise_for
+from app.lib.exceptions_context import exceptions_context, raise_for
 from app.lib.trace_file import TraceFile
-from app.lib.xmltodict import XMLToDict
-from app.limits import TRACE_FILE_UPLOAD_MAX_SIZE
+from app.lib.trace_preview import TracePreview
+from app.limits import (
+    STORAGE_STREAM_CHUNK_SIZE,
+    TRACE_FILE_BACKGROUND_MIN_SIZE,
+    TRACE_FILE_UPLOAD_MAX_SIZE,
+    TRACE_PROCESS_CLAIM_EXPIRE,
+    TRACE_PROCESS_SWEEP_INTERVAL,
+    TRACE_PROCESS_WORKERS,
+)
 from app.models.db.trace_ import Trace, TraceVisibility
 from app.models.db.trace_segment import TraceSegment
 from app.models.validating.trace_ import TraceValidating
+from app.services.trace_segment_service import TraceSegmentService
 from app.storage import TRACES_STORAGE
 
+_process_lock = Lock()
+# set when processing is requested while already running, checked before it finishes
+_process_rerun: bool = False
+_process_pool: ProcessPoolExecutor | None = None
+
 
 class TraceService:
+    @asynccontextmanager
+    @staticmethod
+    async def context():
+        """
+        Context manager for trace service.
+        """
+        global _process_pool
+        with ProcessPoolExecutor(TRACE_PROCESS_WORKERS, mp_context=get_context('spawn')) as pool:
+            _process_pool = pool
+            loop = get_running_loop()
+            # resume processing of the traces left pending by a restart or a failed worker
+            task = loop.create_task(_process_sweep_task())
+            yield
+            task.cancel()  # avoid "Task was destroyed" warning during tests
+            _process_pool = None
+
     @staticmethod
     async def upload(
         file: UploadFile,
@@ -31,44 +68,44 @@ class TraceService:
         """
         Process upload of a trace file.
 
+        Large files are stored as pending and processed in the background.
         Returns the created trace object.
         """
         file_size = file.size
         if file_size is None or file_size > TRACE_FILE_UPLOAD_MAX_SIZE:
             raise_for().input_too_big(file_size or -1)
 
-        file_bytes = await file.read()
-        segments: list[TraceSegment] = []
+        if file_size >= TRACE_FILE_BACKGROUND_MIN_SIZE:
+            trace = _create_trace(file, description=description, tags=tags, visibility=visibility, size=None)
+            trace.pending = True
+            await _save_file(trace, file)
+            try:
+                async with db_commit() as session:
+                    session.add(trace)
+            except Exception:
+                # clean up trace file on error
+                await TRACES_STORAGE.delete(trace.file_id)
+                raise
+
+            loop = get_running_loop()
+            loop.create_task(_process_task())  # noqa: RUF006
+            return trace
 
-        # process multiple files in the archive
+        file_bytes = await file.read()
         try:
-            for gpx_bytes in TraceFile.extract(file_bytes):
-                tracks = XMLToDict.parse(gpx_bytes).get('gpx', {}).get('trk', [])
-                track_num_start = (segments[-1].track_num + 1) if segments else 0
-                segments.extend(FormatGPX.decode_tracks(tracks, track_num_start=track_num_start))
+            segments, coords = _parse_file(file_bytes)
         except Exception as e:
             raise_for().bad_trace_file(str(e))
 
-        size = sum(
-            len(lib.get_coordinates(np.asarray(segment.points, dtype=object), False, False))  #
-            for segment in segments
-        )
+        size = len(coords)
         logging.debug('Organized %d points into %d segments', size, len(segments))
         if size < 2:
             raise_for().bad_trace_file('not enough points')
 
-        trace = Trace(
-            **TraceValidating(
-                user_id=auth_user(required=True).id,
-                name=_get_file_name(file),
-                description=description,
-                visibility=visibility,
-                size=size,
-            ).__dict__
-        )
-        trace.tag_string = tags
-        compressed_file, compressed_suffix = TraceFile.compress(file_bytes)
-        trace.file_id = await TRACES_STORAGE.save(compressed_file, compressed_suffix)
+        trace = _create_trace(file, description=description, tags=tags, visibility=visibility, size=size)
+        trace.preview = TracePreview.encode(coords)
+        trace.start_point = Point(coords[0])
+        await _save_file(trace, file)
 
         try:
             async with db_commit() as session:
@@ -76,9 +113,10 @@ class TraceService:
                 await session.flush()
 
                 trace_id = trace.id
-                for segment in segments:
-                    segment.trace_id = trace_id
-                session.add_all(segments)
+                await TraceSegmentService.insert_many(
+                    session,
+                    ((trace_id, *segment_data) for segment_data in _get_segments_data(segments)),
+                )
 
         except Exception:
             # clean up trace file on error
@@ -128,6 +166,191 @@ class TraceService:
             await session.delete(trace)
 
 
+async def _process_sweep_task() -> None:
+    """
+    Periodically process pending traces.
+    """
+    while True:
+        await _process_task()
+        await sleep(TRACE_PROCESS_SWEEP_INTERVAL.total_seconds())
+
+
+async def _process_task() -> None:
+    """
+    Process pending traces in the database.
+    """
+    global _process_rerun
+    if _process_lock.locked():
+        _process_rerun = True
+        return
+    async with _process_lock:
+        try:
+            await _process_task_inner()
+        except Exception:
+            logging.warning('Trace processing failed', exc_info=True)
+
+
+async def _process_task_inner() -> None:
+    global _process_rerun
+    logging.debug('Started pending trace processing')
+    loop = get_running_loop()
+
+    while True:
+        # traces committed after the claim query started request a rerun
+        _process_rerun = False
+        trace = await _claim_pending_trace()
+        if trace is None:
+            if _process_rerun:
+                continue
+            logging.debug('Finished pending trace processing')
+            return
+
+        # process outside of a transaction, it may take a while
+        try:
+            file_buffer = await TRACES_STORAGE.load(trace.file_id)
+            file_bytes = bytes(TraceFile.decompress_if_needed(file_buffer, trace.file_id))
+            result = await loop.run_in_executor(_process_pool, _process_file, file_bytes)
+        except Exception:
+            # the upload is rejected, as it would be if processed synchronously
+            logging.info('Deleting trace %d, failed to process', trace.id, exc_info=True)
+            result = None
+
+        await _finish_pending_trace(trace, result)
+
+
+async def _claim_pending_trace() -> Trace | None:
+    """
+    Claim the next pending trace for processing.
+
+    Traces claimed by a worker that died are reclaimed after TRACE_PROCESS_CLAIM_EXPIRE.
+    """
+    now = utcnow()
+    async with db_commit() as session:
+        stmt = (
+            select(Trace)
+            .where(
+                Trace.pending == true(),
+                or_(Trace.processing_at == null(), Trace.processing_at < now - TRACE_PROCESS_CLAIM_EXPIRE),
+            )
+            .order_by(Trace.id)
+            .with_for_update(skip_locked=True)
+            .limit(1)
+        )
+        trace = await session.scalar(stmt)
+        if trace is None:
+            return None
+        trace.processing_at = now
+    return trace
+
+
+async def _finish_pending_trace(claimed: Trace, result: tuple[int, bytes, Point, list[tuple]] | None) -> None:
+    """
+    Store the processing result, or delete the trace if it failed.
+
+    Nothing is stored if the trace was deleted or reclaimed in the meantime.
+    """
+    trace_id = claimed.id
+    async with db_commit() as session:
+        trace = await session.get(Trace, trace_id, with_for_update=True)
+        if trace is None or not trace.pending or trace.processing_at != claimed.processing_at:
+            logging.info('Discarding trace %d processing result, no longer claimed', trace_id)
+            return
+
+        if result is None:
+            await session.delete(trace)
+        else:
+            size, preview, start_point, segments_data = result
+            logging.debug('Organized %d points into %d segments', size, len(segments_data))
+            await TraceSegmentService.insert_many(
+                session,
+                ((trace_id, *segment_data) for segment_data in segments_data),
+            )
+            trace.size = size
+            trace.preview = preview
+            trace.start_point = start_point
+            trace.pending = False
+            trace.processing_at = None
+
+    if result is None:
+        await TRACES_STORAGE.delete(claimed.file_id)
+
+
+def _process_file(file_bytes: bytes) -> tuple[int, bytes, Point, list[tuple]]:
+    """
+    Parse the trace file in a worker process.
+
+    Returns the number of points, the preview, the start point, and the segments data.
+    """
+    # raise_for() is request-scoped, use the generic implementation
+    with exceptions_context(Exceptions()):
+        try:
+            segments, coords = _parse_file(file_bytes)
+        except Exception as e:
+            # not all exceptions survive pickling
+            raise ValueError(str(e)) from None
+
+    size = len(coords)
+    if size < 2:
+        raise ValueError('not enough points')
+
+    return size, TracePreview.encode(coords), Point(coords[0]), _get_segments_data(segments)
+
+
+def _parse_file(file_bytes: bytes) -> tuple[list[TraceSegment], NDArray[np.float64]]:
+    """
+    Parse the trace file into segments.
+
+    Returns the segments and the coordinates of all their points.
+    """
+    segments: list[TraceSegment] = []
+
+    # process multiple files in the archive
+    for gpx_bytes in TraceFile.extract(file_bytes):
+        track_num_start = (segments[-1].track_num + 1) if segments else 0
+        segments.extend(FormatGPX.decode_gpx(gpx_bytes, track_num_start=track_num_start))
+
+    coords = lib.get_coordinates(np.asarray([segment.points for segment in segments], dtype=object), False, False)
+    return segments, coords
+
+
+@cython.cfunc
+def _get_segments_data(segments: list[TraceSegment]) -> list[tuple]:
+    return [
+        (segment.track_num, segment.segment_num, segment.points, segment.capture_times, segment.elevations)
+        for segment in segments
+    ]
+
+
+def _create_trace(
+    file: UploadFile,
+    *,
+    description: str,
+    tags: str,
+    visibility: TraceVisibility,
+    size: int | None,
+) -> Trace:
+    trace = Trace(
+        **TraceValidating(
+            user_id=auth_user(required=True).id,
+            name=_get_file_name(file),
+            description=description,
+            visibility=visibility,
+            size=size if size is not None else 1,
+        ).__dict__
+    )
+    if size is None:
+        # set once processed
+        trace.size = 0
+    trace.tag_string = tags
+    return trace
+
+
+async def _save_file(trace: Trace, file: UploadFile) -> None:
+    await file.seek(0)
+    compressed_chunks, compressed_suffix = TraceFile.compress_stream(_read_chunks(file))
+    trace.file_id = await TRACES_STORAGE.save_stream(compressed_chunks, compressed_suffix)
+
+
 @cython.cfunc
 def _get_file_name(file: UploadFile) -> str:
     """
@@ -137,3 +360,8 @@ def _get_file_name(file: UploadFile) -> str:
     """
     filename = file.filename
     return filename if (filename is not None) else f'{utcnow().isoformat(timespec='seconds')}.gpx'
+
+
+async def _read_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(STORAGE_STREAM_CHUNK_SIZE):
+        yield chunk
@@ -5,3 +5,5 @@ AVATAR_STORAGE = LocalStorage('avatar')
 BACKGROUND_STORAGE = LocalStorage('background')
 GRAVATAR_STORAGE = GravatarStorage()
 TRACES_STORAGE = LocalStorage('traces')
+REPLICATION_MINUTE_STORAGE = LocalStorage('replication-minute')
+REPLICATION_HOUR_STORAGE = LocalStorage('replication-hour')
@@ -0,0 +1,167 @@
+import os
+from asyncio import Future, get_running_loop
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import click
+import uvloop
+from shapely import box, from_wkt
+from shapely.geometry.base import BaseGeometry
+from sqlalchemy import text
+
+from app.db import db
+from app.lib.osm_pbf import OSMPBF
+from app.limits import EXPORT_PBF_BLOCK_SIZE, EXPORT_PBF_PENDING_BLOCKS_PER_WORKER
+from app.models.element import ElementType
+
+# one row per element: type, JSON row (see app.lib.osm_pbf.PBFRow)
+_copy_select = """
+COPY (
+    SELECT e.type, json_build_array(
+        e.id,
+        e.version,
+        e.visible,
+        e.changeset_id,
+        extract(epoch FROM e.created_at)::bigint,
+        c.user_id,
+        u.display_name,
+        e.tags,
+        ST_X(e.point),
+        ST_Y(e.point),
+        CASE WHEN e.type = 'node' THEN '[]'::json ELSE (
+            SELECT coalesce(json_agg(json_build_array(m.type, m.id, m.role) ORDER BY m."order"), '[]'::json)
+            FROM element_member m
+            WHERE m.sequence_id = e.sequence_id
+        ) END
+    )
+    FROM element e
+    JOIN changeset c ON c.id = e.changeset_id
+    LEFT JOIN "user" u ON u.id = c.user_id
+"""
+_copy_order = """
+    ORDER BY e.sequence_id
+) TO STDOUT
+"""
+_where_current = 'WHERE e.next_sequence_id IS NULL AND e.visible'
+_where_extract = ' AND EXISTS (SELECT 1 FROM export_ref r WHERE r.type = e.type AND r.id = e.id)'
+
+# queries are assembled from the fixed fragments only
+_copy_query_history = _copy_select + _copy_order
+_copy_query_current = _copy_select + _where_current + _copy_order
+_copy_query_extract = _copy_select + _where_current + _where_extract + _copy_order
+
+# simple extract strategy: nodes inside, ways with any node inside, relations with any selected member
+_extract_sqls = (
+    'CREATE TEMPORARY TABLE export_ref (type element_type NOT NULL, id bigint NOT NULL, PRIMARY KEY (type, id))',
+    """
+    INSERT INTO export_ref
+    SELECT 'node', id FROM element
+    WHERE type = 'node' AND visible AND next_sequence_id IS NULL
+    AND ST_Intersects(point, ST_GeomFromText(:geometry, 4326))
+    """,
+    """
+    INSERT INTO export_ref
+    SELECT DISTINCT 'way'::element_type, e.id FROM export_ref r
+    JOIN element_member m ON m.type = r.type AND m.id = r.id
+    JOIN element e ON e.sequence_id = m.sequence_id
+    WHERE r.type = 'node' AND e.type = 'way' AND e.visible AND e.next_sequence_id IS NULL
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO export_ref
+    SELECT DISTINCT 'relation'::element_type, e.id FROM export_ref r
+    JOIN element_member m ON m.type = r.type AND m.id = r.id
+    JOIN element e ON e.sequence_id = m.sequence_id
+    WHERE e.type = 'relation' AND e.visible AND e.next_sequence_id IS NULL
+    ON CONFLICT DO NOTHING
+    """,
+    'ANALYZE export_ref',
+)
+
+
+async def export(output: Path, *, geometry: BaseGeometry | None, history: bool, workers: int) -> int:
+    loop = get_running_loop()
+    temp_path = output.with_name(f'.{output.name}.tmp')
+    pending: deque[Future[bytes]] = deque()
+    batches: dict[ElementType, list[bytes]] = {'node': [], 'way': [], 'relation': []}
+    remainder = b''
+    num_elements = 0
+
+    with ProcessPoolExecutor(workers) as executor, temp_path.open('wb') as f:
+        max_pending = workers * EXPORT_PBF_PENDING_BLOCKS_PER_WORKER
+        f.write(OSMPBF.encode_header(bounds=geometry.bounds if geometry is not None else None, history=history))
+
+        async def submit(type: ElementType) -> None:
+            batch = batches[type]
+            batches[type] = []
+            pending.append(loop.run_in_executor(executor, _encode_block, type, batch, history))  # pyright: ignore[reportArgumentType]
+            # bound the memory usage, write the blocks in order
+            while len(pending) > max_pending:
+                f.write(await pending.popleft())
+
+        async def on_data(data: bytes) -> None:
+            nonlocal remainder, num_elements
+            lines = (remainder + data).split(b'\n')
+            remainder = lines.pop()
+            for line in lines:
+                type_, _, row = line.partition(b'\t')
+                type: ElementType = type_.decode()  # pyright: ignore[reportAssignmentType]
+                batch = batches[type]
+                batch.append(row)
+                num_elements += 1
+                if len(batch) >= EXPORT_PBF_BLOCK_SIZE:
+                    await submit(type)
+
+        async with db() as session:
+            await session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+            if geometry is not None:
+                for sql in _extract_sqls:
+                    await session.execute(text(sql), {'geometry': geometry.wkt})
+                query = _copy_query_extract
+            else:
+                query = _copy_query_history if history else _copy_query_current
+
+            connection = await (await session.connection()).get_raw_connection()
+            await connection.driver_connection.copy_from_query(query, output=on_data)  # pyright: ignore[reportOptionalMemberAccess]
+
+        for type, batch in batches.items():
+            if batch:
+                await submit(type)
+        while pending:
+            f.write(await pending.popleft())
+
+    temp_path.replace(output)
+    return num_elements
+
+
+def _encode_block(type: ElementType, lines: list[bytes], history: bool) -> bytes:
+    return OSMPBF.encode_block(type, lines, history=history)
+
+
+@click.command()
+@click.argument('output', type=click.Path(dir_okay=False, writable=True, path_type=Path))
+@click.option('history', '--history', is_flag=True, help='Export all element versions.')
+@click.option('bbox', '--bbox', help='Extract bounding box: min_lon,min_lat,max_lon,max_lat.')
+@click.option(
+    'polygon',
+    '--polygon',
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help='Extract polygon, as a WKT file.',
+)
+@click.option('workers', '--workers', '-j', default=os.cpu_count() or 1, show_default=True)
+def main(output: Path, history: bool, bbox: str | None, polygon: Path | None, workers: int) -> None:
+    geometry: BaseGeometry | None = None
+    if bbox is not None:
+        geometry = box(*map(float, bbox.split(',')))
+    elif polygon is not None:
+        geometry = from_wkt(polygon.read_text())
+    if geometry is not None and history:
+        raise click.UsageError('Extracts are only supported for the current data')
+
+    num_elements = uvloop.run(export(output, geometry=geometry, history=history, workers=workers))
+    click.echo(f'Exported {num_elements} elements to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ from datetime import datetime
 from functools import cache
 from multiprocessing import Pool
 from pathlib import Path
+from typing import BinaryIO
 
 import lxml.etree as ET
 import numpy as np
@@ -20,13 +21,14 @@ data_parquet_path = PRELOAD_DIR.joinpath('preload.parquet')
 if not input_path.is_file():
     raise FileNotFoundError(f'File not found: {input_path}')
 
-buffering = 32 * 1024 * 1024  # 32 MB
-read_memory_limit = 2 * 1024 * 1024 * 1024  # 2 GB => ~50 GB total memory usage
+# input is parsed incrementally, memory usage is bounded by the flush size, per worker
+read_buffer_size = 4 * 1024 * 1024  # 4 MB
+task_target_size = 256 * 1024 * 1024  # 256 MB
+flush_rows = 500_000
 
 num_workers = os.cpu_count() or 1
 input_size = input_path.stat().st_size
-task_read_memory_limit = read_memory_limit // num_workers
-num_tasks = input_size // task_read_memory_limit
+num_tasks = max(input_size // task_target_size, 1)
 task_size = input_size // num_tasks
 
 # freeze all gc objects before starting for improved performance
@@ -40,137 +42,171 @@ def get_csv_path(name: str) -> Path:
     return PRELOAD_DIR.joinpath(f'{name}.csv')
 
 
-@cache
-def get_worker_output_path(i: int) -> Path:
-    return data_parquet_path.with_suffix(f'.parquet.{i}')
+def get_worker_output_path(i: int, part: int) -> Path:
+    return data_parquet_path.with_suffix(f'.parquet.{i}.{part}')
+
+
+class RangeReader:
+    """
+    File-like reader over a byte range of the input, wrapped into a standalone <osm> document.
+    """
+
+    __slots__ = ('_f', '_remaining', '_prefix', '_suffix')
+
+    def __init__(self, f: BinaryIO, from_seek: int, to_seek: int):
+        f.seek(from_seek)
+        self._f = f
+        self._remaining = to_seek - from_seek
+        self._prefix = b'<osm>\n' if from_seek > 0 else b''
+        self._suffix = b'</osm>\n' if to_seek < input_size else b''
+
+    def read(self, size: int = -1) -> bytes:
+        if self._prefix:
+            result, self._prefix = self._prefix, b''
+            return result
+        if self._remaining > 0:
+            result = self._f.read(min(size, self._remaining) if size > 0 else self._remaining)
+            self._remaining -= len(result)
+            if result:
+                return result
+            self._remaining = 0
+        result, self._suffix = self._suffix, b''
+        return result
+
+
+schema = {
+    'changeset_id': pl.UInt64,
+    'type': pl.Enum(('node', 'way', 'relation')),
+    'id': pl.UInt64,
+    'version': pl.UInt64,
+    'visible': pl.Boolean,
+    'tags': pl.String,
+    'point': pl.String,
+    'members': pl.List(
+        pl.Struct(
+            {
+                'order': pl.UInt16,
+                'type': pl.String,
+                'id': pl.UInt64,
+                'role': pl.String,
+            }
+        )
+    ),
+    'created_at': pl.Datetime,
+    'user_id': pl.UInt64,
+    'display_name': pl.String,
+}
 
 
-def worker(args: tuple[int, int, int]) -> None:
+def worker(args: tuple[int, int, int]) -> int:
     i, from_seek, to_seek = args  # from_seek(inclusive), to_seek(exclusive)
-
     data: list[tuple] = []
-    schema = {
-        'changeset_id': pl.UInt64,
-        'type': pl.Enum(('node', 'way', 'relation')),
-        'id': pl.UInt64,
-        'version': pl.UInt64,
-        'visible': pl.Boolean,
-        'tags': pl.String,
-        'point': pl.String,
-        'members': pl.List(
-            pl.Struct(
-                {
-                    'order': pl.UInt16,
-                    'type': pl.String,
-                    'id': pl.UInt64,
-                    'role': pl.String,
-                }
-            )
-        ),
-        'created_at': pl.Datetime,
-        'user_id': pl.UInt64,
-        'display_name': pl.String,
-    }
-
-    with input_path.open('rb') as f_in:
-        if from_seek > 0:
-            f_in.seek(from_seek)
-            input_buffer = b'<osm>\n' + f_in.read(to_seek - from_seek)
-        else:
-            input_buffer = f_in.read(to_seek)
-
-    root = ET.fromstring(  # noqa: S320
-        input_buffer,
-        parser=ET.XMLParser(
-            ns_clean=True,
-            recover=True,
-            resolve_entities=False,
+    num_parts = 0
+
+    def flush() -> None:
+        nonlocal num_parts
+        df = pl.DataFrame(data, schema=schema, orient='row')
+        df.write_parquet(get_worker_output_path(i, num_parts), compression_level=1, statistics=False)
+        data.clear()
+        num_parts += 1
+
+    with input_path.open('rb', buffering=read_buffer_size) as f_in:
+        for _, element in ET.iterparse(  # noqa: S320
+            RangeReader(f_in, from_seek, to_seek),
+            events=('end',),
+            tag=('node', 'way', 'relation'),
             remove_comments=True,
             remove_pis=True,
+            resolve_entities=False,
             collect_ids=False,
-            compact=False,
-        ),
-    )
+            huge_tree=True,
+        ):
+            data.append(parse_element(element))
 
-    # free memory
-    del input_buffer
-
-    for element in root:
-        tag: str = element.tag
-        attrib = element.attrib
-        if tag not in {'node', 'way', 'relation'}:
-            continue
-
-        tags_list: list[tuple[str, str]] = []
-        members: list[dict] = []
-
-        for child in element:
-            child_tag: str = child.tag
-            child_attrib = child.attrib
-
-            if child_tag == 'tag':
-                tags_list.append((child_attrib['k'], child_attrib['v']))  # pyright: ignore[reportArgumentType]
-            elif child_tag == 'nd':
-                members.append(
-                    {
-                        'order': len(members),
-                        'type': 'node',
-                        'id': int(child_attrib['ref']),
-                        'role': '',
-                    }
-                )
-            elif child_tag == 'member':
-                members.append(
-                    {
-                        'order': len(members),
-                        'type': child_attrib['type'],
-                        'id': int(child_attrib['ref']),
-                        'role': child_attrib['role'],
-                    }
-                )
-
-        if tag == 'node' and (lon := attrib.get('lon')) is not None and (lat := attrib.get('lat')) is not None:
-            point = f'POINT({lon} {lat})'
-        else:
-            point = None
-
-        if tag == 'node':
-            visible = point is not None
-        elif tag in {'way', 'relation'}:
-            visible = bool(tags_list or members)
-        else:
-            raise NotImplementedError(f'Unsupported element type {tag!r}')
-
-        uid = attrib.get('uid')
-        if uid is not None:
-            user_id = int(uid)
-            user_display_name = attrib['user']
-        else:
-            user_id = None
-            user_display_name = None
-
-        data.append(
-            (
-                int(attrib['changeset']),  # changeset_id
-                tag,  # type
-                int(attrib['id']),  # id
-                int(attrib['version']),  # version
-                visible,  # visible
-                json_encodes(dict(tags_list)) if tags_list else '{}',  # tags
-                point,  # point
-                members,  # members
-                datetime.fromisoformat(attrib['timestamp']),  # created_at  # pyright: ignore[reportArgumentType]
-                user_id,  # user_id
-                user_display_name,  # display_name
-            )
-        )
+            # free processed elements, including the already cleared siblings
+            element.clear(keep_tail=False)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
 
-    df = pl.DataFrame(data, schema=schema)
-    df.write_parquet(get_worker_output_path(i), compression_level=1, statistics=False)
+            if len(data) >= flush_rows:
+                flush()
+
+    if data or not num_parts:
+        flush()
     gc.collect()
+    return num_parts
+
+
+def parse_element(element: ET._Element) -> tuple:
+    tag: str = element.tag  # pyright: ignore[reportAssignmentType]
+    attrib = element.attrib
+
+    tags_list: list[tuple[str, str]] = []
+    members: list[dict] = []
 
+    for child in element:
+        child_tag: str = child.tag
+        child_attrib = child.attrib
 
-def run_workers() -> None:
+        if child_tag == 'tag':
+            tags_list.append((child_attrib['k'], child_attrib['v']))  # pyright: ignore[reportArgumentType]
+        elif child_tag == 'nd':
+            members.append(
+                {
+                    'order': len(members),
+                    'type': 'node',
+                    'id': int(child_attrib['ref']),
+                    'role': '',
+                }
+            )
+        elif child_tag == 'member':
+            members.append(
+                {
+                    'order': len(members),
+                    'type': child_attrib['type'],
+                    'id': int(child_attrib['ref']),
+                    'role': child_attrib['role'],
+                }
+            )
+
+    if tag == 'node' and (lon := attrib.get('lon')) is not None and (lat := attrib.get('lat')) is not None:
+        point = f'POINT({lon} {lat})'
+    else:
+        point = None
+
+    if tag == 'node':
+        visible = point is not None
+    elif tag in {'way', 'relation'}:
+        visible = bool(tags_list or members)
+    else:
+        raise NotImplementedError(f'Unsupported element type {tag!r}')
+
+    uid = attrib.get('uid')
+    if uid is not None:
+        user_id = int(uid)
+        user_display_name = attrib['user']
+    else:
+        user_id = None
+        user_display_name = None
+
+    return (
+        int(attrib['changeset']),  # changeset_id
+        tag,  # type
+        int(attrib['id']),  # id
+        int(attrib['version']),  # version
+        visible,  # visible
+        json_encodes(dict(tags_list)) if tags_list else '{}',  # tags
+        point,  # point
+        members,  # members
+        datetime.fromisoformat(attrib['timestamp']),  # created_at  # pyright: ignore[reportArgumentType]
+        user_id,  # user_id
+        user_display_name,  # display_name
+    )
+
+
+def run_workers() -> list[Path]:
     from_seek_search = (b'  <node', b'  <way', b'  <relation')
     from_seeks = []
 
@@ -194,26 +230,28 @@ def run_workers() -> None:
         to_seek = from_seeks[i + 1] if i + 1 < num_tasks else input_size
         args.append((i, from_seek, to_seek))
 
+    paths: list[Path] = []
     with Pool(num_workers) as pool:
-        for _ in tqdm(
-            pool.imap_unordered(worker, args),
-            desc='Preparing data',
-            total=num_tasks,
+        for i, num_parts in enumerate(
+            tqdm(
+                pool.imap(worker, args),
+                desc='Preparing data',
+                total=num_tasks,
+            )
         ):
-            ...
+            paths.extend(get_worker_output_path(i, part) for part in range(num_parts))
+    return paths
 
 
-def merge_worker_files() -> None:
-    paths = [get_worker_output_path(i) for i in range(num_tasks)]
-    created_at_all: list[int] = []
+def merge_worker_files(paths: list[Path]) -> None:
+    created_at_all: list[np.ndarray] = []
 
     for path in tqdm(paths, desc='Assigning sequence IDs (step 1/2)'):
         df = pl.read_parquet(path, columns=['created_at'], use_statistics=False)
-        created_at = df.to_series().dt.epoch('s').to_numpy(allow_copy=False)
-        created_at_all.extend(created_at)
+        created_at_all.append(df.to_series().dt.epoch('s').to_numpy())
 
     print('Assigning sequence IDs (step 2/2)...')
-    created_at_argsort = np.argsort(created_at_all).astype(np.uint64)
+    created_at_argsort = np.argsort(np.concatenate(created_at_all), kind='stable').astype(np.uint64)
 
     # free memory
     del created_at_all
@@ -315,8 +353,8 @@ def write_changeset_csv() -> None:
 
 
 async def main() -> None:
-    run_workers()
-    merge_worker_files()
+    paths = run_workers()
+    merge_worker_files(paths)
 
     print('Writing user CSV...')
     write_user_csv()
@@ -0,0 +1,42 @@
+from typing import get_args
+
+import click
+import uvloop
+
+from app.queries.element_query import ElementQuery
+from app.services.replication_service import ReplicationCompression, ReplicationInterval, ReplicationService
+
+_intervals = click.Choice(get_args(ReplicationInterval))
+_compressions = click.Choice(get_args(ReplicationCompression))
+
+cli = click.Group()
+
+
+@cli.command()
+@click.argument('interval', type=_intervals)
+def init(interval: ReplicationInterval) -> None:
+    state = uvloop.run(ReplicationService.init(interval))
+    click.echo(f'Initialized {interval} replication at sequence id {state.sequence_id}')
+
+
+@cli.command()
+@click.argument('interval', type=_intervals)
+@click.option('compression', '--compression', '-c', type=_compressions, default='gz', show_default=True)
+def generate(interval: ReplicationInterval, compression: ReplicationCompression) -> None:
+    async def main() -> None:
+        # catch up in multiple files if the backlog exceeds the per-file limit
+        current_sequence_id = await ElementQuery.get_current_sequence_id()
+        while True:
+            state = await ReplicationService.generate(interval, compression=compression)
+            if state is None:
+                click.secho(f'{interval.capitalize()} replication is already running', fg='yellow')
+                return
+            click.echo(f'Generated {interval} replication {state.sequence_number} (sequence id {state.sequence_id})')
+            if state.sequence_id >= current_sequence_id:
+                return
+
+    uvloop.run(main())
+
+
+if __name__ == '__main__':
+    cli()
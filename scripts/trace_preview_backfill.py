@@ -0,0 +1,55 @@
+import click
+import numpy as np
+import uvloop
+from shapely import lib
+from sqlalchemy import false, null, select
+
+from app.db import db_commit
+from app.lib.trace_preview import TracePreview
+from app.models.db.trace_ import Trace
+from app.models.db.trace_segment import TraceSegment
+
+
+async def backfill(batch_size: int) -> int:
+    total = 0
+    after = 0
+    while True:
+        async with db_commit() as session:
+            stmt = (
+                select(Trace)
+                .where(Trace.id > after, Trace.preview == null(), Trace.pending == false())
+                .order_by(Trace.id)
+                .with_for_update(skip_locked=True)
+                .limit(batch_size)
+            )
+            traces = (await session.scalars(stmt)).all()
+            if not traces:
+                return total
+
+            for trace in traces:
+                stmt = (
+                    select(TraceSegment.points)
+                    .where(TraceSegment.trace_id == trace.id)
+                    .order_by(TraceSegment.track_num, TraceSegment.segment_num)
+                )
+                points = (await session.scalars(stmt)).all()
+                coords = lib.get_coordinates(np.asarray(points, dtype=object), False, False)
+                trace.preview = TracePreview.encode(coords)
+
+            after = traces[-1].id
+            total += len(traces)
+            click.echo(f'Processed {total} traces')
+
+
+@click.command()
+@click.option('batch_size', '--batch-size', default=100, show_default=True, help='Traces per transaction.')
+def main(batch_size: int) -> None:
+    """
+    Compute the missing previews of the traces uploaded before they were precomputed.
+    """
+    total = uvloop.run(backfill(batch_size))
+    click.echo(f'Done! Backfilled {total} traces')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import click
+import numpy as np
+import uvloop
+from sqlalchemy import func, select, text, tuple_
+
+from app.db import db, db_commit, db_update_stats
+from app.lib.geo_utils import hilbert_key
+from app.models.db.trace_segment import TraceSegment
+
+_update_query = text(
+    'UPDATE trace_segment SET spatial_key = u.spatial_key '
+    'FROM unnest('
+    'CAST(:trace_ids AS bigint[]), '
+    'CAST(:track_nums AS smallint[]), '
+    'CAST(:segment_nums AS smallint[]), '
+    'CAST(:spatial_keys AS bigint[])'
+    ') AS u(trace_id, track_num, segment_num, spatial_key) '
+    'WHERE trace_segment.trace_id = u.trace_id '
+    'AND trace_segment.track_num = u.track_num '
+    'AND trace_segment.segment_num = u.segment_num'
+)
+
+_cluster_index_name = 'trace_segment_spatial_key_cluster_idx'
+
+
+async def backfill(batch_size: int) -> int:
+    total = 0
+    after = (0, 0, 0)
+    while True:
+        async with db_commit() as session:
+            key = tuple_(TraceSegment.trace_id, TraceSegment.track_num, TraceSegment.segment_num)
+            stmt = (
+                select(
+                    TraceSegment.trace_id,
+                    TraceSegment.track_num,
+                    TraceSegment.segment_num,
+                    TraceSegment.spatial_key,
+                    func.ST_XMin(TraceSegment.points),
+                    func.ST_YMin(TraceSegment.points),
+                    func.ST_XMax(TraceSegment.points),
+                    func.ST_YMax(TraceSegment.points),
+                )
+                .where(key > tuple_(*after))
+                .order_by(TraceSegment.trace_id, TraceSegment.track_num, TraceSegment.segment_num)
+                .limit(batch_size)
+            )
+            rows = (await session.execute(stmt)).all()
+            if not rows:
+                return total
+
+            after = tuple(rows[-1][:3])
+            rows = [row for row in rows if row[3] is None]
+            if not rows:
+                continue
+
+            segments_bounds = np.array([row[4:] for row in rows], np.float64)
+            spatial_keys = hilbert_key(
+                (segments_bounds[:, 0] + segments_bounds[:, 2]) / 2,
+                (segments_bounds[:, 1] + segments_bounds[:, 3]) / 2,
+            )
+            await session.execute(
+                _update_query,
+                {
+                    'trace_ids': [row[0] for row in rows],
+                    'track_nums': [row[1] for row in rows],
+                    'segment_nums': [row[2] for row in rows],
+                    'spatial_keys': spatial_keys.tolist(),
+                },
+            )
+            total += len(rows)
+            click.echo(f'Keyed {total} segments')
+
+
+async def cluster() -> None:
+    # CLUSTER does not support BRIN, use a temporary btree index
+    async with db() as session:
+        await session.connection(execution_options={'isolation_level': 'AUTOCOMMIT'})
+        click.echo('Creating the temporary cluster index')
+        await session.execute(
+            text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {_cluster_index_name} ON trace_segment (spatial_key)')
+        )
+        click.echo('Clustering trace_segment, the table is locked until finished')
+        await session.execute(text(f'CLUSTER trace_segment USING {_cluster_index_name}'))
+        await session.execute(text(f'DROP INDEX CONCURRENTLY {_cluster_index_name}'))
+
+
+async def run(batch_size: int, cluster_: bool) -> None:
+    total = await backfill(batch_size)
+    click.echo(f'Backfilled {total} segments')
+    if cluster_:
+        await cluster()
+        click.echo('Updating statistics')
+        await db_update_stats()
+
+
+@click.command()
+@click.option('batch_size', '--batch-size', default=10_000, show_default=True, help='Segments per transaction.')
+@click.option('cluster_', '--cluster', is_flag=True, help='Rewrite the table in the spatial key order.')
+def main(batch_size: int, cluster_: bool) -> None:
+    """
+    Compute the missing trace segment spatial keys, and optionally cluster the table by them.
+
+    New segments are keyed on insert, but appended in upload order; re-run periodically with --cluster.
+    """
+    uvloop.run(run(batch_size, cluster_))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import click
+import uvloop
+from zstandard import train_dictionary
+
+from app.lib.file_cache import FileCache
+from app.lib.zstd_dict import ZSTD_DICT_MAX_VERSION, ZstdDict
+from app.services.cache_service import CacheContext, CacheService
+
+
+@click.command()
+@click.argument('context')
+@click.option('file_cache', '--file-cache', is_flag=True, help='Sample the file cache instead of Valkey.')
+@click.option('samples', '--samples', default=10_000, show_default=True, help='Maximum number of sampled values.')
+@click.option('size', '--size', default=112 * 1024, show_default=True, help='Dictionary size in bytes.')
+def main(context: str, file_cache: bool, samples: int, size: int) -> None:
+    """
+    Train a new zstd dictionary version for the cache context.
+
+    Processes load the dictionaries on startup, deploy the new version everywhere before restarting.
+    """
+    versions = ZstdDict.get_versions(context)
+    version = versions[-1] + 1 if versions else 1
+    if version > ZSTD_DICT_MAX_VERSION:
+        raise click.ClickException(f'Context {context!r} has reached the maximum dictionary version')
+
+    if file_cache:
+        values = uvloop.run(FileCache(context).sample(samples))
+    else:
+        values = uvloop.run(CacheService.sample(CacheContext(context), samples))
+    if not values:
+        raise click.ClickException(f'Context {context!r} has no values to sample')
+
+    dict_data = train_dictionary(size, values).as_bytes()
+    path = ZstdDict.get_path(context, version)
+    path.write_bytes(dict_data)
+    click.echo(f'Trained {context!r} dictionary v{version} from {len(values)} values: {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -148,6 +148,20 @@ async def test_changeset_upload(client: AsyncClient):
     assert changeset['@max_lon'] == 0
     assert changeset['@changes_count'] == 2
 
+    # download changeset, closed changesets are served from the cache
+    r = await client.get(f'/api/0.6/changeset/{changeset_id}/download')
+    assert r.is_success, r.text
+    actions = XMLToDict.parse(r.content)['osmChange']
+    assert [(action[0], element[0]) for action in actions for element in action[1]] == [
+        ('create', 'node'),
+        ('create', 'way'),
+    ]
+
+    r_cached = await client.get(f'/api/0.6/changeset/{changeset_id}/download')
+    assert r_cached.is_success, r_cached.text
+    assert r_cached.content == r.content
+    assert r_cached.headers['Content-Type'] == r.headers['Content-Type']
+
 
 async def test_changesets_unauthorized_get_request(client: AsyncClient):
     r = await client.get('/api/0.6/changesets')
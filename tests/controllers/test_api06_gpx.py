@@ -1,9 +1,13 @@
+from asyncio import sleep
 from datetime import UTC, datetime
 from math import isclose
 
+import pytest
 from httpx import AsyncClient
+from starlette import status
 
 from app.lib.xmltodict import XMLToDict
+from app.limits import TRACE_FILE_BACKGROUND_MIN_SIZE
 
 
 async def test_gpx_crud(client: AsyncClient, gpx: dict):
@@ -209,3 +213,104 @@ async def test_trackpoints(client: AsyncClient, gpx: dict):
     assert trkpt['@lat'] == 51.8583922
     assert datetime.fromisoformat(trkpt['time']) == datetime(2023, 7, 3, 10, 36, 21, tzinfo=UTC)
     assert isclose(float(trkpt['ele']), 190.8, abs_tol=0.01)
+
+
+async def test_gpx_upload_background(client: AsyncClient, gpx: dict):
+    client.headers['Authorization'] = 'User user1'
+
+    # large files are processed in the background
+    gpx['gpx']['trk'] *= 10
+    file = XMLToDict.unparse(gpx, raw=True)
+    assert len(file) >= TRACE_FILE_BACKGROUND_MIN_SIZE
+
+    r = await client.post(
+        '/api/0.6/gpx/create',
+        data={
+            'visibility': 'identifiable',
+            'description': 'test_gpx_upload_background',
+        },
+        files={
+            'file': ('test_gpx_upload_background.gpx', file),
+        },
+    )
+    assert r.is_success, r.text
+    trace_id = int(r.text)
+
+    for _ in range(100):
+        r = await client.get(f'/api/0.6/gpx/{trace_id}/details')
+        assert r.is_success, r.text
+        gpx_file = XMLToDict.parse(r.content)['osm']['gpx_file'][0]
+        if not gpx_file['@pending']:
+            break
+        await sleep(0.1)
+
+    assert gpx_file['@pending'] is False
+    assert '@lon' in gpx_file
+
+
+async def test_trackpoints_paging(client: AsyncClient):
+    params = {'bbox': '20.8726,51.8583,20.8728,51.8585'}
+
+    r = await client.get('/api/0.6/trackpoints', params={**params, 'cursor': 'invalid'})
+    assert r.status_code == status.HTTP_400_BAD_REQUEST, r.text
+
+    # deep legacy paging requires the cached cursor of the previous page
+    r = await client.get('/api/0.6/trackpoints', params={**params, 'pageNumber': 1_000})
+    assert r.status_code == status.HTTP_400_BAD_REQUEST, r.text
+
+
+async def test_trackpoints_paging_pages(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr('app.controllers.api06_gpx.TRACE_POINT_QUERY_DEFAULT_LIMIT', 2)
+    client.headers['Authorization'] = 'User user1'
+    params = {'bbox': '30.5,10.5,30.51,10.51'}
+
+    # one trace per half, 3 segments each, so each half spans 2 pages
+    expected: dict[str, set[tuple[float, float]]] = {}
+    for visibility, lat in (('identifiable', 10.501), ('private', 10.502)):
+        points = [(round(30.501 + 0.001 * i, 3), lat) for i in range(6)]
+        gpx = {
+            'gpx': {
+                '@version': '1.1',
+                '@xmlns': 'http://www.topografix.com/GPX/1/1',
+                'trk': [
+                    {'trkseg': [{'trkpt': [{'@lon': lon, '@lat': lat} for lon, lat in points[i : i + 2]]}]}
+                    for i in range(0, 6, 2)
+                ],
+            }
+        }
+        r = await client.post(
+            '/api/0.6/gpx/create',
+            data={'visibility': visibility, 'description': 'test_trackpoints_paging_pages'},
+            files={'file': ('test_trackpoints_paging_pages.gpx', XMLToDict.unparse(gpx, raw=True))},
+        )
+        assert r.is_success, r.text
+        expected[visibility] = set(points)
+
+    def read_points(content: bytes) -> dict[str, set[tuple[float, float]]]:
+        result: dict[str, set[tuple[float, float]]] = {'identifiable': set(), 'private': set()}
+        for trk in XMLToDict.parse(content)['gpx'].get('trk', ()):
+            visibility = 'identifiable' if 'url' in trk else 'private'
+            for trkseg in trk['trkseg']:
+                result[visibility].update((trkpt['@lon'], trkpt['@lat']) for trkpt in trkseg['trkpt'])
+        return result
+
+    r = await client.get('/api/0.6/trackpoints', params=params)
+    assert r.is_success, r.text
+    first_page = read_points(r.content)
+    cursor = r.headers['X-Cursor']
+
+    r = await client.get('/api/0.6/trackpoints', params={**params, 'cursor': cursor})
+    assert r.is_success, r.text
+    second_page = read_points(r.content)
+    assert 'X-Cursor' not in r.headers
+
+    # legacy page numbers resume from the cached cursor
+    r = await client.get('/api/0.6/trackpoints', params={**params, 'pageNumber': 1})
+    assert r.is_success, r.text
+    assert read_points(r.content) == second_page
+
+    for visibility, points in expected.items():
+        assert len(first_page[visibility]) == 4
+        assert len(second_page[visibility]) == 2
+        assert first_page[visibility].isdisjoint(second_page[visibility])
+        assert first_page[visibility] | second_page[visibility] == points
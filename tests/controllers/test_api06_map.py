@@ -2,9 +2,16 @@ from collections.abc import Sequence
 
 import pytest
 from httpx import AsyncClient
+from shapely import Point
 
+from app.lib.geo_utils import parse_bbox
 from app.lib.xmltodict import XMLToDict
-from app.models.element import ElementType
+from app.limits import MAP_QUERY_LEGACY_NODES_LIMIT
+from app.models.db.element import Element
+from app.models.db.element_member import ElementMember
+from app.models.element import ElementId, ElementRef, ElementType
+from app.queries.element_query import ElementQuery
+from app.services.optimistic_diff import OptimisticDiff
 
 
 async def test_map_read(client: AsyncClient):
@@ -90,3 +97,133 @@ async def test_map_read(client: AsyncClient):
         nodes = (value for key, value in data if key == 'node')
         with pytest.raises(StopIteration):
             node = next(node for node in nodes if node['@id'] == node_id)
+
+
+async def test_map_read_json(client: AsyncClient):
+    client.headers['Authorization'] = 'User user1'
+
+    # create changeset
+    r = await client.put(
+        '/api/0.6/changeset/create',
+        content=XMLToDict.unparse(
+            {
+                'osm': {
+                    'changeset': {
+                        'tag': [
+                            {'@k': 'created_by', '@v': test_map_read_json.__name__},
+                        ]
+                    }
+                }
+            }
+        ),
+    )
+    assert r.is_success, r.text
+    changeset_id = int(r.text)
+
+    # create node
+    r = await client.put(
+        '/api/0.6/node/create',
+        content=XMLToDict.unparse(
+            {
+                'osm': {
+                    'node': {
+                        '@changeset': changeset_id,
+                        '@lon': 3.4567891,
+                        '@lat': 4.5678912,
+                    }
+                }
+            }
+        ),
+    )
+    assert r.is_success, r.text
+    node_id = int(r.text)
+
+    # read map
+    r = await client.get('/api/0.6/map.json?bbox=3.456,4.567,3.457,4.568')
+    assert r.is_success, r.text
+
+    data: dict = r.json()
+    assert data['version'] == '0.6'
+    assert data['bounds'] == {'minlon': 3.456, 'minlat': 4.567, 'maxlon': 3.457, 'maxlat': 4.568}
+    node = next(element for element in data['elements'] if element['type'] == 'node' and element['id'] == node_id)
+    assert node['lon'] == 3.4567891
+    assert node['lat'] == 4.5678912
+
+
+async def test_map_stream_batches(client: AsyncClient, changeset_id: int):
+    # 5 nodes, a way and a relation over them, streamed in batches of 2
+    elements: list[Element] = [
+        Element(
+            changeset_id=changeset_id,
+            type='node',
+            id=ElementId(-i),
+            version=1,
+            visible=True,
+            tags={},
+            point=Point(5.0 + 0.0001 * i, 6.0001),
+            members=[],
+        )
+        for i in range(1, 6)
+    ]
+    elements.append(
+        Element(
+            changeset_id=changeset_id,
+            type='way',
+            id=ElementId(-1),
+            version=1,
+            visible=True,
+            tags={},
+            point=None,
+            members=[ElementMember(order=i, type='node', id=ElementId(-i - 1), role='') for i in range(5)],
+        )
+    )
+    elements.append(
+        Element(
+            changeset_id=changeset_id,
+            type='relation',
+            id=ElementId(-1),
+            version=1,
+            visible=True,
+            tags={},
+            point=None,
+            members=[
+                ElementMember(order=0, type='node', id=ElementId(-1), role='a'),
+                ElementMember(order=1, type='way', id=ElementId(-1), role='b'),
+            ],
+        )
+    )
+    assigned_ref_map = await OptimisticDiff.run(elements)
+    way_id = assigned_ref_map[ElementRef('way', ElementId(-1))][0].id
+    relation_id = assigned_ref_map[ElementRef('relation', ElementId(-1))][0].id
+
+    geometry = parse_bbox('5.00005,6,5.00035,6.0002')
+    expected = await ElementQuery.find_many_by_geom(geometry, nodes_limit=None)
+
+    batches = [
+        batch
+        async for batch in ElementQuery.stream_many_by_geom(
+            geometry,
+            nodes_limit=MAP_QUERY_LEGACY_NODES_LIMIT,
+            legacy_nodes_limit=True,
+            batch_size=2,
+        )
+    ]
+    assert len(batches) > 2
+    for batch in batches:
+        assert len({element.type for element in batch}) == 1
+
+    streamed = [element for batch in batches for element in batch]
+    assert sorted(e.sequence_id for e in streamed) == sorted(e.sequence_id for e in expected)
+    assert len({e.sequence_id for e in streamed}) == len(streamed)
+
+    # nodes, ways, relations order
+    types_order = [element.type for element in streamed]
+    assert types_order == sorted(types_order, key=('node', 'way', 'relation').index)
+
+    # the endpoint returns the same elements
+    r = await client.get('/api/0.6/map.json?bbox=5.00005,6,5.00035,6.0002')
+    assert r.is_success, r.text
+    refs = {(element['type'], element['id']) for element in r.json()['elements']}
+    assert refs == {(element.type, element.id) for element in expected}
+    assert ('way', way_id) in refs
+    assert ('relation', relation_id) in refs
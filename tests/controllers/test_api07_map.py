@@ -0,0 +1,160 @@
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+import pytest
+from httpx import AsyncClient
+
+from app.format.api07_element import COLUMNAR_MEDIA_TYPE
+from app.lib.cursor_utils import CursorUtils
+from app.lib.xmltodict import XMLToDict
+from app.limits import MAP_QUERY_CURSOR_EXPIRE
+from app.models.messages_pb2 import Cursor
+
+
+async def _create_node(client: AsyncClient, lon: float, lat: float, name: str) -> int:
+    client.headers['Authorization'] = 'User user1'
+
+    # create changeset
+    r = await client.put(
+        '/api/0.6/changeset/create',
+        content=XMLToDict.unparse({'osm': {'changeset': {'tag': [{'@k': 'created_by', '@v': name}]}}}),
+    )
+    assert r.is_success, r.text
+    changeset_id = int(r.text)
+
+    # create node
+    r = await client.put(
+        '/api/0.6/node/create',
+        content=XMLToDict.unparse({'osm': {'node': {'@changeset': changeset_id, '@lon': lon, '@lat': lat}}}),
+    )
+    assert r.is_success, r.text
+    return int(r.text)
+
+
+@pytest.mark.parametrize(
+    ('accept', 'columnar'),
+    [
+        (None, False),
+        (COLUMNAR_MEDIA_TYPE, True),
+        (f'{COLUMNAR_MEDIA_TYPE}, application/json;q=0.9', True),
+        (f'{COLUMNAR_MEDIA_TYPE};q=0', False),
+        (f'{COLUMNAR_MEDIA_TYPE};q=0, */*', False),
+        (f'application/json, {COLUMNAR_MEDIA_TYPE};q=0.5', False),
+    ],
+)
+async def test_map_accept(client: AsyncClient, accept: str | None, columnar: bool):
+    await _create_node(client, 7.1234567, 8.1234567, test_map_accept.__name__)
+
+    headers = {'Accept': accept} if (accept is not None) else {}
+    r = await client.get('/api/0.7/map?bbox=7.123,8.123,7.124,8.124', headers=headers)
+    assert r.is_success, r.text
+    assert 'Accept' in r.headers['Vary']
+
+    if columnar:
+        assert r.headers['Content-Type'] == COLUMNAR_MEDIA_TYPE
+        assert r.content.startswith(b'OSMC\x01')
+    else:
+        assert r.headers['Content-Type'].startswith('application/json')
+
+
+async def test_map_response(client: AsyncClient):
+    node_id = await _create_node(client, 7.2234567, 8.2234567, test_map_response.__name__)
+
+    r = await client.get('/api/0.7/map?bbox=7.223,8.223,7.224,8.224')
+    assert r.is_success, r.text
+
+    data: dict = r.json()
+    assert data.keys() == {'elements', 'cursor'}
+    assert data['cursor'] is None
+    node = next(e for e in data['elements'] if e['type'] == 'node' and e['id'] == node_id)
+    assert node['lon'] == 7.2234567
+    assert node['lat'] == 8.2234567
+
+
+async def test_map_pages(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr('app.controllers.api07_map.MAP_QUERY_PAGE_NODES_LIMIT', 1)
+    bbox = '7.323,8.323,7.324,8.324'
+    node_ids = [
+        await _create_node(client, 7.3231 + 0.0001 * i, 8.3231, test_map_pages.__name__)  #
+        for i in range(3)
+    ]
+
+    r = await client.get(f'/api/0.7/map?bbox={bbox}')
+    assert r.is_success, r.text
+    data: dict = r.json()
+    pages_nodes = [[e['id'] for e in data['elements'] if e['type'] == 'node']]
+    cursor = data['cursor']
+    assert cursor is not None
+
+    # modify a node after the first page, the next pages are still read at the same snapshot
+    changed_id = node_ids[0] if node_ids[0] not in pages_nodes[0] else node_ids[1]
+    r = await client.put(
+        '/api/0.6/changeset/create',
+        content=XMLToDict.unparse({'osm': {'changeset': {'tag': [{'@k': 'created_by', '@v': 'test'}]}}}),
+    )
+    assert r.is_success, r.text
+    r = await client.put(
+        f'/api/0.6/node/{changed_id}',
+        content=XMLToDict.unparse(
+            {'osm': {'node': {'@id': changed_id, '@version': 1, '@changeset': int(r.text), '@lon': 0, '@lat': 0}}}
+        ),
+    )
+    assert r.is_success, r.text
+
+    while cursor is not None:
+        r = await client.get(f'/api/0.7/map?bbox={bbox}&cursor={cursor}')
+        assert r.is_success, r.text
+        data = r.json()
+        pages_nodes.append([e['id'] for e in data['elements'] if e['type'] == 'node'])
+        cursor = data['cursor']
+
+    assert all(len(nodes) <= 1 for nodes in pages_nodes)
+    assert sorted(node_id for nodes in pages_nodes for node_id in nodes) == sorted(node_ids)
+
+
+async def test_map_columnar_cursor(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr('app.controllers.api07_map.MAP_QUERY_PAGE_NODES_LIMIT', 1)
+    bbox = '7.423,8.423,7.424,8.424'
+    for i in range(2):
+        await _create_node(client, 7.4231 + 0.0001 * i, 8.4231, test_map_columnar_cursor.__name__)
+
+    r = await client.get(f'/api/0.7/map?bbox={bbox}', headers={'Accept': COLUMNAR_MEDIA_TYPE})
+    assert r.is_success, r.text
+    cursor = r.headers['X-Cursor']
+
+    r = await client.get(f'/api/0.7/map?bbox={bbox}&cursor={cursor}', headers={'Accept': COLUMNAR_MEDIA_TYPE})
+    assert r.is_success, r.text
+    assert 'X-Cursor' not in r.headers
+
+
+async def test_map_cursor_expired(client: AsyncClient):
+    expired = int(time.time() - MAP_QUERY_CURSOR_EXPIRE.total_seconds() - 1)
+    cursor = CursorUtils.to_str(Cursor(id=1, timestamp=expired, sequence_id=1, key='s'))
+
+    r = await client.get(f'/api/0.7/map?bbox=7.5,8.5,7.501,8.501&cursor={cursor}')
+    assert r.status_code == 400, r.text
+    assert 'expired' in r.text
+
+
+async def test_map_cursor_bad(client: AsyncClient):
+    # forged: valid protobuf, but not signed
+    forged = urlsafe_b64encode(
+        bytes(16) + Cursor(id=1, timestamp=int(time.time()), sequence_id=1, key='s').SerializeToString()
+    )
+    # tampered: signed, but modified afterwards
+    signed = urlsafe_b64decode(
+        CursorUtils.to_str(Cursor(id=1, timestamp=int(time.time()), sequence_id=1, key='s')) + '=='
+    )
+    tampered = urlsafe_b64encode(signed[:-1] + b't')
+    # valid signature, but missing the map fields
+    incomplete = CursorUtils.to_str(Cursor(id=1, timestamp=int(time.time())))
+
+    for cursor in ('garbage', '', forged.decode(), tampered.decode(), incomplete):
+        r = await client.get(f'/api/0.7/map?bbox=7.5,8.5,7.501,8.501&cursor={cursor}')
+        assert r.status_code == 400, (cursor, r.text)
+
+
+def test_cursor_round_trip():
+    cursor = Cursor(id=123, timestamp=456, sequence_id=789, key='u4pruydqqvj')
+    parsed = CursorUtils.from_str(CursorUtils.to_str(cursor), expire=None)
+    assert parsed == cursor
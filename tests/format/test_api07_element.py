@@ -0,0 +1,207 @@
+from datetime import UTC, datetime
+
+import numpy as np
+from shapely import Point
+
+from app.format.api07_element import Element07Mixin
+from app.lib.varint import decode_varints, zigzag_decode
+from app.models.db.element import Element
+from app.models.db.element_member import ElementMember
+from app.models.element import ElementId
+
+_types = ('node', 'way', 'relation')
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    end = pos
+    while data[end] & 0x80:
+        end += 1
+    return int(decode_varints(data[pos : end + 1])[0]), end + 1
+
+
+def _read_column(data: bytes, pos: int) -> tuple[bytes, int]:
+    length, pos = _read_varint(data, pos)
+    return data[pos : pos + length], pos + length
+
+
+def _read_delta(data: bytes, pos: int) -> tuple[list[int], int]:
+    column, pos = _read_column(data, pos)
+    return np.cumsum(zigzag_decode(decode_varints(column))).tolist(), pos
+
+
+def _read_plain(data: bytes, pos: int) -> tuple[list[int], int]:
+    column, pos = _read_column(data, pos)
+    return decode_varints(column).tolist(), pos
+
+
+def _decode_columnar(data: bytes) -> list[dict]:
+    """
+    Reference decoder, following spec/api07_data_model.md.
+    """
+    assert data[:5] == b'OSMC\x01'
+    pos = 5
+    num_strings, pos = _read_varint(data, pos)
+    lengths, pos = _read_plain(data, pos)
+    strings_data, pos = _read_column(data, pos)
+    assert len(lengths) == num_strings
+    strings: list[str] = []
+    offset = 0
+    for length in lengths:
+        strings.append(strings_data[offset : offset + length].decode())
+        offset += length
+
+    result: list[dict] = []
+    for type in _types:
+        num_elements, pos = _read_varint(data, pos)
+        if not num_elements:
+            continue
+
+        ids, pos = _read_delta(data, pos)
+        versions, pos = _read_plain(data, pos)
+        changeset_ids, pos = _read_delta(data, pos)
+        user_ids, pos = _read_plain(data, pos)
+        created_at, pos = _read_delta(data, pos)
+        visible_column, pos = _read_column(data, pos)
+        visible = np.unpackbits(np.frombuffer(visible_column, np.uint8), bitorder='little')[:num_elements]
+
+        elements = [
+            {
+                'type': type,
+                'id': ids[i],
+                'version': versions[i],
+                'changeset_id': changeset_ids[i],
+                'user_id': user_ids[i] - 1 if user_ids[i] else None,
+                'created_at': created_at[i],
+                'visible': bool(visible[i]),
+            }
+            for i in range(num_elements)
+        ]
+
+        if type == 'node':
+            lons, pos = _read_delta(data, pos)
+            lats, pos = _read_delta(data, pos)
+            coords = iter(zip(lons, lats, strict=True))
+            for element in elements:
+                if element['visible']:
+                    lon, lat = next(coords)
+                    element['lon'] = lon / 10_000_000
+                    element['lat'] = lat / 10_000_000
+            assert next(coords, None) is None
+
+        tags, pos = _read_plain(data, pos)
+        tags_iter = iter(tags)
+        for element in elements:
+            num_tags = next(tags_iter)
+            element['tags'] = {strings[next(tags_iter)]: strings[next(tags_iter)] for _ in range(num_tags)}
+
+        if type != 'node':
+            counts, pos = _read_plain(data, pos)
+            members_ids, pos = _read_delta(data, pos)
+            if type == 'relation':
+                members_types, pos = _read_plain(data, pos)
+                members_roles, pos = _read_plain(data, pos)
+            else:
+                members_types = [0] * len(members_ids)
+                members_roles = None
+            i = 0
+            for element, count in zip(elements, counts, strict=True):
+                element['members'] = [
+                    {
+                        'type': _types[members_types[j]],
+                        'id': members_ids[j],
+                        'role': strings[members_roles[j]] if members_roles is not None else '',
+                    }
+                    for j in range(i, i + count)
+                ]
+                i += count
+
+        result.extend(elements)
+
+    assert pos == len(data)
+    return result
+
+
+def _element(type, id, version, *, visible=True, tags=None, point=None, members=()) -> Element:
+    element = Element(
+        changeset_id=100 + id,
+        type=type,
+        id=ElementId(id),
+        version=version,
+        visible=visible,
+        tags=tags or {},
+        point=point,
+        members=[
+            ElementMember(order=i, type=member_type, id=ElementId(member_id), role=role)
+            for i, (member_type, member_id, role) in enumerate(members)
+        ],
+    )
+    element.created_at = datetime(2024, 1, 1, 0, 0, id, tzinfo=UTC)
+    element.user_id = id if id % 2 else None
+    return element
+
+
+def test_encode_elements_columnar():
+    elements = (
+        _element('relation', 7, 1, tags={'type': 'route'}, members=(('way', 5, 'outer'), ('node', 2, 'stop'))),
+        _element('node', 2, 3, tags={'name': 'route'}, point=Point(-1.2345678, 51.5)),
+        _element('way', 5, 1, tags={'name': 'a'}, members=(('node', 2, ''), ('node', 1, ''))),
+        _element('node', 1, 1, tags={'name': 'a', 'type': 'route'}, point=Point(1.2345678, -2.3456789)),
+        _element('node', 3, 2, visible=False),
+    )
+    data = Element07Mixin.encode_elements_columnar(elements)
+    decoded = _decode_columnar(data)
+
+    assert [(e['type'], e['id']) for e in decoded] == [
+        ('node', 1),
+        ('node', 2),
+        ('node', 3),
+        ('way', 5),
+        ('relation', 7),
+    ]
+    node1, node2, node3, way, relation = decoded
+
+    assert node1['version'] == 1
+    assert node1['lon'] == 1.2345678
+    assert node1['lat'] == -2.3456789
+    assert node1['tags'] == {'name': 'a', 'type': 'route'}
+    assert node1['user_id'] == 1
+    assert node1['changeset_id'] == 101
+    assert node1['created_at'] == int(datetime(2024, 1, 1, 0, 0, 1, tzinfo=UTC).timestamp() * 1_000_000)
+
+    assert node2['lon'] == -1.2345678
+    assert node2['lat'] == 51.5
+    assert node2['user_id'] is None
+
+    # deleted node has no coordinates
+    assert node3['visible'] is False
+    assert 'lon' not in node3
+    assert node3['tags'] == {}
+
+    assert way['members'] == [
+        {'type': 'node', 'id': 2, 'role': ''},
+        {'type': 'node', 'id': 1, 'role': ''},
+    ]
+    assert relation['tags'] == {'type': 'route'}
+    assert relation['members'] == [
+        {'type': 'way', 'id': 5, 'role': 'outer'},
+        {'type': 'node', 'id': 2, 'role': 'stop'},
+    ]
+
+
+def test_encode_elements_columnar_string_table():
+    elements = (
+        _element('node', 1, 1, tags={'name': 'name'}, point=Point(0, 0)),
+        _element('node', 2, 1, tags={'name': 'name'}, point=Point(0, 0)),
+    )
+    data = Element07Mixin.encode_elements_columnar(elements)
+
+    # strings are stored once, in the shared table
+    assert data.count(b'name') == 1
+    assert _read_varint(data, 5)[0] == 1
+    assert [e['tags'] for e in _decode_columnar(data)] == [{'name': 'name'}, {'name': 'name'}]
+
+
+def test_encode_elements_columnar_empty():
+    data = Element07Mixin.encode_elements_columnar(())
+    assert data == b'OSMC\x01\x00\x00\x00\x00\x00\x00'
+    assert _decode_columnar(data) == []
@@ -0,0 +1,36 @@
+from datetime import UTC, datetime
+
+from app.format.gpx import FormatGPX
+from app.limits import TRACE_SEGMENT_MAX_SIZE
+
+
+def test_decode_gpx():
+    gpx = b"""<?xml version="1.0"?>
+    <gpx xmlns="http://www.topografix.com/GPX/1/1">
+        <trk></trk>
+        <trk>
+            <trkseg>
+                <trkpt lat="2" lon="1"><ele>100.5</ele><time>2024-01-01T10:00:00Z</time></trkpt>
+                <trkpt lon="3"/>
+                <trkpt lat="2.0001" lon="1.0001"/>
+            </trkseg>
+            <trkseg></trkseg>
+            <trkseg><trkpt lat="4" lon="3"/></trkseg>
+        </trk>
+    </gpx>"""
+    segments = FormatGPX.decode_gpx(gpx, track_num_start=5)
+    assert [(s.track_num, s.segment_num) for s in segments] == [(6, 0), (8, 0)]
+    assert [(p.x, p.y) for p in segments[0].points.geoms] == [(1, 2), (1.0001, 2.0001)]
+    assert segments[0].elevations == [100.5, None]
+    assert segments[0].capture_times == [datetime(2024, 1, 1, 10, tzinfo=UTC), None]
+    assert segments[1].elevations is None
+    assert segments[1].capture_times is None
+
+
+def test_decode_gpx_split_segments():
+    trkpts = b''.join(b'<trkpt lat="0" lon="0"/>' for _ in range(TRACE_SEGMENT_MAX_SIZE * 2))
+    gpx = b'<gpx><trk><trkseg>' + trkpts + b'</trkseg></trk></gpx>'
+    segments = FormatGPX.decode_gpx(gpx)
+    assert [s.segment_num for s in segments] == [0, 1, 2]
+    assert all(s.track_num == 0 for s in segments)
+    assert sum(len(s.points.geoms) for s in segments) == TRACE_SEGMENT_MAX_SIZE * 2
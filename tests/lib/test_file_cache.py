@@ -1,5 +1,11 @@
 from datetime import timedelta
+from pathlib import Path
 
+import pytest
+from zstandard import train_dictionary
+
+from app.lib import file_cache, zstd_dict
+from app.lib.crypto import hash_hex
 from app.lib.file_cache import FileCache
 
 
@@ -15,3 +21,62 @@ async def test_file_cache_expire():
     cache = FileCache('test')
     await cache.set('key', b'value', ttl=timedelta(seconds=-2))
     assert await cache.get('key') is None
+
+
+async def test_file_cache_zstd_dict(monkeypatch: pytest.MonkeyPatch):
+    samples = [f'{{"id":{i},"name":"Value {i * 7}","tags":["a","b"]}}'.encode() for i in range(1000)]
+    dict_data = train_dictionary(4096, samples)
+    monkeypatch.setattr(zstd_dict, '_load_dicts', lambda: {'test-dict': {1: dict_data}})
+    zstd_dict._get_compressor.cache_clear()  # noqa: SLF001
+    zstd_dict._get_decompressor.cache_clear()  # noqa: SLF001
+
+    cache = FileCache('test-dict')
+    value = samples[0] * 2
+    await cache.set('key', value, ttl=None)
+    assert await cache.get('key') == value
+    assert await cache.sample(10) == [value]
+
+
+async def test_file_cache_cleanup(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    cache = FileCache('test', cache_dir=tmp_path)
+    await cache.set('expired', b'value', ttl=timedelta(seconds=-2))
+    await cache.set('key', b'value', ttl=None)
+
+    await cache.cleanup()
+    assert _find_entry(tmp_path, 'expired') is None
+    assert await cache.get('key') == b'value'
+
+    monkeypatch.setattr(file_cache, 'FILE_CACHE_SIZE_GB', 0)
+    await cache.cleanup()
+    assert await cache.get('key') is None
+
+
+async def test_file_cache_stream(tmp_path: Path):
+    cache = FileCache('test', cache_dir=tmp_path)
+
+    async def chunks():
+        yield b'hello '
+        yield b'world'
+
+    await cache.set_stream('key', chunks(), ttl=None)
+    value = await cache.get('key')
+    assert isinstance(value, memoryview)
+    assert value == b'hello world'
+
+
+async def test_file_cache_corrupted(tmp_path: Path):
+    cache = FileCache('test', cache_dir=tmp_path)
+    await cache.set('key', b'value', ttl=None)
+    _corrupt_entry(tmp_path, 'key')
+    assert await cache.get('key') is None
+
+
+def _find_entry(cache_dir: Path, key: str) -> Path | None:
+    key_hash = hash_hex(key)
+    return next((path for path in cache_dir.rglob('*') if path.name == key_hash), None)
+
+
+def _corrupt_entry(cache_dir: Path, key: str) -> None:
+    path = _find_entry(cache_dir, key)
+    assert path is not None
+    path.write_bytes(path.read_bytes()[:-1] + b'X')
@@ -1,10 +1,12 @@
 import math
 
+import numpy as np
 import pytest
 from shapely import MultiPolygon, Point, box
 
 from app.lib.geo_utils import (
     haversine_distance,
+    hilbert_key,
     meters_to_radians,
     parse_bbox,
     radians_to_meters,
@@ -97,3 +99,17 @@ def test_parse_bbox_invalid(bbox):
 )
 def test_try_parse_point(lat_lon, expected):
     assert try_parse_point(lat_lon) == expected
+
+
+def test_hilbert_key():
+    n = 8
+    xs, ys = np.meshgrid(np.arange(n), np.arange(n))
+    xs = xs.ravel()
+    ys = ys.ravel()
+    keys = hilbert_key((xs + 0.5) * 360 / n - 180, (ys + 0.5) * 180 / n - 90, order=3)
+    assert sorted(keys.tolist()) == list(range(n * n))
+
+    # consecutive keys are adjacent cells
+    order = np.argsort(keys)
+    steps = np.abs(np.diff(xs[order])) + np.abs(np.diff(ys[order]))
+    assert (steps == 1).all()
@@ -0,0 +1,82 @@
+import struct
+import zlib
+
+from app.lib.osm_pbf import OSMPBF
+from app.models.osmpbf_pb2 import Blob, BlobHeader, HeaderBlock, PrimitiveBlock, Relation
+
+
+def _decode_file_block(data: bytes) -> tuple[str, bytes]:
+    (header_size,) = struct.unpack('>I', data[:4])
+    header = BlobHeader.FromString(data[4 : 4 + header_size])
+    blob = Blob.FromString(data[4 + header_size :])
+    assert header.datasize == len(data) - 4 - header_size
+    raw = zlib.decompress(blob.zlib_data)
+    assert blob.raw_size == len(raw)
+    return header.type, raw
+
+
+def _cumsum(values) -> list[int]:
+    result = []
+    total = 0
+    for value in values:
+        total += value
+        result.append(total)
+    return result
+
+
+def test_encode_header():
+    type, raw = _decode_file_block(OSMPBF.encode_header(bounds=(1, 2, 3, 4), history=True))
+    assert type == 'OSMHeader'
+    header = HeaderBlock.FromString(raw)
+    assert 'DenseNodes' in header.required_features
+    assert 'HistoricalInformation' in header.required_features
+    assert (header.bbox.left, header.bbox.bottom, header.bbox.right, header.bbox.top) == (1e9, 2e9, 3e9, 4e9)
+
+
+def test_encode_dense_nodes():
+    lines = (
+        # COPY text format doubles the JSON escape backslash
+        b'[1,1,true,10,1700000000,5,"user\\\\\\\\name",{"a":"b"},1.5,-2.25,[]]',
+        b'[3,2,false,11,1700000060,null,null,{},null,null,[]]',
+    )
+    type, raw = _decode_file_block(OSMPBF.encode_block('node', lines, history=True))
+    assert type == 'OSMData'
+    block = PrimitiveBlock.FromString(raw)
+    strings = [s.decode() for s in block.stringtable.s]
+    assert strings[0] == ''
+    dense = block.primitivegroup[0].dense
+    assert _cumsum(dense.id) == [1, 3]
+    assert _cumsum(dense.lon) == [15_000_000, 0]
+    assert _cumsum(dense.lat) == [-22_500_000, 0]
+    info = dense.denseinfo
+    assert list(info.version) == [1, 2]
+    assert _cumsum(info.timestamp) == [1700000000, 1700000060]
+    assert _cumsum(info.changeset) == [10, 11]
+    assert _cumsum(info.uid) == [5, 0]
+    assert [strings[i] for i in _cumsum(info.user_sid)] == ['user\\name', '']
+    assert list(info.visible) == [True, False]
+    assert [strings[i] for i in dense.keys_vals[:2]] == ['a', 'b']
+    assert list(dense.keys_vals[2:]) == [0, 0]
+
+
+def test_encode_way_relation():
+    lines = (b'[2,1,true,10,1700000000,5,"user",{},null,null,[["node",4,""],["node",2,""]]]',)
+    _, raw = _decode_file_block(OSMPBF.encode_block('way', lines, history=False))
+    block = PrimitiveBlock.FromString(raw)
+    way = block.primitivegroup[0].ways[0]
+    assert way.id == 2
+    assert _cumsum(way.refs) == [4, 2]
+    assert not way.info.HasField('visible')
+
+    lines = (b'[7,3,true,10,1700000000,5,"user",{"type":"route"},null,null,[["way",2,"outer"],["node",4,""]]]',)
+    _, raw = _decode_file_block(OSMPBF.encode_block('relation', lines, history=False))
+    block = PrimitiveBlock.FromString(raw)
+    strings = [s.decode() for s in block.stringtable.s]
+    relation = block.primitivegroup[0].relations[0]
+    assert relation.id == 7
+    assert relation.info.version == 3
+    assert [strings[i] for i in relation.keys] == ['type']
+    assert [strings[i] for i in relation.vals] == ['route']
+    assert _cumsum(relation.memids) == [2, 4]
+    assert list(relation.types) == [Relation.WAY, Relation.NODE]
+    assert [strings[i] for i in relation.roles_sid] == ['outer', '']
@@ -6,3 +6,20 @@ def test_trace_file_compression():
     file_id = 'test' + suffix
     assert TraceFile.decompress_if_needed(compressed, file_id) == b'hello'
     assert TraceFile.decompress_if_needed(compressed, '') != b'hello'
+
+
+async def test_trace_file_compression_stream():
+    async def chunks():
+        yield b'hello '
+        yield b'world'
+
+    compressed_chunks, suffix = TraceFile.compress_stream(chunks())
+    compressed = [chunk async for chunk in compressed_chunks]
+    assert TraceFile.decompress_if_needed(b''.join(compressed), 'test' + suffix) == b'hello world'
+
+    async def compressed_stream():
+        for chunk in compressed:
+            yield chunk
+
+    decompressed = TraceFile.decompress_stream_if_needed(compressed_stream(), 'test' + suffix)
+    assert b''.join([chunk async for chunk in decompressed]) == b'hello world'
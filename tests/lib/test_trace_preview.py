@@ -0,0 +1,18 @@
+import numpy as np
+
+from app.lib.trace_preview import TracePreview
+from app.limits import TRACE_PREVIEW_MAX_POINTS, TRACE_PREVIEW_RESOLUTION
+
+
+def test_trace_preview_roundtrip():
+    coords = np.column_stack((np.linspace(0, 1, 1000), np.linspace(0, 1, 1000)))
+    preview = TracePreview.decode(TracePreview.encode(coords))
+    assert len(preview) == TRACE_PREVIEW_MAX_POINTS * 2
+    assert all(0 <= value <= TRACE_PREVIEW_RESOLUTION for value in preview)
+    # downsampling keeps the endpoints
+    assert preview[:2] == [0, TRACE_PREVIEW_RESOLUTION]
+
+
+def test_trace_preview_too_few_points():
+    assert TracePreview.encode(np.array([[1.0, 2.0]])) == b''
+    assert TracePreview.decode(None) == []
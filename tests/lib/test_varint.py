@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from app.lib.varint import decode_varints, encode_varints, zigzag_decode, zigzag_encode
+
+
+@pytest.mark.parametrize(
+    ('values', 'expected'),
+    [
+        ([], b''),
+        ([0], b'\x00'),
+        ([127], b'\x7f'),
+        ([128], b'\x80\x01'),
+        ([1, 300], b'\x01\xac\x02'),
+        ([2**64 - 1], b'\xff\xff\xff\xff\xff\xff\xff\xff\xff\x01'),
+    ],
+)
+def test_varints(values, expected):
+    encoded = encode_varints(np.array(values, np.uint64))
+    assert encoded == expected
+    assert decode_varints(encoded).tolist() == values
+
+
+def test_varints_truncated():
+    with pytest.raises(ValueError):
+        decode_varints(b'\x80')
+
+
+def test_zigzag():
+    values = np.array([0, -1, 1, -2, 2, 2**62, -(2**62)], np.int64)
+    encoded = zigzag_encode(values)
+    assert encoded[:5].tolist() == [0, 1, 2, 3, 4]
+    assert zigzag_decode(encoded).tolist() == values.tolist()
@@ -0,0 +1,125 @@
+from shapely import Point
+
+from app.models.db.element import Element
+from app.models.db.element_member import ElementMember
+from app.models.element import ElementId, ElementRef, VersionedElementRef
+from app.queries.element_query import ElementQuery
+from app.services.optimistic_diff import OptimisticDiff
+
+
+async def _create_elements(changeset_id: int) -> tuple[list[ElementRef], list[ElementRef], list[ElementRef]]:
+    nodes = [
+        Element(
+            changeset_id=changeset_id,
+            type='node',
+            id=ElementId(-i),
+            version=1,
+            visible=True,
+            tags={},
+            point=Point(0.001 * i, 0),
+            members=[],
+        )
+        for i in range(1, 101)
+    ]
+    ways = [
+        Element(
+            changeset_id=changeset_id,
+            type='way',
+            id=ElementId(-i),
+            version=1,
+            visible=True,
+            tags={},
+            point=None,
+            members=[
+                ElementMember(order=0, type='node', id=ElementId(-i), role=''),
+                ElementMember(order=1, type='node', id=ElementId(-i - 1), role=''),
+            ],
+        )
+        for i in range(1, 31)
+    ]
+    relations = [
+        Element(
+            changeset_id=changeset_id,
+            type='relation',
+            id=ElementId(-i),
+            version=1,
+            visible=True,
+            tags={},
+            point=None,
+            members=[
+                ElementMember(order=0, type='way', id=ElementId(-i), role='outer'),
+                ElementMember(order=1, type='node', id=ElementId(-50 - i), role='label'),
+            ],
+        )
+        for i in range(1, 11)
+    ]
+    assigned_ref_map = await OptimisticDiff.run((*nodes, *ways, *relations))
+    return tuple(  # pyright: ignore[reportReturnType]
+        [
+            ElementRef(type, assigned_ref_map[ElementRef(type, element.id)][0].id)  #
+            for element in elements
+        ]
+        for type, elements in (('node', nodes), ('way', ways), ('relation', relations))
+    )
+
+
+async def test_refs_queries(changeset_id: int):
+    node_refs, way_refs, relation_refs = await _create_elements(changeset_id)
+    all_refs = [*node_refs, *way_refs, *relation_refs]
+
+    # get_by_refs
+    elements = await ElementQuery.get_by_refs(all_refs, limit=None)
+    assert sorted((e.type, e.id) for e in elements) == sorted(all_refs)
+    assert all(e.version == 1 for e in elements)
+
+    # get_by_versioned_refs
+    versioned_refs = [VersionedElementRef(ref.type, ref.id, 1) for ref in all_refs]
+    elements = await ElementQuery.get_by_versioned_refs(versioned_refs, limit=None)
+    assert sorted((e.type, e.id) for e in elements) == sorted(all_refs)
+    assert not await ElementQuery.get_by_versioned_refs(
+        [VersionedElementRef(ref.type, ref.id, 2) for ref in all_refs],
+        limit=None,
+    )
+
+    # check_is_latest
+    assert await ElementQuery.check_is_latest(versioned_refs)
+
+    # filter_visible_refs
+    missing_ref = ElementRef('node', ElementId(2**62))
+    visible_refs = await ElementQuery.filter_visible_refs([*all_refs, missing_ref])
+    assert sorted(visible_refs) == sorted(all_refs)
+
+    # check_is_unreferenced: nodes 1-31 and 51-60 are referenced, the other nodes are not
+    current_sequence_id = min(e.sequence_id for e in elements) - 1
+    assert not await ElementQuery.check_is_unreferenced(node_refs, current_sequence_id)
+    assert not await ElementQuery.check_is_unreferenced(way_refs, current_sequence_id)
+    assert await ElementQuery.check_is_unreferenced(node_refs[80:], current_sequence_id)
+    assert await ElementQuery.check_is_unreferenced(relation_refs, current_sequence_id)
+
+    # delete an unreferenced node
+    deleted_ref = node_refs[-1]
+    await OptimisticDiff.run(
+        (
+            Element(
+                changeset_id=changeset_id,
+                type='node',
+                id=deleted_ref.id,
+                version=2,
+                visible=False,
+                tags={},
+                point=None,
+                members=[],
+            ),
+        )
+    )
+
+    assert not await ElementQuery.check_is_latest(versioned_refs)
+    assert await ElementQuery.check_is_latest(versioned_refs[:-41])
+
+    visible_refs = await ElementQuery.filter_visible_refs(all_refs)
+    assert sorted(visible_refs) == sorted(ref for ref in all_refs if ref != deleted_ref)
+
+    elements = await ElementQuery.get_by_refs(all_refs, limit=None)
+    deleted = next(e for e in elements if e.type == 'node' and e.id == deleted_ref.id)
+    assert deleted.version == 2
+    assert not deleted.visible
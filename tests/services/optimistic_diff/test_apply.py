@@ -0,0 +1,84 @@
+import pytest
+from httpx import AsyncClient
+from shapely import Point
+
+from app.exceptions.optimistic_diff_error import OptimisticDiffError
+from app.lib.xmltodict import XMLToDict
+from app.models.db.element import Element
+from app.models.db.element_member import ElementMember
+from app.models.element import ElementId, ElementRef
+from app.queries.element_query import ElementQuery
+from app.services.changeset_service import ChangesetService
+from app.services.element_cache_service import ElementCacheService
+from app.services.optimistic_diff import OptimisticDiff
+from app.services.optimistic_diff.apply import OptimisticDiffApply
+from app.services.optimistic_diff.prepare import OptimisticDiffPrepare
+
+
+def _node(changeset_id: int, id: int, version: int, *, visible: bool = True) -> Element:
+    return Element(
+        changeset_id=changeset_id,
+        type='node',
+        id=ElementId(id),
+        version=version,
+        visible=visible,
+        tags={},
+        point=Point(0, 0) if visible else None,
+        members=[],
+    )
+
+
+async def test_apply_changeset_closed_concurrently(changeset_id: int):
+    prep = OptimisticDiffPrepare((_node(changeset_id, -1, 1),))
+    await prep.prepare()
+
+    await ChangesetService.close(changeset_id)
+
+    with pytest.raises(ExceptionGroup) as exc_info:
+        await OptimisticDiffApply.apply(prep)
+    assert exc_info.group_contains(OptimisticDiffError)
+
+
+async def test_apply_member_deleted_concurrently(client: AsyncClient, changeset_id: int):
+    assigned_ref_map = await OptimisticDiff.run((_node(changeset_id, -1, 1),))
+    node_id = assigned_ref_map[ElementRef('node', ElementId(-1))][0].id
+
+    way = Element(
+        changeset_id=changeset_id,
+        type='way',
+        id=ElementId(-1),
+        version=1,
+        visible=True,
+        tags={},
+        point=None,
+        members=[ElementMember(order=0, type='node', id=node_id, role='')],
+    )
+    prep = OptimisticDiffPrepare((way,))
+    await prep.prepare()
+
+    # the member is deleted after it was checked, but before the way is applied,
+    # in another changeset to leave the way's changeset unchanged
+    r = await client.put(
+        '/api/0.6/changeset/create',
+        content=XMLToDict.unparse({'osm': {'changeset': {'tag': [{'@k': 'created_by', '@v': 'tests'}]}}}),
+    )
+    assert r.is_success, r.text
+    other_changeset_id = int(r.text)
+    await OptimisticDiff.run((_node(other_changeset_id, node_id, 2, visible=False),))
+
+    with pytest.raises(ExceptionGroup) as exc_info:
+        await OptimisticDiffApply.apply(prep)
+    assert exc_info.group_contains(OptimisticDiffError, match='member was deleted')
+
+
+async def test_apply_cache_invalidate_failure(changeset_id: int, monkeypatch: pytest.MonkeyPatch):
+    async def invalidate(refs):
+        raise ConnectionError('unavailable')
+
+    monkeypatch.setattr(ElementCacheService, 'invalidate', invalidate)
+
+    # the diff is committed, even if the cache can't be invalidated
+    assigned_ref_map = await OptimisticDiff.run((_node(changeset_id, -1, 1),))
+    node_id = assigned_ref_map[ElementRef('node', ElementId(-1))][0].id
+    elements = await ElementQuery.get_by_refs((ElementRef('node', node_id),), limit=1)
+    assert elements[0].version == 1
@@ -0,0 +1,153 @@
+import pytest
+from shapely import Point
+
+from app.exceptions.api_error import APIError
+from app.exceptions.optimistic_diff_error import OptimisticDiffError
+from app.models.db.element import Element
+from app.models.db.element_member import ElementMember
+from app.models.element import ElementId, ElementRef
+from app.queries.element_query import ElementQuery
+from app.services.optimistic_diff import OptimisticDiff
+from app.services.optimistic_diff.apply import OptimisticDiffApply
+from app.services.optimistic_diff.prepare import OptimisticDiffPrepare
+
+
+def _node(changeset_id: int, id: int, version: int, *, visible: bool = True, x: float = 0) -> Element:
+    return Element(
+        changeset_id=changeset_id,
+        type='node',
+        id=ElementId(id),
+        version=version,
+        visible=visible,
+        tags={},
+        point=Point(x, 0) if visible else None,
+        members=[],
+    )
+
+
+async def _create_nodes(changeset_id: int, count: int) -> list[ElementId]:
+    assigned_ref_map = await OptimisticDiff.run([_node(changeset_id, -i, 1) for i in range(1, count + 1)])
+    return [assigned_ref_map[ElementRef('node', ElementId(-i))][0].id for i in range(1, count + 1)]
+
+
+async def test_retry_reuses_unchanged_state(changeset_id: int):
+    node_a, node_b = await _create_nodes(changeset_id, 2)
+    elements = (_node(changeset_id, node_a, 2, x=1), _node(changeset_id, node_b, 2, x=1))
+
+    prep1 = OptimisticDiffPrepare(elements)
+    await prep1.prepare()
+
+    # unrelated change in the meantime
+    await _create_nodes(changeset_id, 1)
+
+    prep2 = OptimisticDiffPrepare(elements, previous=prep1)
+    await prep2.prepare()
+    assert prep2.at_sequence_id > prep1.at_sequence_id
+    assert not prep2._changed_refs  # noqa: SLF001
+    for ref in (ElementRef('node', node_a), ElementRef('node', node_b)):
+        assert prep2.element_state[ref].remote is prep1.element_state[ref].remote
+
+    await OptimisticDiffApply.apply(prep2)
+    elements = await ElementQuery.get_by_refs((ElementRef('node', node_a),), limit=1)
+    assert elements[0].version == 2
+
+
+async def test_retry_refetches_changed_state(changeset_id: int):
+    node_a, node_b = await _create_nodes(changeset_id, 2)
+    elements = (_node(changeset_id, node_a, 2, x=1), _node(changeset_id, node_b, 2, x=1))
+
+    prep1 = OptimisticDiffPrepare(elements)
+    await prep1.prepare()
+
+    # conflicting change in the meantime
+    await OptimisticDiff.run((_node(changeset_id, node_a, 2, x=2),))
+    with pytest.raises(ExceptionGroup) as apply_exc_info:
+        await OptimisticDiffApply.apply(prep1)
+    assert apply_exc_info.group_contains(OptimisticDiffError)
+
+    prep2 = OptimisticDiffPrepare(elements, previous=prep1)
+    with pytest.raises(APIError) as exc_info:
+        await prep2.prepare()
+    assert exc_info.value.status_code == 409
+    assert prep2._changed_refs == {ElementRef('node', node_a)}  # noqa: SLF001
+
+    # the unchanged element was reused, the changed one was fetched again
+    ref_a = ElementRef('node', node_a)
+    ref_b = ElementRef('node', node_b)
+    assert prep2.element_state[ref_b].remote is prep1.element_state[ref_b].remote
+    remote_a = prep2.element_state[ref_a].remote
+    assert remote_a is not None
+    assert remote_a.version == 2
+
+
+async def test_retry_reuses_unchanged_parents(changeset_id: int):
+    (node_id,) = await _create_nodes(changeset_id, 1)
+    elements = (_node(changeset_id, node_id, 2, visible=False),)
+
+    prep1 = OptimisticDiffPrepare(elements)
+    await prep1.prepare()
+
+    await _create_nodes(changeset_id, 1)
+
+    prep2 = OptimisticDiffPrepare(elements, previous=prep1)
+    await prep2.prepare()
+    assert prep2._elements_parents_refs is prep1._elements_parents_refs  # noqa: SLF001
+
+
+async def test_retry_refetches_parents_on_new_reference(changeset_id: int):
+    (node_id,) = await _create_nodes(changeset_id, 1)
+    elements = (_node(changeset_id, node_id, 2, visible=False),)
+
+    prep1 = OptimisticDiffPrepare(elements)
+    await prep1.prepare()
+
+    # a way starts referencing the node in the meantime
+    await OptimisticDiff.run(
+        (
+            Element(
+                changeset_id=changeset_id,
+                type='way',
+                id=ElementId(-1),
+                version=1,
+                visible=True,
+                tags={},
+                point=None,
+                members=[ElementMember(order=0, type='node', id=node_id, role='')],
+            ),
+        )
+    )
+    with pytest.raises(ExceptionGroup) as apply_exc_info:
+        await OptimisticDiffApply.apply(prep1)
+    assert apply_exc_info.group_contains(OptimisticDiffError)
+
+    # the node is no longer deletable
+    prep2 = OptimisticDiffPrepare(elements, previous=prep1)
+    with pytest.raises(APIError) as exc_info:
+        await prep2.prepare()
+    assert exc_info.value.status_code == 412
+    assert prep2._elements_parents_refs is not prep1._elements_parents_refs  # noqa: SLF001
+
+
+async def test_prefetch_members_visible(changeset_id: int):
+    node_a, node_b = await _create_nodes(changeset_id, 2)
+    await OptimisticDiff.run((_node(changeset_id, node_b, 2, visible=False),))
+
+    way = Element(
+        changeset_id=changeset_id,
+        type='way',
+        id=ElementId(-1),
+        version=1,
+        visible=True,
+        tags={},
+        point=None,
+        members=[
+            ElementMember(order=0, type='node', id=node_a, role=''),
+            ElementMember(order=1, type='node', id=node_b, role=''),
+        ],
+    )
+    prep = OptimisticDiffPrepare((way,))
+    with pytest.raises(ExceptionGroup) as exc_info:
+        await prep.prepare()
+    assert exc_info.group_contains(APIError)
+    assert prep._members_prefetch_refs == {ElementRef('node', node_a), ElementRef('node', node_b)}  # noqa: SLF001
+    assert prep._members_prefetch_visible_refs == {ElementRef('node', node_a)}  # noqa: SLF001
@@ -0,0 +1,173 @@
+from asyncio import Event, TaskGroup, gather, sleep
+from datetime import timedelta
+
+import pytest
+
+from app.lib.buffered_random import buffered_rand_urlsafe
+from app.limits import CACHE_NEGATIVE_EXPIRE
+from app.services import cache_service
+from app.services.cache_service import CacheContext, CacheRequest, CacheService
+
+_context = CacheContext('Test')
+
+
+async def test_cache_single_flight():
+    key = buffered_rand_urlsafe(16)
+    calls = 0
+    release = Event()
+
+    async def factory() -> bytes:
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return b'value'
+
+    async with TaskGroup() as tg:
+        tasks = [tg.create_task(CacheService.get(key, _context, factory)) for _ in range(5)]
+        # let all the tasks miss the cache
+        await sleep(0.1)
+        release.set()
+
+    assert calls == 1
+    assert all(task.result().value == b'value' for task in tasks)
+
+
+async def test_cache_single_flight_cancel():
+    key = buffered_rand_urlsafe(16)
+    release = Event()
+
+    async def factory() -> bytes:
+        await release.wait()
+        return b'value'
+
+    async with TaskGroup() as tg:
+        owner = tg.create_task(CacheService.get(key, _context, factory))
+        await sleep(0.1)
+        waiter = tg.create_task(CacheService.get(key, _context, factory))
+        await sleep(0.1)
+
+        # the waiter is not affected by the cancelled owner
+        owner.cancel()
+        await sleep(0.1)
+        release.set()
+
+    assert owner.cancelled()
+    assert waiter.result().value == b'value'
+
+
+async def test_cache_get_many():
+    hit_key = buffered_rand_urlsafe(16)
+    miss_key = buffered_rand_urlsafe(16)
+    large_value = b'x' * 10_000  # compressed
+
+    async def hit_factory() -> bytes:
+        return large_value
+
+    async def miss_factory() -> bytes:
+        return b'miss'
+
+    await CacheService.get(hit_key, _context, hit_factory)
+
+    async def unexpected_factory() -> bytes:
+        raise AssertionError('Factory must not be called on cache hit')
+
+    entries = await CacheService.get_many(
+        (
+            CacheRequest(miss_key, _context, miss_factory),
+            CacheRequest(hit_key, _context, unexpected_factory),
+        )
+    )
+    assert [entry.value for entry in entries] == [b'miss', large_value]
+    assert entries[0].id == miss_key.encode()
+
+    entry = await CacheService.get(miss_key, _context, unexpected_factory)
+    assert entry.value == b'miss'
+
+
+async def test_cache_local(monkeypatch: pytest.MonkeyPatch):
+    key = buffered_rand_urlsafe(16)
+
+    async def factory() -> bytes:
+        return b'local'
+
+    await CacheService.get(key, _context, factory, local=True)
+
+    def valkey():
+        raise AssertionError('Valkey must not be used on local cache hit')
+
+    monkeypatch.setattr(cache_service, 'valkey', valkey)
+    entry = await CacheService.get(key, _context, factory, local=True)
+    assert entry.value == b'local'
+
+
+async def test_cache_factory_error():
+    key = buffered_rand_urlsafe(16)
+
+    async def factory() -> bytes:
+        raise ValueError('factory error')
+
+    with pytest.raises(ValueError, match='factory error'):
+        await CacheService.get(key, _context, factory)
+
+    async def retry_factory() -> bytes:
+        return b'retry'
+
+    entry = await CacheService.get(key, _context, retry_factory)
+    assert entry.value == b'retry'
+
+
+async def test_cache_stale_while_revalidate(monkeypatch: pytest.MonkeyPatch):
+    key = buffered_rand_urlsafe(16)
+    ttl = timedelta(minutes=1)
+    stale_ttl = timedelta(hours=1)
+
+    async def factory() -> bytes:
+        return b'old'
+
+    await CacheService.get(key, _context, factory, ttl=ttl, stale_ttl=stale_ttl)
+
+    async def refresh_factory() -> bytes:
+        return b'new'
+
+    # past the soft expiry, the stale value is served and refreshed in the background
+    time_ = cache_service.time.time
+    monkeypatch.setattr(cache_service.time, 'time', lambda: time_() + 120)
+    entry = await CacheService.get(key, _context, refresh_factory, ttl=ttl, stale_ttl=stale_ttl)
+    assert entry.value == b'old'
+    await gather(*cache_service._refresh_tasks)  # noqa: SLF001
+
+    monkeypatch.undo()
+    entry = await CacheService.get(key, _context, factory, ttl=ttl, stale_ttl=stale_ttl)
+    assert entry.value == b'new'
+
+
+async def test_cache_negative():
+    key = buffered_rand_urlsafe(16)
+    calls = 0
+
+    async def factory() -> bytes:
+        nonlocal calls
+        calls += 1
+        raise TimeoutError
+
+    for _ in range(2):
+        entry = await CacheService.get(key, _context, factory, negative_value=b'none')
+        assert entry.value == b'none'
+
+    # the failure is cached
+    assert calls == 1
+
+
+async def test_cache_negative_local():
+    key = buffered_rand_urlsafe(16)
+
+    async def factory() -> bytes:
+        raise TimeoutError
+
+    await CacheService.get(key, _context, factory, negative_value=b'none', local=True)
+
+    # the negative value is kept locally no longer than remotely
+    local_entry = cache_service._local.get(f'{_context}:{key.encode().hex()}')  # noqa: SLF001
+    assert local_entry is not None
+    assert local_entry[1] == b'none'
+    assert local_entry[0] <= cache_service.time.monotonic() + CACHE_NEGATIVE_EXPIRE.total_seconds()
@@ -0,0 +1,69 @@
+from shapely import Point
+
+from app.models.db.element import Element
+from app.models.element import ElementId, ElementRef, VersionedElementRef
+from app.queries.element_query import ElementQuery
+from app.services.optimistic_diff import OptimisticDiff
+
+
+async def test_element_cache_invalidate(changeset_id: int):
+    assigned_ref_map = await OptimisticDiff.run(
+        (
+            Element(
+                changeset_id=changeset_id,
+                type='node',
+                id=ElementId(-1),
+                version=1,
+                visible=True,
+                tags={'cached': '1'},
+                point=Point(0, 0),
+                members=[],
+            ),
+        )
+    )
+    node_id = assigned_ref_map[ElementRef('node', ElementId(-1))][0].id
+    node_ref = ElementRef('node', node_id)
+
+    # populate the cache
+    (fetched,) = await ElementQuery.get_by_refs((node_ref,), limit=1)
+    assert fetched.version == 1
+    assert fetched.sequence_id is not None
+    assert fetched.created_at is not None
+    assert fetched.next_sequence_id is None
+
+    # cache hit must return a full copy
+    fetched.tags['mutated'] = '1'
+    (cached,) = await ElementQuery.get_by_refs((node_ref,), limit=1)
+    assert cached is not fetched
+    assert cached.version == 1
+    assert cached.tags == {'cached': '1'}
+    assert cached.sequence_id == fetched.sequence_id
+    assert cached.created_at == fetched.created_at
+    assert cached.next_sequence_id is None
+
+    await OptimisticDiff.run(
+        (
+            Element(
+                changeset_id=changeset_id,
+                type='node',
+                id=node_id,
+                version=2,
+                visible=True,
+                tags={'cached': '2'},
+                point=Point(0, 0),
+                members=[],
+            ),
+        )
+    )
+
+    elements = await ElementQuery.get_by_refs((node_ref,), limit=1)
+    assert elements[0].version == 2
+    assert elements[0].tags == {'cached': '2'}
+
+    # historical version must know it was superseded
+    for _ in range(2):
+        elements = await ElementQuery.get_by_versioned_refs((VersionedElementRef('node', node_id, 1),), limit=1)
+        assert elements[0].tags == {'cached': '1'}
+        assert elements[0].sequence_id == fetched.sequence_id
+        assert elements[0].created_at == fetched.created_at
+        assert elements[0].next_sequence_id is not None
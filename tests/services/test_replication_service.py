@@ -0,0 +1,57 @@
+import gzip
+
+import pytest
+from shapely import Point
+from zstandard import ZstdDecompressor
+
+from app.lib.xmltodict import XMLToDict
+from app.models.db.element import Element
+from app.models.element import ElementId, ElementRef
+from app.models.types import StorageKey
+from app.services.optimistic_diff import OptimisticDiff
+from app.services.replication_service import ReplicationService
+from app.storage import REPLICATION_MINUTE_STORAGE
+
+
+@pytest.mark.parametrize('compression', ['gz', 'zst'])
+async def test_replication_generate(changeset_id: int, compression):
+    state = await ReplicationService.init('minute')
+
+    assigned_ref_map = await OptimisticDiff.run(
+        (
+            Element(
+                changeset_id=changeset_id,
+                type='node',
+                id=ElementId(-1),
+                version=1,
+                visible=True,
+                tags={'replication': compression},
+                point=Point(1, 2),
+                members=[],
+            ),
+        )
+    )
+    node = assigned_ref_map[ElementRef('node', ElementId(-1))][0]
+
+    new_state = await ReplicationService.generate('minute', compression=compression)
+    assert new_state is not None
+    assert new_state.sequence_number == state.sequence_number + 1
+    assert new_state.sequence_id == node.sequence_id
+    assert new_state.timestamp >= state.timestamp
+    assert await ReplicationService.get_state('minute') == new_state
+
+    data = await REPLICATION_MINUTE_STORAGE.load(StorageKey(f'{new_state.sequence_number:09d}.osc.{compression}'))
+    data = gzip.decompress(data) if compression == 'gz' else ZstdDecompressor().decompressobj().decompress(data)
+    action = XMLToDict.parse(data)['osmChange'][-1]
+    assert action[0] == 'create'
+    element_type, node_dict = action[1][0]
+    assert element_type == 'node'
+    assert node_dict['@id'] == node.id
+    assert node_dict['@version'] == 1
+    assert node_dict['@user'] == 'user1'
+
+    # no new elements, the replication still advances
+    empty_state = await ReplicationService.generate('minute', compression=compression)
+    assert empty_state is not None
+    assert empty_state.sequence_number == new_state.sequence_number + 1
+    assert empty_state.sequence_id == new_state.sequence_id
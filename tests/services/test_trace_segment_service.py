@@ -0,0 +1,19 @@
+from datetime import UTC, datetime
+
+from shapely import MultiPoint, set_srid, to_wkb
+
+from app.services.trace_segment_service import _encode_rows
+
+
+def test_encode_rows_ewkb():
+    capture_times = [datetime(2024, 1, 1, tzinfo=UTC), None]
+    rows = [
+        (1, 0, 0, MultiPoint([(1, 2), (3.5, -4)]), capture_times, [1.5, None]),
+        (1, 0, 1, MultiPoint([(5, 6)]), None, None),
+    ]
+    encoded = list(_encode_rows(rows))
+    assert [row[:3] for row in encoded] == [(1, 0, 0), (1, 0, 1)]
+    assert [row[4:6] for row in encoded] == [(capture_times, [1.5, None]), (None, None)]
+    assert encoded[0][6] != encoded[1][6]
+    for row, (_, _, _, points, _, _) in zip(encoded, rows, strict=True):
+        assert row[3] == to_wkb(set_srid(points, 4326), include_srid=True, byte_order=1)
@@ -0,0 +1,20 @@
+import pytest
+
+from app.services import trace_service
+
+
+async def test_process_task_rerun(monkeypatch: pytest.MonkeyPatch):
+    calls = 0
+
+    async def claim_pending_trace() -> None:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            # an upload is committed while the claim query is running
+            await trace_service._process_task()  # noqa: SLF001
+
+    monkeypatch.setattr(trace_service, '_claim_pending_trace', claim_pending_trace)
+    await trace_service._process_task()  # noqa: SLF001
+
+    # the running task picked up the request instead of finishing
+    assert calls == 2